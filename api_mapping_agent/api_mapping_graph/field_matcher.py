@@ -0,0 +1,497 @@
+"""Deterministic pre-matching of customer schema fields to AEB screening fields.
+
+Large ERP schemas contain thousands of fields, of which only the names, addresses,
+identifiers and references matter for the mapping. Instead of sending the whole schema
+to the LLM, `prematch_schema` parses it (JSON Schema, OpenAPI, JSON or YAML examples,
+XSD or XML, CSV headers), scores every field against the AEB target fields of
+screenAddresses with normalized tokens, synonyms and edit distance, and renders only
+a candidate table plus the objects ("subtrees") the candidates live in.
+
+The LLM still makes the final decision; the matcher only shrinks what it has to read.
+"""
+
+import csv
+import io
+import json
+import re
+import xml.etree.ElementTree as ET
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class SchemaField(NamedTuple):
+    """A leaf field of the customer schema, e.g. path "customer.addresses[].city"."""
+    path: str
+    name: str
+    type: str = ""
+    description: str = ""
+
+    @property
+    def parent(self) -> str:
+        return self.path.rsplit(".", 1)[0] if "." in self.path else ""
+
+
+class FieldCandidate(NamedTuple):
+    field: SchemaField
+    score: float
+    reason: str
+
+
+class TargetMatch(NamedTuple):
+    target: str
+    candidates: List[FieldCandidate]
+
+
+# AEB target fields of screenAddresses and customer field names that usually hold them
+# (English, German and common SAP names). Identifier types are listed as ids[<idType>].
+TARGET_SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    "addressType": ("address type", "partner type", "customer type", "entity type", "party type",
+                    "is company", "is person", "kind of partner", "partnerart"),
+    "name": ("name", "full name", "company name", "business name", "partner name",
+             "customer name", "vendor name", "supplier name", "organisation name",
+             "organization name", "firma", "firmenname"),
+    "name1": ("name1", "name 1", "name line 1", "company name 1"),
+    "name2": ("name2", "name 2", "name line 2", "company name 2"),
+    "name3": ("name3", "name 3", "name line 3", "company name 3"),
+    "name4": ("name4", "name 4", "name line 4", "company name 4"),
+    "title": ("title", "salutation", "form of address", "anrede", "anred"),
+    "surname": ("surname", "last name", "family name", "nachname", "name last"),
+    "prenames": ("prenames", "first name", "given name", "forename", "vorname", "name first"),
+    "dateOfBirth": ("date of birth", "birth date", "birthday", "dob", "geburtsdatum", "gbdat"),
+    "cityOfBirth": ("city of birth", "place of birth", "birth place", "geburtsort", "gbort"),
+    "countryOfBirthISO": ("country of birth", "birth country", "geburtsland"),
+    "nationalityISO": ("nationality", "citizenship", "staatsangehoerigkeit", "natio"),
+    "passportData": ("passport", "passport data"),
+    "position": ("position", "job title", "function", "role"),
+    "street": ("street", "street address", "street name", "address line 1", "address1", "addr1",
+               "strasse", "stras", "street no", "house number", "hausnummer"),
+    "pc": ("pc", "postal code", "post code", "postcode", "zip", "zip code", "plz", "postleitzahl",
+           "pstlz"),
+    "city": ("city", "town", "locality", "ort", "ort01", "stadt"),
+    "district": ("district", "suburb", "city district", "ortsteil", "ort02"),
+    "countryISO": ("country", "country iso", "country code", "land", "land1", "nation",
+                   "country key"),
+    "postbox": ("postbox", "po box", "post box", "pobox", "postfach", "pfach"),
+    "pcPostbox": ("pc postbox", "po box postal code", "postbox zip", "pstl2"),
+    "cityPostbox": ("city postbox", "po box city", "pfort"),
+    "telNo": ("telephone", "phone", "tel no", "phone number", "telefon", "telf1", "mobile"),
+    "fax": ("fax", "fax number", "telfx"),
+    "email": ("email", "e mail", "mail", "email address", "smtp addr"),
+    "ids[TAX_NO]": ("tax number", "tax no", "tax id", "vat", "vat id", "vat number", "ust id",
+                    "steuernummer", "stcd1", "stceg"),
+    "ids[DUNS_NO]": ("duns", "duns number", "duns no"),
+    "ids[BIC]": ("bic", "swift", "swift code", "swift bic"),
+    "ids[PASSPORT_NO]": ("passport number", "passport no", "reisepassnummer"),
+    "ids[IMO_NO]": ("imo", "imo number", "imo no", "vessel id"),
+    "ids[DOMAIN_NAME]": ("website", "web site", "homepage", "url", "domain", "www"),
+    "referenceId": ("id", "guid", "uuid", "unique id", "internal id", "partner id", "customer id",
+                    "vendor id", "supplier id", "object id", "kunnr", "lifnr"),
+    "referenceComment": ("number", "reference", "reference number", "customer number",
+                         "vendor number", "partner number", "order number", "document number",
+                         "delivery number", "shipment number", "kundennummer", "lieferantennummer",
+                         "belegnummer", "vbeln", "ebeln"),
+}
+
+# Parent objects whose fields are more likely to be screening relevant
+_CONTEXT_TOKENS = frozenset({
+    "address", "addresses", "partner", "party", "customer", "vendor", "supplier", "contact",
+    "person", "company", "organisation", "organization", "ship", "bill", "sold", "consignee",
+    "shipper", "recipient", "adresse", "kunde", "lieferant",
+})
+_NOISE_TOKENS = frozenset({"txt", "text", "value", "val", "fld", "field", "str"})
+_CONTEXT_BONUS = 0.05
+
+
+def _tokens(name: str) -> Tuple[str, ...]:
+    """Lower-case word tokens of an identifier: camelCase, snake_case, digits, umlauts."""
+    name = (name.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue")
+            .replace("Ä", "Ae").replace("Ö", "Oe").replace("Ü", "Ue").replace("ß", "ss"))
+    name = re.sub(r"([a-z])([A-Z])", r"\1 \2", name)
+    name = re.sub(r"([A-Z]+)([A-Z][a-z])", r"\1 \2", name)
+    parts = re.findall(r"[a-z]+|\d+", name.lower())
+    return tuple(p for p in parts if p not in _NOISE_TOKENS)
+
+
+def edit_distance(a: str, b: str, limit: Optional[int] = None) -> int:
+    """Levenshtein distance of two strings.
+
+    With `limit`, only a band of the matrix is computed and any distance above the
+    limit is returned as limit + 1, which keeps mass comparisons cheap.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is None:
+        limit = len(a)
+    if len(a) - len(b) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        current = [i if i <= limit else over] + [over] * len(b)
+        for j in range(lo, hi + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (ca != b[j - 1]))
+        if min(current) > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+def _bigrams(text: str) -> Counter:
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+
+class _SynonymIndex:
+    """Finds the synonyms worth scoring for a field name without trying all of them.
+
+    Token matches need a shared word; edit distance matches within k edits share at
+    least max(len) - 1 - 2k bigrams (q-gram lemma), so other synonyms are skipped.
+    """
+
+    def __init__(self, synonyms: Dict[str, Tuple[str, ...]]):
+        self.entries: List[Tuple[str, Tuple[str, ...], str]] = []
+        self.by_token: Dict[str, List[int]] = {}
+        self.by_bigram: Dict[str, List[Tuple[int, int]]] = {}
+        for target, names in synonyms.items():
+            for name in names:
+                tokens = _tokens(name)
+                joined = "".join(tokens)
+                i = len(self.entries)
+                self.entries.append((target, tokens, joined))
+                for token in set(tokens):
+                    self.by_token.setdefault(token, []).append(i)
+                for bigram, count in _bigrams(joined).items():
+                    self.by_bigram.setdefault(bigram, []).append((i, count))
+
+    def candidates(self, tokens: Tuple[str, ...]) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+        joined = "".join(tokens)
+        found = {i for token in set(tokens) for i in self.by_token.get(token, ())}
+        shared: Counter = Counter()
+        for bigram, count in _bigrams(joined).items():
+            for i, synonym_count in self.by_bigram.get(bigram, ()):
+                shared[i] += min(count, synonym_count)
+        for i, common in shared.items():
+            longest = max(len(joined), len(self.entries[i][2]))
+            if common >= longest - 1 - 2 * (longest // 4):
+                found.add(i)
+        for i in sorted(found):
+            yield self.entries[i][0], self.entries[i][1]
+
+
+_SYNONYM_INDEX = _SynonymIndex(TARGET_SYNONYMS)
+
+
+def _synonym_score(field_tokens: Tuple[str, ...], synonym: Tuple[str, ...]) -> Tuple[float, str]:
+    field_joined, synonym_joined = "".join(field_tokens), "".join(synonym)
+    if field_joined == synonym_joined:
+        return 1.0, "exact"
+    # Numbered fields only match their own number: NAME2 is never name1, ORT01 never ort02
+    synonym_digits = [t for t in synonym if t.isdigit()]
+    if synonym_digits and synonym_digits != [t for t in field_tokens if t.isdigit()]:
+        return 0.0, ""
+    score, reason = 0.0, ""
+    # All synonym words present, scored by how much of the field name they explain
+    if set(synonym) <= set(field_tokens):
+        score, reason = 0.7 + 0.2 * len(synonym) / len(field_tokens), "tokens"
+    # Abbreviations and spelling variants; the length check skips hopeless pairs cheaply
+    longest = max(len(field_joined), len(synonym_joined))
+    if longest >= 4 and score < 0.9:
+        distance = edit_distance(field_joined, synonym_joined, limit=longest // 4)
+        similarity = 1 - distance / longest
+        if similarity >= 0.75 and similarity * 0.9 > score:
+            score, reason = similarity * 0.9, "edit distance"
+    return score, reason
+
+
+@lru_cache(maxsize=16384)
+def _name_scores(name: str) -> Tuple[Tuple[str, float, str], ...]:
+    """(target, score, reason) of a field name for every target it resembles."""
+    field_tokens = _tokens(name)
+    if not field_tokens:
+        return ()
+    best: Dict[str, Tuple[float, str]] = {}
+    for target, synonym in _SYNONYM_INDEX.candidates(field_tokens):
+        score, reason = _synonym_score(field_tokens, synonym)
+        if score > best.get(target, (0.0, ""))[0]:
+            best[target] = (score, reason)
+    return tuple((target, score, reason) for target, (score, reason) in best.items())
+
+
+def match_fields(fields: Sequence[SchemaField], min_score: float = 0.6,
+                 top_k: int = 5) -> List[TargetMatch]:
+    """Best `top_k` candidates per AEB target field, in TARGET_SYNONYMS order.
+
+    Field names are scored once per distinct name, so schemas that repeat the same
+    address block under many parents cost little more than one block.
+    """
+    candidates: Dict[str, List[FieldCandidate]] = {t: [] for t in TARGET_SYNONYMS}
+    for field in fields:
+        context = set(_tokens(field.parent.replace("[]", "")))
+        bonus = _CONTEXT_BONUS if context & _CONTEXT_TOKENS else 0.0
+        for target, score, reason in _name_scores(field.name):
+            score = min(1.0, score + bonus)
+            if score >= min_score:
+                candidates[target].append(FieldCandidate(field, round(score, 2), reason))
+    return [TargetMatch(target, sorted(found, key=lambda c: (-c.score, c.field.path))[:top_k])
+            for target, found in candidates.items() if found]
+
+
+def render_candidate_table(matches: Sequence[TargetMatch]) -> str:
+    lines = ["| AEB field | Customer field candidates (score, match) |", "|---|---|"]
+    for match in matches:
+        cells = "<br>".join(f"`{c.field.path}` ({c.score:.2f}, {c.reason})" for c in match.candidates)
+        lines.append(f"| {match.target} | {cells} |")
+    return "\n".join(lines)
+
+
+def render_fields(fields: Sequence[SchemaField], max_fields: int = 400) -> str:
+    """Fields grouped by object path, at most `max_fields` of them."""
+    by_parent: Dict[str, List[SchemaField]] = {}
+    for field in fields:
+        by_parent.setdefault(field.parent, []).append(field)
+    lines, shown = [], 0
+    for parent in sorted(by_parent):
+        lines.append(f"{parent or '(root)'}:")
+        for field in by_parent[parent]:
+            if shown >= max_fields:
+                lines.append(f"... ({len(fields) - shown} more fields omitted)")
+                return "\n".join(lines)
+            details = ", ".join(x for x in (field.type, field.description[:120]) if x)
+            lines.append(f"  - {field.name}" + (f" ({details})" if details else ""))
+            shown += 1
+    return "\n".join(lines)
+
+
+def render_subtrees(fields: Sequence[SchemaField], matches: Sequence[TargetMatch],
+                    max_fields: int = 400) -> str:
+    """All fields of the objects that contain a candidate, grouped by object path."""
+    parents = {c.field.parent for m in matches for c in m.candidates}
+    return render_fields([f for f in fields if f.parent in parents], max_fields)
+
+
+# --- Schema parsing ---------------------------------------------------------------
+
+def _join(path: str, name: str) -> str:
+    return f"{path}.{name}" if path else name
+
+
+class _JsonSchemaWalker:
+    """Leaf fields of JSON Schema / OpenAPI documents, following local $refs."""
+
+    def __init__(self, root: Dict[str, Any]):
+        self.root = root
+        self.fields: List[SchemaField] = []
+
+    def _resolve(self, ref: str) -> Optional[Dict[str, Any]]:
+        if not ref.startswith("#/"):
+            return None
+        node: Any = self.root
+        for part in ref[2:].split("/"):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node if isinstance(node, dict) else None
+
+    def walk(self, schema: Any, path: str, name: str, refs: Tuple[str, ...] = ()) -> None:
+        if not isinstance(schema, dict):
+            return
+        ref = schema.get("$ref")
+        if isinstance(ref, str):
+            if ref in refs:  # recursive structure
+                return
+            resolved = self._resolve(ref)
+            if resolved is not None:
+                self.walk(resolved, path, name, refs + (ref,))
+            return
+        nested = False
+        for key in ("allOf", "anyOf", "oneOf"):
+            for part in schema.get(key) or []:
+                nested = True
+                self.walk(part, path, name, refs)
+        properties = schema.get("properties")
+        if isinstance(properties, dict):
+            for child, sub in properties.items():
+                self.walk(sub, _join(path, child), child, refs)
+            return
+        items = schema.get("items")
+        if isinstance(items, dict) and (items.get("properties") or items.get("$ref") or
+                                        any(k in items for k in ("allOf", "anyOf", "oneOf"))):
+            self.walk(items, path + "[]", name, refs)
+            return
+        if not nested and name:
+            type_ = schema.get("type", "")
+            if isinstance(type_, list):
+                type_ = "|".join(map(str, type_))
+            self.fields.append(SchemaField(path, name, str(type_), str(schema.get("description", ""))))
+
+
+def _is_json_schema(data: Dict[str, Any]) -> bool:
+    return any(k in data for k in ("openapi", "swagger", "$schema", "components", "definitions")) or (
+        isinstance(data.get("properties"), dict) and data.get("type") in (None, "object"))
+
+
+def _schema_fields(data: Dict[str, Any]) -> List[SchemaField]:
+    walker = _JsonSchemaWalker(data)
+    named = {**(data.get("definitions") or {}), **((data.get("components") or {}).get("schemas") or {})}
+    for schema_name, schema in named.items():
+        walker.walk(schema, schema_name, schema_name)
+    if "properties" in data:
+        walker.walk(data, "", "")
+    return walker.fields
+
+
+def _example_fields(data: Any, path: str = "", name: str = "") -> Iterator[SchemaField]:
+    """Leaf fields of a JSON/YAML example document; array items are merged."""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _example_fields(value, _join(path, str(key)), str(key))
+    elif isinstance(data, list):
+        seen = set()
+        for item in data[:20]:
+            for field in _example_fields(item, path + "[]", name):
+                if field.path not in seen:
+                    seen.add(field.path)
+                    yield field
+    elif name:
+        yield SchemaField(path, name, type(data).__name__ if data is not None else "null")
+
+
+def _structured_fields(data: Any) -> List[SchemaField]:
+    if isinstance(data, dict) and _is_json_schema(data):
+        return _schema_fields(data)
+    return list(_example_fields(data))
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
+
+
+def _xsd_fields(root: ET.Element) -> List[SchemaField]:
+    complex_types = {el.get("name"): el for el in root if _local(el.tag) == "complexType" and el.get("name")}
+    fields: List[SchemaField] = []
+
+    def walk(node: ET.Element, path: str, types: Tuple[str, ...]) -> None:
+        for child in node:
+            kind = _local(child.tag)
+            if kind == "element" and child.get("name"):
+                name = child.get("name")
+                type_ = (child.get("type") or "").split(":")[-1]
+                child_path = _join(path, name)
+                if child.get("maxOccurs") not in (None, "1"):
+                    child_path += "[]"
+                if type_ in complex_types and type_ not in types:
+                    walk(complex_types[type_], child_path, types + (type_,))
+                elif any(_local(c.tag) == "complexType" for c in child):
+                    walk(child, child_path, types)
+                else:
+                    fields.append(SchemaField(child_path, name, type_, _xsd_doc(child)))
+            elif kind == "attribute" and child.get("name"):
+                name = child.get("name")
+                fields.append(SchemaField(_join(path, "@" + name), name,
+                                          (child.get("type") or "").split(":")[-1], _xsd_doc(child)))
+            elif kind in ("complexType", "sequence", "all", "choice", "complexContent",
+                          "simpleContent", "extension", "group"):
+                base = (child.get("base") or "").split(":")[-1]
+                if base in complex_types and base not in types:
+                    walk(complex_types[base], path, types + (base,))
+                walk(child, path, types)
+
+    for el in root:
+        if _local(el.tag) == "element" and el.get("name"):
+            wrapper = ET.Element("sequence")
+            wrapper.append(el)
+            walk(wrapper, "", ())
+    return fields
+
+
+def _xsd_doc(el: ET.Element) -> str:
+    for node in el.iter():
+        if _local(node.tag) == "documentation" and node.text:
+            return node.text.strip()
+    return ""
+
+
+def _xml_instance_fields(root: ET.Element) -> List[SchemaField]:
+    fields: Dict[str, SchemaField] = {}
+
+    def walk(el: ET.Element, path: str) -> None:
+        for attr in el.attrib:
+            name = _local(attr)
+            fields.setdefault(_join(path, "@" + name), SchemaField(_join(path, "@" + name), name, "attribute"))
+        children = list(el)
+        if not children:
+            name = _local(el.tag)
+            fields.setdefault(path, SchemaField(path, name, "element"))
+        for child in children:
+            walk(child, _join(path, _local(child.tag)))
+
+    walk(root, _local(root.tag))
+    return list(fields.values())
+
+
+def _csv_fields(text: str) -> List[SchemaField]:
+    lines = text.splitlines()
+    header = lines[0] if lines else ""
+    try:
+        dialect = csv.Sniffer().sniff("\n".join(lines[:5]), delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    row = next(csv.reader(io.StringIO(header), dialect), [])
+    return [SchemaField(name.strip(), name.strip(), "column") for name in row if name.strip()]
+
+
+def _load_yaml(text: str) -> Any:
+    try:
+        import yaml
+    except ImportError:
+        return None
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError:
+        return None
+
+
+def parse_schema_fields(text: str, filename: str = "") -> List[SchemaField]:
+    """Leaf fields of a customer API document; empty if the format is not recognized."""
+    suffix = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    stripped = text.lstrip()
+    if suffix in ("xml", "xsd", "wsdl") or stripped.startswith("<"):
+        try:
+            root = ET.fromstring(stripped)
+        except ET.ParseError:
+            return []
+        return _xsd_fields(root) if _local(root.tag) == "schema" else _xml_instance_fields(root)
+    if suffix == "json" or stripped[:1] in ("{", "["):
+        try:
+            return _structured_fields(json.loads(stripped))
+        except json.JSONDecodeError:
+            return []
+    if suffix in ("yaml", "yml"):
+        data = _load_yaml(text)
+        return _structured_fields(data) if isinstance(data, (dict, list)) else []
+    if suffix == "csv" or (stripped and any(d in stripped.split("\n", 1)[0] for d in ",;\t|")):
+        return _csv_fields(stripped)
+    data = _load_yaml(text)
+    return _structured_fields(data) if isinstance(data, (dict, list)) else []
+
+
+def prematch_fields(fields: Sequence[SchemaField], min_score: float = 0.6,
+                    top_k: int = 5, max_fields: int = 400) -> Optional[str]:
+    """Candidate table and relevant subtrees of parsed schema fields, or None if nothing matched."""
+    matches = match_fields(fields, min_score=min_score, top_k=top_k)
+    if not matches:
+        return None
+    return (f"Customer schema: {len(fields)} fields, "
+            f"{sum(len(m.candidates) for m in matches)} candidates for {len(matches)} AEB fields.\n\n"
+            f"Candidate table (deterministic pre-match, verify before use):\n\n"
+            f"{render_candidate_table(matches)}\n\n"
+            f"Objects containing candidates (all their fields):\n\n"
+            f"{render_subtrees(fields, matches, max_fields)}")
+
+
+def prematch_schema(text: str, filename: str = "", min_score: float = 0.6,
+                    top_k: int = 5, max_fields: int = 400) -> Optional[str]:
+    """Candidate table and relevant subtrees of a customer schema, or None if nothing matched."""
+    return prematch_fields(parse_schema_fields(text, filename), min_score, top_k, max_fields)
@@ -3,6 +3,15 @@ from langgraph.graph import StateGraph, START, END
 from api_mapping_agent.api_mapping_graph.decision_interrupt_node import decision_interrupt_node, route_from_decision_interrupt
 from api_mapping_agent.api_mapping_graph.nodes import (
     NodeNames,
+    aintro_node,
+    aask_endpoints_node,
+    aask_client_node,
+    aask_wsm_node,
+    aask_general_info_node,
+    aask_screening_variants_node,
+    aask_responses_node,
+    aprocess_and_map_api_node,
+    aqa_mode_node,
     api_mapping_intro_node,
     ask_endpoints_node,
     explain_responses_node,
@@ -29,28 +38,39 @@ from api_mapping_agent.api_mapping_graph.nodes import (
 from api_mapping_agent.api_mapping_graph.state import ApiMappingState
 
 
-def build_graph():
-    """Build the graph with conditional edges and persistence."""
+def build_graph(use_async: bool = False):
+    """Build the graph with conditional edges and persistence.
+
+    With `use_async` the LLM calling nodes are coroutines (`ainvoke`, vector store
+    I/O in worker threads). Such a graph can only be run with `ainvoke`/`astream`,
+    which is what the LangGraph server does.
+    """
     # checkpointer = InMemorySaver() # TODO: Don't need this with Langgraph API
 
     g = StateGraph(ApiMappingState)
 
-    g.add_node(NodeNames.INTRO, intro_node)
-    g.add_node(NodeNames.ASK_ENDPOINTS, ask_endpoints_node)
-    g.add_node(NodeNames.ASK_CLIENT, ask_client_node)
-    g.add_node(NodeNames.ASK_WSM, ask_wsm_node)
-    g.add_node(NodeNames.ASK_GENERAL_INFO, ask_general_info_node)
+    g.add_node(NodeNames.INTRO, aintro_node if use_async else intro_node)
+    g.add_node(NodeNames.ASK_ENDPOINTS,
+               aask_endpoints_node if use_async else ask_endpoints_node)
+    g.add_node(NodeNames.ASK_CLIENT,
+               aask_client_node if use_async else ask_client_node)
+    g.add_node(NodeNames.ASK_WSM, aask_wsm_node if use_async else ask_wsm_node)
+    g.add_node(NodeNames.ASK_GENERAL_INFO,
+               aask_general_info_node if use_async else ask_general_info_node)
     g.add_node(NodeNames.GENERAL_SCREENING_INFO, general_screening_info_node)
-    g.add_node(NodeNames.ASK_SCREENING_VARIANTS, ask_screening_variants_node)
+    g.add_node(NodeNames.ASK_SCREENING_VARIANTS,
+               aask_screening_variants_node if use_async else ask_screening_variants_node)
     g.add_node(NodeNames.EXPLAIN_SCREENING_VARIANTS,
                explain_screening_variants_node)
-    g.add_node(NodeNames.ASK_RESPONSES, ask_responses_node)
+    g.add_node(NodeNames.ASK_RESPONSES,
+               aask_responses_node if use_async else ask_responses_node)
     g.add_node(NodeNames.EXPLAIN_RESPONSES, explain_responses_node)
     g.add_node(NodeNames.API_MAPPING_INTRO, api_mapping_intro_node)
     g.add_node(NodeNames.DECISION_INTERRUPT, decision_interrupt_node)
     g.add_node(NodeNames.GET_API_DATA_INTERRUPT, get_api_data_interrupt_node)
-    g.add_node(NodeNames.PROCESS_AND_MAP_API, process_and_map_api_node)
-    g.add_node(NodeNames.QA_MODE, qa_mode_node)
+    g.add_node(NodeNames.PROCESS_AND_MAP_API,
+               aprocess_and_map_api_node if use_async else process_and_map_api_node)
+    g.add_node(NodeNames.QA_MODE, aqa_mode_node if use_async else qa_mode_node)
 
     g.add_edge(START, NodeNames.INTRO)
 
@@ -121,3 +141,5 @@ def build_graph():
 
 
 api_mapping_graph = build_graph()
+# Registered with the LangGraph server, see langgraph.json
+api_mapping_graph_async = build_graph(use_async=True)
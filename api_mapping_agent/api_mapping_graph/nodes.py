@@ -4,15 +4,24 @@ from langgraph.types import interrupt
 from langgraph.graph.message import add_messages
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 from enum import Enum
+from typing import Any, Callable, List, Optional, Tuple
+from pathlib import Path
+import asyncio
+import re
 from api_mapping_agent.utils import (URL_RE, parse_client_ident, parse_endpoints,
                                      parse_wsm_user, parse_yes_no, has_endpoint_information,
                                      get_last_user_message, get_latest_user_message, get_last_assistant_message, format_endpoints_message)
-from api_mapping_agent.llm import get_llm
+from api_mapping_agent.llm import ainvoke_routed, get_llm, invoke_routed
 from api_mapping_agent.config import Config
-from api_mapping_agent.rag import rag_search, build_index, ensure_index_built, debug_vectorstore_contents, debug_knowledge_base_files, build_index_fresh
-from .utils import get_screen_addresses_spec, get_general_information_about_screening_api, get_api_examples
+from api_mapping_agent.rag import rag_search, rag_multi_search, build_index, ensure_index_built, debug_vectorstore_contents, debug_knowledge_base_files
+from api_mapping_agent.history import HistoryWindow, window_history
+from api_mapping_agent.tokens import count_tokens, count_message_tokens
+from api_mapping_agent.schema_ingest import SchemaParseError, ensure_catalog
+from api_mapping_agent import upload_store
+from .field_matcher import prematch_fields, prematch_schema, render_fields
+from .prompts import static_system_message, static_prefix_tokens, check_context_budget, prompt_budget, log_prompt_cache_usage
 
 
 class NodeNames(str, Enum):
@@ -33,20 +42,143 @@ class NodeNames(str, Enum):
     QA_MODE = "qa_mode"
 
 
-llm = get_llm()
+# Models of the mapping call and of the Q&A about its result (see Config.LLM_ROUTE_MODELS)
+mapping_llm = get_llm("mapping")
+mapping_qa_llm = get_llm("mapping_qa")
+
+# System prompts for side questions asked during the guided steps
+_QUESTION_SYSTEM_PROMPT = (
+    "You are an AEB Trade Compliance API expert. "
+    "Answer questions about the TCM Screening API precisely and helpfully in English. "
+    "ALWAYS use the available documentation excerpts."
+    "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
+)
+_WSM_QUESTION_SYSTEM_PROMPT = (
+    "You are an AEB Trade Compliance API expert. "
+    "Answer questions about the TCM Screening API precisely and helpfully in English. "
+    "ALWAYS use the available documentation excerpts."
+)
+_GENERAL_INFO_QUESTION_SYSTEM_PROMPT = (
+    "You are an AEB Trade Compliance API expert. "
+    "Answer questions about the TCM Screening API precisely and helpfully in English. "
+    "ALWAYS use the available documentation excerpts and configuration data. "
+    "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
+    "If documentation is available, base your answer on it and not on general knowledge."
+)
+_STEP_QUESTION_SYSTEM_PROMPT = (
+    "You are an AEB Trade Compliance API expert. "
+    "Answer questions about the TCM Screening API precisely and helpfully in English. "
+    "ALWAYS use the available documentation excerpts and configuration data. "
+    "If documentation is available, base your answer on it and not on general knowledge."
+    "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
+)
+
+
+def _payload_question(payload: Any) -> str:
+    if isinstance(payload, dict) and payload.get("question"):
+        return str(payload["question"]).strip()
+    return ""
+
+
+def _step_context(prov: dict) -> str:
+    context_info = []
+    if prov.get("test_endpoint"):
+        context_info.append(
+            f"Test-Endpoint: {prov.get('test_endpoint', 'N/A')}")
+    if prov.get("prod_endpoint"):
+        context_info.append(
+            f"Prod-Endpoint: {prov.get('prod_endpoint', 'N/A')}")
+    if prov.get("clientIdentCode"):
+        context_info.append(
+            f"Mandant (clientIdentCode): {prov.get('clientIdentCode', 'N/A')}")
+    if "wsm_user_configured" in prov:
+        wsm_status = "Yes" if prov["wsm_user_configured"] else "No"
+        context_info.append(f"WSM-User: {wsm_status}")
+
+    return "\n".join(
+        context_info) if context_info else "No configuration data available."
+
+
+def _question_prompt(question: str, system_prompt: str, prov: Optional[dict] = None) -> List[BaseMessage]:
+    """Prompt for a side question, with RAG snippets and, if `prov` is given, the configuration so far."""
+    # Use RAG for answering
+    Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
+    Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(parents=True, exist_ok=True)
+    ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(),
+                       Config.KNOWLEDGE_BASE_VECTOR_STORE)
+
+    snippets = rag_search(
+        f"Question about Screening API: {question}", k=5)
+    snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
+        snippets)]) if snippets else '[No relevant documentation excerpts found]'
+
+    if prov is None:
+        human = HumanMessage(
+            content=f"User question: {question}\n\nDocumentation:\n{snippets_text}")
+    else:
+        human = HumanMessage(content=f"""
+User question: {question}
+
+Available configuration:
+{_step_context(prov)}
+
+Available documentation excerpts:
+{snippets_text}
+
+Answer the question based on the available information.
+IMPORTANT: Use the documentation excerpts as the primary source and use the correct API structure from the documentation.
+""")
+    return [SystemMessage(content=system_prompt), human]
+
+
+def _run_step(state: ApiMappingState, request: dict, system_prompt: str,
+              update: Callable[..., dict], with_config: bool = False) -> dict:
+    """Show a guided step's interrupt and answer a side question asked there, if any.
+    Side questions are routed to the fast "side_question" model."""
+    payload = interrupt(request)
+    question = _payload_question(payload)
+    answer = None
+    if question:
+        prov = state.get("provisioning", {}) if with_config else None
+        resp = invoke_routed("side_question", _question_prompt(question, system_prompt, prov))
+        answer = [HumanMessage(content=question), resp]
+    return update(state, payload, answer)
+
+
+async def _arun_step(state: ApiMappingState, request: dict, system_prompt: str,
+                     update: Callable[..., dict], with_config: bool = False) -> dict:
+    """Async `_run_step`: RAG runs in a worker thread, the LLM call on the event loop."""
+    payload = interrupt(request)
+    question = _payload_question(payload)
+    answer = None
+    if question:
+        prov = state.get("provisioning", {}) if with_config else None
+        prompt = await asyncio.to_thread(_question_prompt, question, system_prompt, prov)
+        resp = await ainvoke_routed("side_question", prompt)
+        answer = [HumanMessage(content=question), resp]
+    return update(state, payload, answer)
+
+
+_INTRO_REQUEST = {
+    "type": "start_or_question",
+    "title": "Welcome",
+    "prompt": "Press 'Start' to begin the integration process.",
+}
 
 
 def intro_node(state: ApiMappingState) -> dict:
+    if state.get("completed"):
+        return {"messages": []}  # No-op if already completed
+    return _run_step(state, _INTRO_REQUEST, _QUESTION_SYSTEM_PROMPT, _intro_update)
+
 
+async def aintro_node(state: ApiMappingState) -> dict:
     if state.get("completed"):
         return {"messages": []}  # No-op if already completed
+    return await _arun_step(state, _INTRO_REQUEST, _QUESTION_SYSTEM_PROMPT, _intro_update)
 
-    payload = interrupt({
-        "type": "start_or_question",
-        "title": "Welcome",
-        "prompt": "Press 'Start' to begin the integration process.",
-    })
 
+def _intro_update(state: ApiMappingState, payload: Any, answer: Optional[List[BaseMessage]]) -> dict:
     skip_intro = False
     messages_to_add = []
 
@@ -55,34 +187,8 @@ def intro_node(state: ApiMappingState) -> dict:
         if payload.get("decision") == "start" or payload.get("start") is True or str(payload.get("start", "")).lower() in {"true", "1", "yes", "start"}:
             skip_intro = True
 
-        elif "question" in payload:
-            question = str(payload["question"]).strip()
-
-            # Use RAG for answering
-            Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
-            Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(
-                parents=True, exist_ok=True)
-            ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(
-            ), Config.KNOWLEDGE_BASE_VECTOR_STORE)
-
-            snippets = rag_search(
-                f"Question about Screening API: {question}", k=5)
-            snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
-                snippets)]) if snippets else '[No relevant documentation excerpts found]'
-
-            sys = SystemMessage(content=(
-                "You are an AEB Trade Compliance API expert. "
-                "Answer questions about the TCM Screening API precisely and helpfully in English. "
-                "ALWAYS use the available documentation excerpts."
-                "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
-            ))
-
-            human = HumanMessage(
-                content=f"User question: {question}\n\nDocumentation:\n{snippets_text}")
-            resp = llm.invoke([sys, human])
-
-            messages_to_add.append(HumanMessage(content=question))
-            messages_to_add.append(resp)
+        elif answer is not None:
+            messages_to_add.extend(answer)
             # Loop back to ask again
             skip_intro = False
 
@@ -102,15 +208,23 @@ def route_from_intro(state: ApiMappingState) -> str:
         return NodeNames.ASK_ENDPOINTS
 
 
+_ASK_ENDPOINTS_REQUEST = {
+    "type": "ask_endpoints",
+    "title": "Step 1: Endpoints for AEB RZ",
+    "prompt": "We start with step 1. To establish an API connection to Trade Compliance Management, you will need the **endpoints for the test and production environments** from your AEB contact person. Please log in to [AEB Home](https://my.aeb.com/home/) and open the Trade Compliance Management tile in the \"My products\" and \"My test systems\" section. The URLs will be displayed in your browser. **Please enter these in the input mask to proceed to the next step.**\n\nIf you don't know the endpoint right now, you can skip that step and we continue with default settings."
+}
+
+
 def ask_endpoints_node(state: ApiMappingState) -> dict:
-    prov = state.get("provisioning", {})
+    return _run_step(state, _ASK_ENDPOINTS_REQUEST, _QUESTION_SYSTEM_PROMPT, _ask_endpoints_update)
 
-    # Use interrupt to allow skip/question
-    payload = interrupt({
-        "type": "ask_endpoints",
-        "title": "Step 1: Endpoints for AEB RZ",
-        "prompt": "We start with step 1. To establish an API connection to Trade Compliance Management, you will need the **endpoints for the test and production environments** from your AEB contact person. Please log in to [AEB Home](https://my.aeb.com/home/) and open the Trade Compliance Management tile in the \"My products\" and \"My test systems\" section. The URLs will be displayed in your browser. **Please enter these in the input mask to proceed to the next step.**\n\nIf you don't know the endpoint right now, you can skip that step and we continue with default settings."
-    })
+
+async def aask_endpoints_node(state: ApiMappingState) -> dict:
+    return await _arun_step(state, _ASK_ENDPOINTS_REQUEST, _QUESTION_SYSTEM_PROMPT, _ask_endpoints_update)
+
+
+def _ask_endpoints_update(state: ApiMappingState, payload: Any, answer: Optional[List[BaseMessage]]) -> dict:
+    prov = state.get("provisioning", {})
 
     # None means proceed with data, True means use default, False means loop
     skip_endpoints = False
@@ -118,34 +232,8 @@ def ask_endpoints_node(state: ApiMappingState) -> dict:
 
     if isinstance(payload, dict):
         # Check if user asked a question
-        if "question" in payload and payload["question"]:
-            question = str(payload["question"]).strip()
-
-            # Use RAG for answering
-            Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
-            Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(
-                parents=True, exist_ok=True)
-            ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(
-            ), Config.KNOWLEDGE_BASE_VECTOR_STORE)
-
-            snippets = rag_search(
-                f"Question about Screening API: {question}", k=5)
-            snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
-                snippets)]) if snippets else '[No relevant documentation excerpts found]'
-
-            sys = SystemMessage(content=(
-                "You are an AEB Trade Compliance API expert. "
-                "Answer questions about the TCM Screening API precisely and helpfully in English. "
-                "ALWAYS use the available documentation excerpts."
-                "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
-            ))
-
-            human = HumanMessage(
-                content=f"User question: {question}\n\nDocumentation:\n{snippets_text}")
-            resp = llm.invoke([sys, human])
-
-            messages_to_add.append(HumanMessage(content=question))
-            messages_to_add.append(resp)
+        if answer is not None:
+            messages_to_add.extend(answer)
             # Loop back to ask again
             skip_endpoints = False
 
@@ -197,49 +285,31 @@ def route_from_endpoints(state: ApiMappingState) -> str:
     return END
 
 
+_ASK_CLIENT_REQUEST = {
+    "type": "ask_client",
+    "title": "Step 2: Client Name (clientIdentCode)",
+    "prompt": "We start with step 2. In each API call, a **client (technical field name clientIdentCode)** must be transferred in the `screeningParameters`. The client is displayed in the 'Trade Compliance Management' tiles. **Please enter this client now in the input mask to proceed to the next step**.\n\nIf you don't know the client right now, you can skip that step and we continue with default settings.",
+}
+
+
 def ask_client_node(state: ApiMappingState) -> dict:
-    prov = state.get("provisioning", {})
+    return _run_step(state, _ASK_CLIENT_REQUEST, _QUESTION_SYSTEM_PROMPT, _ask_client_update)
 
-    # Use interrupt to allow skip/question
-    payload = interrupt({
-        "type": "ask_client",
-        "title": "Step 2: Client Name (clientIdentCode)",
-        "prompt": "We start with step 2. In each API call, a **client (technical field name clientIdentCode)** must be transferred in the `screeningParameters`. The client is displayed in the 'Trade Compliance Management' tiles. **Please enter this client now in the input mask to proceed to the next step**.\n\nIf you don't know the client right now, you can skip that step and we continue with default settings.",
-    })
+
+async def aask_client_node(state: ApiMappingState) -> dict:
+    return await _arun_step(state, _ASK_CLIENT_REQUEST, _QUESTION_SYSTEM_PROMPT, _ask_client_update)
+
+
+def _ask_client_update(state: ApiMappingState, payload: Any, answer: Optional[List[BaseMessage]]) -> dict:
+    prov = state.get("provisioning", {})
 
     skip_client = None  # None means proceed with data, True means use default, False means loop
     messages_to_add = []
 
     if isinstance(payload, dict):
         # Check if user asked a question
-        if "question" in payload and payload["question"]:
-            question = str(payload["question"]).strip()
-
-            # Use RAG for answering
-            Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
-            Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(
-                parents=True, exist_ok=True)
-            ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(
-            ), Config.KNOWLEDGE_BASE_VECTOR_STORE)
-
-            snippets = rag_search(
-                f"Question about Screening API: {question}", k=5)
-            snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
-                snippets)]) if snippets else '[No relevant documentation excerpts found]'
-
-            sys = SystemMessage(content=(
-                "You are an AEB Trade Compliance API expert. "
-                "Answer questions about the TCM Screening API precisely and helpfully in English. "
-                "ALWAYS use the available documentation excerpts."
-                "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
-            ))
-
-            human = HumanMessage(
-                content=f"User question: {question}\n\nDocumentation:\n{snippets_text}")
-            resp = llm.invoke([sys, human])
-
-            messages_to_add.append(HumanMessage(content=question))
-            messages_to_add.append(resp)
+        if answer is not None:
+            messages_to_add.extend(answer)
             # Loop back to ask again
             skip_client = False
 
@@ -289,48 +359,31 @@ def route_from_client(state: ApiMappingState) -> str:
     return END
 
 
+_ASK_WSM_REQUEST = {
+    "type": "ask_wsm",
+    "title": "Step 3: WSM User for Authentication",
+    "prompt": "We start with step 3. Depending on the technology (REST or SOAP) different authentication methods could be used:\n - HTTP Basic Authentication: This can be used with REST and SOAP and requires authentication data to be provided with each call.\n - Token Authentication: This can only be used with REST and requires an additional call to request a token, that can then be used for subsequent calls for a limited time. \nYou can find further technical documentation about setting up the authentication here: https://trade-compliance.docs.developers.aeb.com/docs/setting-up-your-environment-1#token-authentication \n\nBoth methods require a **technical user ID and password** that must be provided by AEB. **Did you have this access credentials?**\n\n If you don't have it yet, we can continue without it and go to the next step.",
+}
+
+
 def ask_wsm_node(state: ApiMappingState) -> dict:
-    prov = state.get("provisioning", {})
+    return _run_step(state, _ASK_WSM_REQUEST, _WSM_QUESTION_SYSTEM_PROMPT, _ask_wsm_update)
+
+
+async def aask_wsm_node(state: ApiMappingState) -> dict:
+    return await _arun_step(state, _ASK_WSM_REQUEST, _WSM_QUESTION_SYSTEM_PROMPT, _ask_wsm_update)
 
-    # Use interrupt to allow skip/question (tri-state handling)
-    payload = interrupt({
-        "type": "ask_wsm",
-        "title": "Step 3: WSM User for Authentication",
-        "prompt": "We start with step 3. Depending on the technology (REST or SOAP) different authentication methods could be used:\n - HTTP Basic Authentication: This can be used with REST and SOAP and requires authentication data to be provided with each call.\n - Token Authentication: This can only be used with REST and requires an additional call to request a token, that can then be used for subsequent calls for a limited time. \nYou can find further technical documentation about setting up the authentication here: https://trade-compliance.docs.developers.aeb.com/docs/setting-up-your-environment-1#token-authentication \n\nBoth methods require a **technical user ID and password** that must be provided by AEB. **Did you have this access credentials?**\n\n If you don't have it yet, we can continue without it and go to the next step.",
-    })
+
+def _ask_wsm_update(state: ApiMappingState, payload: Any, answer: Optional[List[BaseMessage]]) -> dict:
+    prov = state.get("provisioning", {})
 
     skip_wsm = None  # None means proceed with data, True means set default/no, False means loop
     messages_to_add = []
 
     if isinstance(payload, dict):
         # Check if user asked a question
-        if "question" in payload and payload["question"]:
-            question = str(payload["question"]).strip()
-
-            # Use RAG for answering
-            Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
-            Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(
-                parents=True, exist_ok=True)
-            ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(),
-                               Config.KNOWLEDGE_BASE_VECTOR_STORE)
-
-            snippets = rag_search(
-                f"Question about Screening API: {question}", k=5)
-            snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
-                snippets)]) if snippets else '[No relevant documentation excerpts found]'
-
-            sys = SystemMessage(content=(
-                "You are an AEB Trade Compliance API expert. "
-                "Answer questions about the TCM Screening API precisely and helpfully in English. "
-                "ALWAYS use the available documentation excerpts."
-            ))
-
-            human = HumanMessage(
-                content=f"User question: {question}\n\nDocumentation:\n{snippets_text}")
-            resp = llm.invoke([sys, human])
-
-            messages_to_add.append(HumanMessage(content=question))
-            messages_to_add.append(resp)
+        if answer is not None:
+            messages_to_add.extend(answer)
             # Loop back to ask again
             skip_wsm = False
 
@@ -377,77 +430,32 @@ def route_from_wsm(state: ApiMappingState) -> str:
     return END
 
 
+_ASK_GENERAL_INFO_REQUEST = {
+    "type": "show_general_info",
+    "title": "Step 4: Initial Integration Guide for Sanctions List Screening",
+    "prompt": "We start with step 4. Before starting to develop the API, there is helpful general information about the **supported interface architectures, objects relevant for screening**, and the grouping of **name and address fields**, whether they are required or optional.\n\n**Would you like to see this information?**",
+}
+
+
 def ask_general_info_node(state: ApiMappingState) -> dict:
     """Ask user if they want to see general screening information."""
-    payload = interrupt({
-        "type": "show_general_info",
-        "title": "Step 4: Initial Integration Guide for Sanctions List Screening",
-        "prompt": "We start with step 4. Before starting to develop the API, there is helpful general information about the **supported interface architectures, objects relevant for screening**, and the grouping of **name and address fields**, whether they are required or optional.\n\n**Would you like to see this information?**",
-    })
+    return _run_step(state, _ASK_GENERAL_INFO_REQUEST, _GENERAL_INFO_QUESTION_SYSTEM_PROMPT, _ask_general_info_update, with_config=True)
 
-    skip = None  # None means show content, True means skip, False means loop
-    messages_to_add = []
 
-    if isinstance(payload, dict):
-        # Check if user asked a question
-        if "question" in payload and payload["question"]:
-            question = str(payload["question"]).strip()
-
-            # Ensure indexes exist
-            Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
-            Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(
-                parents=True, exist_ok=True)
-            ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(),
-                               Config.KNOWLEDGE_BASE_VECTOR_STORE)
-
-            # Get RAG snippets
-            snippets = rag_search(
-                f"Question about Screening API: {question}", k=5)
-
-            prov = state.get("provisioning", {})
-            context_info = []
-            if prov.get("test_endpoint"):
-                context_info.append(
-                    f"Test-Endpoint: {prov.get('test_endpoint', 'N/A')}")
-            if prov.get("prod_endpoint"):
-                context_info.append(
-                    f"Prod-Endpoint: {prov.get('prod_endpoint', 'N/A')}")
-            if prov.get("clientIdentCode"):
-                context_info.append(
-                    f"Mandant (clientIdentCode): {prov.get('clientIdentCode', 'N/A')}")
-            if "wsm_user_configured" in prov:
-                wsm_status = "Yes" if prov["wsm_user_configured"] else "No"
-                context_info.append(f"WSM-User: {wsm_status}")
-
-            context_str = "\n".join(
-                context_info) if context_info else "No configuration data available."
-            snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
-                snippets)]) if snippets else '[No relevant documentation excerpts found]'
-
-            sys = SystemMessage(content=(
-                "You are an AEB Trade Compliance API expert. "
-                "Answer questions about the TCM Screening API precisely and helpfully in English. "
-                "ALWAYS use the available documentation excerpts and configuration data. "
-                "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
-                "If documentation is available, base your answer on it and not on general knowledge."
-            ))
-
-            human = HumanMessage(content=f"""
-User question: {question}
+async def aask_general_info_node(state: ApiMappingState) -> dict:
+    """Ask user if they want to see general screening information."""
+    return await _arun_step(state, _ASK_GENERAL_INFO_REQUEST, _GENERAL_INFO_QUESTION_SYSTEM_PROMPT, _ask_general_info_update, with_config=True)
 
-Available configuration:
-{context_str}
 
-Available documentation excerpts:
-{snippets_text}
+def _ask_general_info_update(state: ApiMappingState, payload: Any, answer: Optional[List[BaseMessage]]) -> dict:
 
-Answer the question based on the available information.
-IMPORTANT: Use the documentation excerpts as the primary source and use the correct API structure from the documentation.
-""")
+    skip = None  # None means show content, True means skip, False means loop
+    messages_to_add = []
 
-            resp = llm.invoke([sys, human])
-            messages_to_add.append(HumanMessage(content=question))
-            messages_to_add.append(resp)
+    if isinstance(payload, dict):
+        # Check if user asked a question
+        if answer is not None:
+            messages_to_add.extend(answer)
             # Loop back to ask again
             skip = False
 
@@ -509,77 +517,32 @@ Our recommendation:
     }
 
 
+_ASK_SCREENING_VARIANTS_REQUEST = {
+    "type": "show_screening_variants",
+    "title": "Step 5: Recommended Options for API Usage",
+    "prompt": "We start with step 5. The Compliance Screening API can be integrated into the processes of a partner system in **three different scenarios**.\n\n**Would you like to see this information?**",
+}
+
+
 def ask_screening_variants_node(state: ApiMappingState) -> dict:
     """Ask user if they want to see screening variants explanation."""
-    payload = interrupt({
-        "type": "show_screening_variants",
-        "title": "Step 5: Recommended Options for API Usage",
-        "prompt": "We start with step 5. The Compliance Screening API can be integrated into the processes of a partner system in **three different scenarios**.\n\n**Would you like to see this information?**",
-    })
+    return _run_step(state, _ASK_SCREENING_VARIANTS_REQUEST, _STEP_QUESTION_SYSTEM_PROMPT, _ask_screening_variants_update, with_config=True)
 
-    skip = None  # None means show content, True means skip, False means loop
-    messages_to_add = []
 
-    if isinstance(payload, dict):
-        # Check if user asked a question
-        if "question" in payload and payload["question"]:
-            question = str(payload["question"]).strip()
-
-            # Ensure indexes exist
-            Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
-            Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(
-                parents=True, exist_ok=True)
-            ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(),
-                               Config.KNOWLEDGE_BASE_VECTOR_STORE)
-
-            # Get RAG snippets
-            snippets = rag_search(
-                f"Question about Screening API: {question}", k=5)
-
-            prov = state.get("provisioning", {})
-            context_info = []
-            if prov.get("test_endpoint"):
-                context_info.append(
-                    f"Test-Endpoint: {prov.get('test_endpoint', 'N/A')}")
-            if prov.get("prod_endpoint"):
-                context_info.append(
-                    f"Prod-Endpoint: {prov.get('prod_endpoint', 'N/A')}")
-            if prov.get("clientIdentCode"):
-                context_info.append(
-                    f"Mandant (clientIdentCode): {prov.get('clientIdentCode', 'N/A')}")
-            if "wsm_user_configured" in prov:
-                wsm_status = "Yes" if prov["wsm_user_configured"] else "No"
-                context_info.append(f"WSM-User: {wsm_status}")
-
-            context_str = "\n".join(
-                context_info) if context_info else "No configuration data available."
-            snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
-                snippets)]) if snippets else '[No relevant documentation excerpts found]'
-
-            sys = SystemMessage(content=(
-                "You are an AEB Trade Compliance API expert. "
-                "Answer questions about the TCM Screening API precisely and helpfully in English. "
-                "ALWAYS use the available documentation excerpts and configuration data. "
-                "If documentation is available, base your answer on it and not on general knowledge."
-                "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
-            ))
-
-            human = HumanMessage(content=f"""
-User question: {question}
+async def aask_screening_variants_node(state: ApiMappingState) -> dict:
+    """Ask user if they want to see screening variants explanation."""
+    return await _arun_step(state, _ASK_SCREENING_VARIANTS_REQUEST, _STEP_QUESTION_SYSTEM_PROMPT, _ask_screening_variants_update, with_config=True)
 
-Available configuration:
-{context_str}
 
-Available documentation excerpts:
-{snippets_text}
+def _ask_screening_variants_update(state: ApiMappingState, payload: Any, answer: Optional[List[BaseMessage]]) -> dict:
 
-Answer the question based on the available information.
-IMPORTANT: Use the documentation excerpts as the primary source and use the correct API structure from the documentation.
-""")
+    skip = None  # None means show content, True means skip, False means loop
+    messages_to_add = []
 
-            resp = llm.invoke([sys, human])
-            messages_to_add.append(HumanMessage(content=question))
-            messages_to_add.append(resp)
+    if isinstance(payload, dict):
+        # Check if user asked a question
+        if answer is not None:
+            messages_to_add.extend(answer)
             # Loop back to ask again
             skip = False
 
@@ -661,77 +624,32 @@ Our recommendation:
     }
 
 
+_ASK_RESPONSES_REQUEST = {
+    "type": "show_responses",
+    "title": "Step 6: Response Scenarios Explanation",
+    "prompt": "We start with step 6. The response messages from the Compliance Screening API differ depending on whether the check result has identified a potential match or an uncritical check result.\n\n**Would you like to see an explanation of the detailed response scenarios?**",
+}
+
+
 def ask_responses_node(state: ApiMappingState) -> dict:
     """Ask user if they want to see response scenarios explanation."""
-    payload = interrupt({
-        "type": "show_responses",
-        "title": "Step 6: Response Scenarios Explanation",
-        "prompt": "We start with step 6. The response messages from the Compliance Screening API differ depending on whether the check result has identified a potential match or an uncritical check result.\n\n**Would you like to see an explanation of the detailed response scenarios?**",
-    })
+    return _run_step(state, _ASK_RESPONSES_REQUEST, _STEP_QUESTION_SYSTEM_PROMPT, _ask_responses_update, with_config=True)
 
-    skip = None  # None means show content, True means skip, False means loop
-    messages_to_add = []
 
-    if isinstance(payload, dict):
-        # Check if user asked a question
-        if "question" in payload and payload["question"]:
-            question = str(payload["question"]).strip()
-
-            # Ensure indexes exist
-            Config.KNOWLEDGE_BASE_DIR.mkdir(parents=True, exist_ok=True)
-            Config.KNOWLEDGE_BASE_VECTOR_STORE.mkdir(
-                parents=True, exist_ok=True)
-            ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(),
-                               Config.KNOWLEDGE_BASE_VECTOR_STORE)
-
-            # Get RAG snippets
-            snippets = rag_search(
-                f"Question about Screening API: {question}", k=5)
-
-            prov = state.get("provisioning", {})
-            context_info = []
-            if prov.get("test_endpoint"):
-                context_info.append(
-                    f"Test-Endpoint: {prov.get('test_endpoint', 'N/A')}")
-            if prov.get("prod_endpoint"):
-                context_info.append(
-                    f"Prod-Endpoint: {prov.get('prod_endpoint', 'N/A')}")
-            if prov.get("clientIdentCode"):
-                context_info.append(
-                    f"Mandant (clientIdentCode): {prov.get('clientIdentCode', 'N/A')}")
-            if "wsm_user_configured" in prov:
-                wsm_status = "Yes" if prov["wsm_user_configured"] else "No"
-                context_info.append(f"WSM-User: {wsm_status}")
-
-            context_str = "\n".join(
-                context_info) if context_info else "No configuration data available."
-            snippets_text = "\n\n".join([f"Document {i+1}:\n{snippet}" for i, snippet in enumerate(
-                snippets)]) if snippets else '[No relevant documentation excerpts found]'
-
-            sys = SystemMessage(content=(
-                "You are an AEB Trade Compliance API expert. "
-                "Answer questions about the TCM Screening API precisely and helpfully in English. "
-                "ALWAYS use the available documentation excerpts and configuration data. "
-                "If documentation is available, base your answer on it and not on general knowledge."
-                "If the documentation excerpts are empty or do not contain relevant information, don't mention that you could not find relevant information there. Just say that you don't have enough information to answer the question. Suggest to look into the official AEB Trade Compliance Management documentation for more details.Don't mention any documents or snippets in your answer, like 'I found this information in document 1' or similar. Just answer the question based on the documentation excerpts without mentioning them explicitly."
-            ))
-
-            human = HumanMessage(content=f"""
-User question: {question}
+async def aask_responses_node(state: ApiMappingState) -> dict:
+    """Ask user if they want to see response scenarios explanation."""
+    return await _arun_step(state, _ASK_RESPONSES_REQUEST, _STEP_QUESTION_SYSTEM_PROMPT, _ask_responses_update, with_config=True)
 
-Available configuration:
-{context_str}
 
-Available documentation excerpts:
-{snippets_text}
+def _ask_responses_update(state: ApiMappingState, payload: Any, answer: Optional[List[BaseMessage]]) -> dict:
 
-Answer the question based on the available information.
-IMPORTANT: Use the documentation excerpts as the primary source and use the correct API structure from the documentation.
-""")
+    skip = None  # None means show content, True means skip, False means loop
+    messages_to_add = []
 
-            resp = llm.invoke([sys, human])
-            messages_to_add.append(HumanMessage(content=question))
-            messages_to_add.append(resp)
+    if isinstance(payload, dict):
+        # Check if user asked a question
+        if answer is not None:
+            messages_to_add.extend(answer)
             # Loop back to ask again
             skip = False
 
@@ -851,21 +769,28 @@ Next Step: Please first **provide** your partner system name, business object**
     }
 
 
-def get_api_data_interrupt_node(state: ApiMappingState) -> dict:
+def _thread_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+
+def get_api_data_interrupt_node(state: ApiMappingState, config: Optional[RunnableConfig] = None) -> dict:
     payload = interrupt({
         "type": "get_api_data",
         "prompt": "Please provide your system name, process, and existing API metadata (e.g., JSON Schema, XML example, CSV structure, OpenAPI/Swagger definition).",
     })
 
-    system_name, process, api_filename, api_content = None, None, None, None
+    system_name, process, api_filename, api_content, api_upload = None, None, None, None, None
     if isinstance(payload, dict):
         if payload.get("system_name"):
             system_name = str(payload["system_name"]).strip()
         if payload.get("process"):
             process = str(payload["process"]).strip()
+        # Large files are uploaded out-of-band; only their path is in the payload
+        if payload.get("api_metadata_path"):
+            api_upload = str(payload["api_metadata_path"])
         # Handle new payload structure with file content
-        if payload.get("api_metadata_filename") and payload.get("api_metadata_content"):
-            api_filename = payload.get("api_metadata_filename")
+        elif payload.get("api_metadata_filename") and payload.get("api_metadata_content"):
+            api_filename = upload_store.safe_filename(payload.get("api_metadata_filename"))
             api_content = payload.get("api_metadata_content")
         # Handle legacy payload structure with file path (for backwards compatibility)
         elif payload.get("api_metadata"):
@@ -879,21 +804,20 @@ def get_api_data_interrupt_node(state: ApiMappingState) -> dict:
         out["system_name"] = system_name
     if process:
         out["process"] = process
-    if api_filename and api_content:
-        # Save the content to a file in the backend's API data directory
-        Config.API_DATA_DIR.mkdir(parents=True, exist_ok=True)
-        api_file_path = Config.API_DATA_DIR / api_filename
-        with open(api_file_path, "w", encoding="utf-8") as f:
-            f.write(api_content)
-        # Store just the filename, not full path
-        out["api_file_path"] = api_filename
+    # Stored by content hash, so concurrent threads never overwrite each other's files;
+    # api_file_path is relative to the backend's API data directory
+    if api_upload:
+        # Moved, not copied: the upload may be several hundred MB
+        out["api_file_path"] = upload_store.store_upload(api_upload, _thread_id(config))
+    elif api_filename and api_content:
+        out["api_file_path"] = upload_store.store_text(api_content, api_filename, _thread_id(config))
     elif api_filename:  # Legacy support
         out["api_file_path"] = api_filename
     return out
 
 
-def process_and_map_api_node(state: ApiMappingState) -> dict:
-    """Process customer API metadata and generate mapping suggestions."""
+def _mapping_prompt(state: ApiMappingState, config: Optional[RunnableConfig] = None) -> Tuple[HistoryWindow, List[BaseMessage]]:
+    """Read the customer API data and build the mapping prompt (blocking file and vector store I/O)."""
     messages = state.get("messages", [])
     prov = state.get("provisioning", {})
     api_file_path = state.get("api_file_path", "")
@@ -902,253 +826,219 @@ def process_and_map_api_node(state: ApiMappingState) -> dict:
             f"Api data has no filename. Something went wrong with storing it. Api metadata: {api_file_path}")
 
     # Read the API data file with proper error handling
-    # api_file_path is now just the filename, construct the full path
+    # api_file_path is relative to the API data directory
     api_data_file = Config.API_DATA_DIR / api_file_path
     if not api_data_file.exists():
         raise FileNotFoundError(f"API data file not found: {api_data_file}")
+    upload_store.touch(api_file_path, _thread_id(config))
+
+    # Check if customer API data fits next to the static prompt and the history
+    history = window_history(
+        messages, state, mapping_result=state.get("mapping_result"))
+    history_tokens = count_message_tokens(history.messages, Config.OPENAI_MODEL)
+    # Leave some room for the rest of the human message (configuration, instructions)
+    max_direct_inclusion_tokens = prompt_budget() - static_prefix_tokens() - \
+        history_tokens - 1_000
+
+    if Config.SCHEMA_STREAMING_MIN_BYTES and api_data_file.stat().st_size > Config.SCHEMA_STREAMING_MIN_BYTES:
+        customer_api_content = _catalog_content(api_data_file, max_direct_inclusion_tokens)
+    else:
+        customer_api_content = _file_content(api_data_file, max_direct_inclusion_tokens)
+
+    # Static, cache-friendly prefix; everything request specific goes into `human`
+    sys = static_system_message()
+
+    human = HumanMessage(content=f"""
+Analyze the following customer API metadata and create a detailed mapping to the AEB TCM Screening API:
+
+**Customer API structure:**
+
+```
+{customer_api_content}
+```
+
+**Available AEB Configuration:**
+
+* Test endpoint: {prov.get('test_endpoint', 'N/A')}
+* Prod endpoint: {prov.get('prod_endpoint', 'N/A')}
+* ClientIdentCode: {prov.get('clientIdentCode', 'N/A')}
+* System name: {state.get('system_name', 'N/A')}
+* Process: {state.get('process', 'N/A')}
+* API file: {api_data_file.name}
+""")
+
+    check_context_budget("process_and_map_api", static_prefix_tokens(), history_tokens,
+                         count_message_tokens([human], Config.OPENAI_MODEL))
+    return history, [sys, *history.messages, human]
+
+
+def _catalog_content(api_data_file: Path, max_tokens: int) -> str:
+    """Customer API content of a file too large to read: its streamed field catalog,
+    reduced to the pre-match or, failing that, the leading fields that fit."""
+    try:
+        catalog = ensure_catalog(api_data_file)
+    except SchemaParseError as e:
+        print(f"[warn] No field catalog for {api_data_file.name}, including its beginning: {e}")
+        return _raw_head_content(api_data_file, max_tokens, str(e))
+    size_mb = catalog.size_bytes / 1024 / 1024
+    prematched = prematch_fields(catalog.fields, min_score=Config.FIELD_MATCH_MIN_SCORE,
+                                 top_k=Config.FIELD_MATCH_TOP_K)
+    if prematched and count_tokens(prematched, Config.OPENAI_MODEL) <= max_tokens:
+        print(f"Customer API data ({size_mb:.0f} MB) pre-matched from its field catalog")
+        return f"""
+    **Pre-matched customer API metadata:**
+    {prematched}
+
+    **Note:** The API metadata ({size_mb:.0f} MB {catalog.format}, {len(catalog.fields)} fields) was
+    reduced to the candidate fields for the AEB address fields and the objects containing them.
+    Verify the candidates; fields not listed did not resemble any screening field.
+    """
+    # Roughly 15 tokens per listed field; halved until the listing fits
+    max_fields = min(len(catalog.fields), max(max_tokens // 15, 50))
+    listing = render_fields(catalog.fields, max_fields)
+    while max_fields > 50 and count_tokens(listing, Config.OPENAI_MODEL) > max_tokens:
+        max_fields //= 2
+        listing = render_fields(catalog.fields, max_fields)
+    print(f"Customer API data ({size_mb:.0f} MB) listed as {min(max_fields, len(catalog.fields))} catalog fields")
+    return f"""
+    **Field catalog of the customer API metadata:**
+    {listing}
+
+    **Note:** The API metadata ({size_mb:.0f} MB {catalog.format}) is listed as its field paths,
+    types and descriptions instead of the raw document.
+    """
+
+
+# One retrieval query per group of AEB target fields of screenAddresses, so a large
+# schema yields the objects of every group instead of those of the dominant one
+_RAG_FIELD_GROUP_QUERIES = [
+    "name, company name, first name, surname, title, address type, entity or person",
+    "street, house number, address line, postbox, po box",
+    "city, postal code, zip, district, town",
+    "country, country code, country iso, nationality",
+    "tax number, vat id, duns number, bic, identifiers",
+    "customer id, partner number, reference number, order number, document number",
+]
+
+
+def _rag_excerpts(snippets: List[str], max_tokens: int) -> str:
+    """Fused RAG snippets in rank order, as many as fit into `max_tokens`."""
+    kept: List[str] = []
+    used = 0
+    for snippet in snippets:
+        tokens = count_tokens(snippet, Config.OPENAI_MODEL)
+        if used + tokens > max_tokens:
+            break
+        kept.append(snippet)
+        used += tokens
+    return "\n\n---\n\n".join(kept)
+
+
+def _raw_head_content(api_data_file: Path, max_tokens: int, error: str) -> str:
+    """Customer API content of a large file that could not be parsed: as much of its
+    beginning as fits into `max_tokens`."""
+    size_mb = api_data_file.stat().st_size / 1024 / 1024
+    # Roughly 4 characters per token; halved until the excerpt fits
+    max_chars = max(max_tokens, 1) * 4
+    with open(api_data_file, encoding="utf-8", errors="replace") as f:
+        head = f.read(max_chars)
+    while head and count_tokens(head, Config.OPENAI_MODEL) > max_tokens:
+        head = head[:len(head) // 2]
+    return f"""
+    **Beginning of the customer API metadata:**
+    {head}
+
+    **Note:** The API metadata ({size_mb:.0f} MB) could not be parsed ({error}), so only its
+    beginning is shown. Fields further down the file are missing; point out that the upload
+    may be malformed and ask for a valid export if the screening fields are not listed.
+    """
+
 
+def _file_content(api_data_file: Path, max_direct_inclusion_tokens: int) -> str:
+    """Customer API content of a file small enough to read: the file itself, its
+    pre-match or RAG excerpts, depending on its size."""
     with open(api_data_file, encoding="utf-8") as customer_data:
         user_input = customer_data.read()
+    user_input_tokens = count_tokens(user_input, Config.OPENAI_MODEL)
+    api_file_path = api_data_file.name
+
+    # Large schemas are reduced to the deterministic pre-match when it finds candidates
+    prematched = None
+    if Config.FIELD_MATCH_MIN_TOKENS and user_input_tokens > Config.FIELD_MATCH_MIN_TOKENS:
+        prematched = prematch_schema(user_input, api_file_path,
+                                     min_score=Config.FIELD_MATCH_MIN_SCORE, top_k=Config.FIELD_MATCH_TOP_K)
+        prematched_tokens = count_tokens(prematched, Config.OPENAI_MODEL) if prematched else 0
+        if prematched_tokens > max_direct_inclusion_tokens:
+            prematched = None
+        elif prematched:
+            print(f"Customer API data pre-matched: {user_input_tokens} -> {prematched_tokens} tokens")
+
+    if prematched:
+        customer_api_content = f"""
+    **Pre-matched customer API metadata:**
+    {prematched}
 
-    # Check if customer API data is too large for direct inclusion
-    user_input_token_estimate = len(user_input) // 4 if user_input else 0
-    MAX_DIRECT_INCLUSION_TOKENS = 100_000
-
+    **Note:** The complete API metadata ({user_input_tokens} tokens) was reduced to the candidate
+    fields for the AEB address fields and the objects containing them. Verify the candidates; fields
+    not listed did not resemble any screening field.
+    """
     # Only build vectorstore if we need RAG (file is large)
-    if user_input_token_estimate > MAX_DIRECT_INCLUSION_TOKENS:
+    elif user_input_tokens > max_direct_inclusion_tokens:
         print(
-            f"Customer API data too large ({user_input_token_estimate} estimated tokens), using RAG search")
+            f"Customer API data too large ({user_input_tokens} tokens, {max_direct_inclusion_tokens} available), using RAG search")
         print("🔄 Building vectorstore for RAG search...")
 
-        # Ensure directories exist
-        Config.API_DATA_DIR.mkdir(parents=True, exist_ok=True)
+        # One collection per stored object in the long-lived API data store: built from
+        # just this file, reused by every thread with the same upload
+        api_object = upload_store.as_object(api_data_file)
+        collection = upload_store.index_collection(api_object)
         Config.API_DATA_VECTOR_STORE.mkdir(parents=True, exist_ok=True)
+        build_index(api_object.parent.as_posix(), Config.API_DATA_VECTOR_STORE, collection)
 
-        # Build vectorstore fresh to only include current session's data
-        build_index_fresh(Config.API_DATA_DIR.as_posix(),
-                          Config.API_DATA_VECTOR_STORE, clear_existing=True)
-
-        # Use RAG search on customer data (now only contains current session's data)
-        api_data_snippets = rag_search(
-            "name, street, address, firstname, surname, entity, postbox, city, country, district", k=5,
-            store_dir=Config.API_DATA_VECTOR_STORE,
-        )
+        api_data_snippets = _rag_excerpts(
+            rag_multi_search(_RAG_FIELD_GROUP_QUERIES,
+                             store_dir=Config.API_DATA_VECTOR_STORE, collection=collection),
+            max_direct_inclusion_tokens)
 
         customer_api_content = f"""
     **Relevant excerpts from customer API metadata (via RAG):**
     {api_data_snippets if api_data_snippets else '[No relevant API data found]'}
 
     **Note:** The complete API metadata was too large for direct analysis.
-    The above excerpts were selected based on relevance for address and name fields.
+    The above excerpts were selected based on relevance for each group of AEB address fields.
     """
     else:
         print(
-            f"Customer API data size acceptable ({user_input_token_estimate} estimated tokens), including directly")
+            f"Customer API data size acceptable ({user_input_tokens} tokens), including directly")
         customer_api_content = user_input
 
-    sys = SystemMessage(content=(
-        f"""
-# Compliance API Mapping System Prompt
-
-You are an expert AI assistant specialized in helping customers map their internal business data to AEB Trade Compliance Management APIs for Compliance Screening. Your primary role is to analyze customer data schemas and generate precise field mappings to ensure accurate compliance screening results.
-
-## General Information about AEB TCM Screening API
-
-{get_general_information_about_screening_api()}
-
-## AEB endpoint (api_screen_addresses_spec)
-
-{get_screen_addresses_spec()}
-
-## AEB API calls examples
-
-{get_api_examples()}
-
-## Core Capabilities
-
-### 1. Data Schema Analysis
-- Analyze customer's internal data structures (JSON, XML, CSV, database schemas, etc.)
-- Identify relevant fields in customers data to mapp them to the APIs for Compliance Screening
-- Understand data types, formats, and business context
-- Recognize incomplete or fragmented data Patterns
-- Always ask which objects are to be mapped if you cannot determine this yourself, e.g., whether the mapping is to be created for master data of business partners or for transactional movement objects such as an order. This is to ensure that the reference fields and conditions can be filled as meaningfully as possible.
-- Always check with the user if you are unsure about certain fields from the uploaded meta data files and therefore cannot reliably assign all fields relevant for verification.
-
-### 2. API Field Mapping Instructions
-
-You have deep knowledge of the AEB Compliance Screening API structure and can use the provided examples.
-
-- Before you provide a mapping try to determine the relevant general API parameters which are required for the screeningParameters such as clientIdentCode, clientSystemId and profileIdentCode. If they were not entered yet than ask the user who would like to get the API mapping. If you ask for this parameters than ask for the needed field and always provide an explanation of what this field is about. DEFAULT as profileIdentCode will always exists if the user does not know it.
-- Each mapping should include the general API Parameters (REST screeningParameters, SOAP parms) as well as the business partner address data (REST addresses, SOAP patterns). The general API parameters and the business partner address data should be listed.
-- The business partner address data should contain at least the mandatory fields, check relevant fields and the recommended optional fields.
-- If you provide a mapping than generate an overview in the form of `Screening Parameters table` and a separate `Field Mapping Table` and addtional a complete REST request.
-
-### 3. Mapping Generation
-
-Create comprehensive mappings that include:
-- **Direct mappings** - Exact field-to-field matches
-- **Transformation mappings** - Data format conversions, concatenations, splits
-- **Conditional mappings** - Logic-based field popula
-- **Default values** - Standard values for missing fields
-- **Validation rules** - Data quality checks
-
-### 4. Best Practices & Optimization
-
-- Prioritize accuracy over completeness
-- Always include mandatory fields, check relevant fields and the recommended optional fields as part of the mapping.
-- Use `addressType` correctly: `entity` for companies, `individual` for persons. The adressType must be inluded in each Field Mapping Table.
-- Leverage `name1`-`name4` for better matching accuracy when possible.
-- Include address fields (`street`, `pc`, `city`, `countryISO`) for precision.
-- Always try to identify good distinguishing `ids`, as this significantly increases the Screening check accuracy and reduces false similarities.
-- If you find an e-mail adddress within the uploaded meta data then map it to the field email and to the field ids with idType `DOMAIN_NAME`.
-- If you find a website within the uploaded meta data then map it to the field ids with idType `DOMAIN_NAME`.
-- If you find more the one name field within the uploaded data for entities then fill the field `name` as a concatenation of `name1`, `name2`, `name3` and `name4". The single name fields should be listed separately as well.
-- If you find more the one name field within the uploaded data for persons then fill the field `name` as a concatenation of `surname` and `prenames`. The single name fields should be listed separately as well.
-- If the uploaded meta data includes information for more than one address (including name, number, street, city, country) then they have to be provided as an array within the REST example request. So the adresses field in the request should contain multiple objects (e.g. for ship-to party, bill-to party, sell-to party).
-- If the uploaded meta data includes information for more than one address of a business partner (e.g. ship-to party, bill-to party, sell-to party) then the fields `name`, `street`, `pc`, `city`, `country` can have several entries within column `Customer field` of the Field Mapping Table.
-- Try to fill `referenceId` and `referenceComment` for for good traceability. Always refer to the available examples.
-- For mapping the `referenceId` field, the uploaded data should be checked to see if it contains an id, internal ID, internal identifier, GUID, UUID, or unique ID, as it should be populated with the technical identification number of the object. If there are more than one field that could be used as `referenceId` then list them within column `Customer field` of the Field Mapping Table. The referenceId must be inluded in each Field Mapping Table.
-- For mapping the `referenceComment` field, the uploaded data should be checked to see if it contains a field named as reference number or number of the business object (e.g. customer, vendor, partner, sales order, shipment, delivery, purchase order) which should then be used for the mapping. If the uploaded meta data includes information for more than one address of a business partner (e.g. ship-to party, bill-to party, sell-to party) then the content of this field should be composed of the object number (e.g. sales order number, shipment number) and partner role (e.g. ship-to party) to one combined information (sales order number - ship-to party number or name). The referenceComment must be inluded in each Field Mapping Table.
-- If the uploaded meta data includes information about identification number such as national tax numbers of companies (`idType`= TAX_NO), DUNS numbers of companies (`idType`= DUNS_NO), SWIFT code for banks (`idType`= BIC), passport numbers belonging to individuals (`idType`= PASSPORT_NO), IMO numbers for vessels (`idType`= IMO_NO) or email addresses or websites (`idType`= DOMAIN_NAME) that could be used as `ids` then list them with `idType` and `idValue`within column `Customer field` of the Field Mapping Table.
-- Consider `condition` for context-specific good guys. The field `condition` with `description` and `value` must be included in each Field Mapping Table.
-- The context for conditions of master data records (e.g. customer, vendor, employee, banks) is usually a combination of business object type and reference number that can be used as a condition (e.g `value` = customer_number,`description` = customer: number).
-- The usecase for conditions of transactional movement data (e.g. sales orders, deliveries, purchase oders, shipmemts) is the continuous applicability of a good guy for business objects that are related in a document flow (eg Quotation → Order → Delivery) so that the conditional exemption also applies to subsequent documents. It is common practice to derive the condition from the first document in the flow (e.g quotation oder sales order). Therefore, the field filling of the condition for transactional movement data should be a combination of business object type and reference number (e.g `value` = salesorder_number, `description` = sales order: number).
-- If a customer uses the word "release" to unblock a business object or address this means that, for Compliance Screening a user has to create a good guy. A general good guy is one without a condition, whereas a good guy with condition is for a one-time release without affecting future checks. It is recommended that a condition is transferred in each API call for both approaches, so that the user has the option to create a good guy with or without a condition during match handling.
-
-## Response Format
-
-When generating mappings, provide:
-
-1. **Mapping Overview** - Summary of the mapping approach
-2. **Screening Parameters table** - Detailed information about the content of the general API parameters (screeningParameters).  The table should list all available field and should have the following columns:
-- `API field AEB` -> Technical name from the Trade Compliance Management API
-- `Mantatory field` -> Labeling whether yes or no
-- `Example` -> Field content either from the available data entered by the user or use default values provides by the examamples.
-3. **Field Mapping Table** - Detailed source-to-target Mappings. The field mapping table should have the following columns:
-- `API field AEB` -> Technical name from the Trade Compliance Management API
-- `Customer field` -> Technical name from from the meta deta file uploaded by the user
-- `Mandatory field` -> Labeling whether yes or no
-- `Check relevant field` -> Labeling whether yes or no
-- `Transformation info` -> should contain explanations as well as notes, e.g., if fields have been combined, such as address line 1 and address line 2 into one field for street name.
-- `Example` -> Field content either from the meta deta file uploaded by the user or from an example
-4. **A complete REST request **
-- Example API request with mapped data. The REST request must contain the request header and the body.
-- You must also write a example request with a cURL syntax like this, where the headers and the links are included:
-```bash
-curl --request POST \
-     --url https://rz3.aeb.de/test4ce/rest/ComplianceScreening/screenAddresses \
-     --header 'X-XNSG_WEB_TOKEN: YOUR_TOKEN' \
-     --header 'accept: application/json' \
-     --header 'content-type: application/json' \
-     --data '
-```
-where you use the test-endpoint provided by the user as URL (Test endpoint: {prov.get('test_endpoint', 'N/A')})
-
-5. **Transformation Logic** - Code/pseudo-code for complex mappings
-6. **Validation & Quality Checks** - Recommended data validation
-7. **Implementation Notes** - Important considerations edge cases
-8. **Output of events involving business objects** - Events which are reasonable triggers for a Compliance Screening check
-
-
-## Specification of mandatory, check relevant fields an optional fields for Field Mapping Table
-- Mantatory fields:
-    - `name` -> ONLY the name field is mandatory.
-- Check relevant fields:
-- `name` -> is check relevant AND mandatory
-- `name1` -> is check relevant
-- `name2` -> is check relevant
-- `name3` -> is check relevant
-- `name4` -> is check relevant
-- `addressType` -> is check relevant
-- `street` -> is check relevant
-- `pc` -> is check relevant
-- `city` -> is check relevant
-- `countryISO` -> is check relevant
-- `postbox` -> is check relevant
-- `pcPostbox` -> is check relevant
-- `condition` with `value` -> is check relevant
-- `description` and `ids` with `idType` and `idValue` -> are check relevant
-- Recommended optional fields: `referenceId`, `referenceComment`, `info`.
-
-## Understanding Compliance Screening check
-
-One of the main functions of Trade Compliance Management is the product Compliance Screening. Compliance Screening lets you screen your business partners against various restricted party lists. The following synonyms can be used to describe this function:
-
-- Screening check
-- Compliance Screening check
-- Restricted party screening (RPS)
-- Restricted entity check
-- Sanctions party check
-- Denied Person Screening (DPS)
-- Business partner check
-- Watchlist Screening
-- Blacklist Screening
-
-All these terms include the checking of both individuals, companies and means of transports, i.e., master data records and transactional movement data can be checked with them.
-
-## Important Guidelines
-
-- **Always ask clarifying questions** about ambiguous customer data
-- **Validate data quality** requirements and suggest improvements
-- **Consider compliance context** - different screening needs may require different approaches
-- **Explain trade-offs** between mapping options
-- **Provide fallback strategies** for missing or incomplete data
-- **Indicate the limitation of the master data check** for bulk operations. A typical batch size could be 100 addresses. However, if you plan to use very big restricted party lists (e.g. from Dow Jones), it may be neccessary to choose smaller block sizes to get acceptable response times.
-- **Suggest data enrichment for check relevant and recommended fields** where beneficial
-- **Only relevant information** should be mapped if possible (mandatory fields, check relevant fields, recommended reference fields, and useful optional fields). If further information is available in the meta data provided by customers (e.g., items, block statuses, dates), this should not be used in the mapping.
-
-## Common Scenarios
-
-1. **Master Data Records** - Periodic screening check of business Partners (customers, vendors)
-2. **New Master Data Records** - Screening check during the onboarding of new business partners (customers, vendors)
-3. **Transactional Movement Data Screening** - Event based screening check of transactional movement data (orders, deliveries, shipments, purchase orders) with multiple addresses
-4. **Employee Screening** - Periodic creening check employees of the company itself
-5. **Bank Screening** - Periodic Screening check of bank records
-6. **Financial Transactions** - Screening check with the participating partners (bank details and payees) before the payment run for all due payments
-
-## Error Handling & Edge Cases
-
-- Handle missing mandatory fields gracefully
-- Suggest data normalization for better matching
-- Account for international address formats
-- Consider name variations and aliases
-- Handle incomplete person vs. entity classification
-- Manage data encoding and character set issues
-
-Remember: Your goal is to maximize screening accuracy while minimizing false positives, ensuring compliance requirements are met efficiently and effectively.
-        """
-    ))
-
-    human = HumanMessage(content=f"""
-Analyze the following customer API metadata and create a detailed mapping to the AEB TCM Screening API:
+    return customer_api_content
 
-**Customer API structure:**
 
-```
-{customer_api_content}
-```
+def _mapping_update(history: HistoryWindow, resp: BaseMessage) -> dict:
+    log_prompt_cache_usage("process_and_map_api", resp)
+    return {
+        "completed": True,
+        "messages": [resp],
+        "mapping_result": resp.content,
+        **history.state_update(),
+    }
 
-**Available AEB Configuration:**
 
-* Test endpoint: {prov.get('test_endpoint', 'N/A')}
-* Prod endpoint: {prov.get('prod_endpoint', 'N/A')}
-* ClientIdentCode: {prov.get('clientIdentCode', 'N/A')}
-* System name: {state.get('system_name', 'N/A')}
-* Process: {state.get('process', 'N/A')}
-* API file path: {state.get('api_file_path', 'N/A')}
-""")
+def process_and_map_api_node(state: ApiMappingState, config: Optional[RunnableConfig] = None) -> dict:
+    """Process customer API metadata and generate mapping suggestions."""
+    history, prompt = _mapping_prompt(state, config)
+    return _mapping_update(history, mapping_llm.invoke(prompt))
 
-    resp = llm.invoke([sys, *messages, human])
-    state["mapping_result"] = resp.content  # type: ignore
 
-    return {
-        "completed": True,
-        "messages": [resp]
-    }
+async def aprocess_and_map_api_node(state: ApiMappingState, config: Optional[RunnableConfig] = None) -> dict:
+    """Process customer API metadata and generate mapping suggestions."""
+    history, prompt = await asyncio.to_thread(_mapping_prompt, state, config)
+    return _mapping_update(history, await mapping_llm.ainvoke(prompt))
 
 
-def qa_mode_node(state: ApiMappingState) -> dict:
-    """Handle free-flowing Q&A after the initial flow is completed."""
+def _qa_prompt(state: ApiMappingState) -> Tuple[HistoryWindow, List[BaseMessage]]:
+    """Build the Q&A prompt with RAG snippets (blocking vector store I/O)."""
     prov = state.get("provisioning", {})
     messages = state.get("messages", [])
     question = get_last_user_message(messages)
@@ -1183,174 +1073,13 @@ def qa_mode_node(state: ApiMappingState) -> dict:
     context_str = "\n".join(
         context_info) if context_info else "Keine Konfigurationsdaten verfügbar."
 
-    sys = SystemMessage(content=f"""
-# Compliance API Mapping System Prompt
-
-You are an expert AI assistant specialized in helping customers map their internal business data to AEB Trade Compliance Management APIs for Compliance Screening. Your primary role is to analyze customer data schemas and generate precise field mappings to ensure accurate compliance screening results.
-
-## General Information about AEB TCM Screening API
-
-{get_general_information_about_screening_api()}
-
-## AEB endpoint (api_screen_addresses_spec)
-
-{get_screen_addresses_spec()}
-
-## AEB API calls examples
-
-{get_api_examples()}
-
-## Core Capabilities
-
-### 1. Data Schema Analysis
-- Analyze customer's internal data structures (JSON, XML, CSV, database schemas, etc.)
-- Identify relevant fields in customers data to mapp them to the APIs for Compliance Screening
-- Understand data types, formats, and business context
-- Recognize incomplete or fragmented data Patterns
-- Always ask which objects are to be mapped if you cannot determine this yourself, e.g., whether the mapping is to be created for master data of business partners or for transactional movement objects such as an order. This is to ensure that the reference fields and conditions can be filled as meaningfully as possible.
-- Always check with the user if you are unsure about certain fields from the uploaded meta data files and therefore cannot reliably assign all fields relevant for verification.
-
-### 2. API Field Mapping Instructions
-
-You have deep knowledge of the AEB Compliance Screening API structure and can use the provided examples.
-
-- Before you provide a mapping try to determine the relevant general API parameters which are required for the screeningParameters such as clientIdentCode, clientSystemId and profileIdentCode. If they were not entered yet than ask the user who would like to get the API mapping. If you ask for this parameters than ask for the needed field and always provide an explanation of what this field is about. DEFAULT as profileIdentCode will always exists if the user does not know it.
-- Each mapping should include the general API Parameters (REST screeningParameters, SOAP parms) as well as the business partner address data (REST addresses, SOAP patterns). The general API parameters and the business partner address data should be listed.
-- The business partner address data should contain at least the mandatory fields, check relevant fields and the recommended optional fields.
-- If you provide a mapping than generate an overview in the form of `Screening Parameters table` and a separate `Field Mapping Table` and addtional a complete REST request.
-
-### 3. Mapping Generation
-
-Create comprehensive mappings that include:
-- **Direct mappings** - Exact field-to-field matches
-- **Transformation mappings** - Data format conversions, concatenations, splits
-- **Conditional mappings** - Logic-based field popula
-- **Default values** - Standard values for missing fields
-- **Validation rules** - Data quality checks
-
-### 4. Best Practices & Optimization
-
-- Prioritize accuracy over completeness
-- Always include mandatory fields, check relevant fields and the recommended optional fields as part of the mapping.
-- Use `addressType` correctly: `entity` for companies, `individual` for persons. The adressType must be inluded in each Field Mapping Table.
-- Leverage `name1`-`name4` for better matching accuracy when possible.
-- Include address fields (`street`, `pc`, `city`, `countryISO`) for precision.
-- Always try to identify good distinguishing `ids`, as this significantly increases the Screening check accuracy and reduces false similarities.
-- If you find an e-mail adddress within the uploaded meta data then map it to the field email and to the field ids with idType `DOMAIN_NAME`.
-- If you find a website within the uploaded meta data then map it to the field ids with idType `DOMAIN_NAME`.
-- If you find more the one name field within the uploaded data for entities then fill the field `name` as a concatenation of `name1`, `name2`, `name3` and `name4". The single name fields should be listed separately as well.
-- If you find more the one name field within the uploaded data for persons then fill the field `name` as a concatenation of `surname` and `prenames`. The single name fields should be listed separately as well.
-- If the uploaded meta data includes information for more than one address (including name, number, street, city, country) then they have to be provided as an array within the REST example request. So the adresses field in the request should contain multiple objects (e.g. for ship-to party, bill-to party, sell-to party).
-- If the uploaded meta data includes information for more than one address of a business partner (e.g. ship-to party, bill-to party, sell-to party) then the fields `name`, `street`, `pc`, `city`, `country` can have several entries within column `Customer field` of the Field Mapping Table.
-- Try to fill `referenceId` and `referenceComment` for for good traceability. Always refer to the available examples.
-- For mapping the `referenceId` field, the uploaded data should be checked to see if it contains an id, internal ID, internal identifier, GUID, UUID, or unique ID, as it should be populated with the technical identification number of the object. If there are more than one field that could be used as `referenceId` then list them within column `Customer field` of the Field Mapping Table. The referenceId must be inluded in each Field Mapping Table.
-- For mapping the `referenceComment` field, the uploaded data should be checked to see if it contains a field named as reference number or number of the business object (e.g. customer, vendor, partner, sales order, shipment, delivery, purchase order) which should then be used for the mapping. If the uploaded meta data includes information for more than one address of a business partner (e.g. ship-to party, bill-to party, sell-to party) then the content of this field should be composed of the object number (e.g. sales order number, shipment number) and partner role (e.g. ship-to party) to one combined information (sales order number - ship-to party number or name). The referenceComment must be inluded in each Field Mapping Table.
-- If the uploaded meta data includes information about identification number such as national tax numbers of companies (`idType`= TAX_NO), DUNS numbers of companies (`idType`= DUNS_NO), SWIFT code for banks (`idType`= BIC), passport numbers belonging to individuals (`idType`= PASSPORT_NO), IMO numbers for vessels (`idType`= IMO_NO) or email addresses or websites (`idType`= DOMAIN_NAME) that could be used as `ids` then list them with `idType` and `idValue`within column `Customer field` of the Field Mapping Table.
-- Consider `condition` for context-specific good guys. The field `condition` with `description` and `value` must be included in each Field Mapping Table.
-- The context for conditions of master data records (e.g. customer, vendor, employee, banks) is usually a combination of business object type and reference number that can be used as a condition (e.g `value` = customer_number,`description` = customer: number).
-- The usecase for conditions of transactional movement data (e.g. sales orders, deliveries, purchase oders, shipmemts) is the continuous applicability of a good guy for business objects that are related in a document flow (eg Quotation → Order → Delivery) so that the conditional exemption also applies to subsequent documents. It is common practice to derive the condition from the first document in the flow (e.g quotation oder sales order). Therefore, the field filling of the condition for transactional movement data should be a combination of business object type and reference number (e.g `value` = salesorder_number, `description` = sales order: number).
-
-## Response Format
-
-When generating mappings, provide:
-
-1. **Mapping Overview** - Summary of the mapping approach
-2. **Screening Parameters table** - Detailed information about the content of the general API parameters (screeningParameters).  The table should list all available field and should have the following columns:
-- `API field AEB` -> Technical name from the Trade Compliance Management API
-- `Mantatory field` -> Labeling whether yes or no
-- `Example` -> Field content either from the available data entered by the user or use default values provides by the examamples.
-3. **Field Mapping Table** - Detailed source-to-target Mappings. The field mapping table should have the following columns:
-- `API field AEB` -> Technical name from the Trade Compliance Management API
-- `Customer field` -> Technical name from from the meta deta file uploaded by the user
-- `Mandatory field` -> Labeling whether yes or no
-- `Check relevant field` -> Labeling whether yes or no
-- `Transformation info` -> should contain explanations as well as notes, e.g., if fields have been combined, such as address line 1 and address line 2 into one field for street name.
-- `Example` -> Field content either from the meta deta file uploaded by the user or from an example
-4. **A complete REST request **
-- Example API request with mapped data. The REST request must contain the request header and the body.
-- You must also write a example request with a cURL syntax like this, where the headers and the links are included:
-```bash
-curl --request POST \
-     --url https://rz3.aeb.de/test4ce/rest/ComplianceScreening/screenAddresses \
-     --header 'X-XNSG_WEB_TOKEN: YOUR_TOKEN' \
-     --header 'accept: application/json' \
-     --header 'content-type: application/json' \
-     --data '
-```
-where you use the test-endpoint provided by the user as URL (Test endpoint: {prov.get('test_endpoint', 'N/A')})
-
-5. **Transformation Logic** - Code/pseudo-code for complex mappings
-6. **Validation & Quality Checks** - Recommended data validation
-7. **Implementation Notes** - Important considerations edge cases
-8. **Output of events involving business objects** - Events which are reasonable triggers for a Compliance Screening check
-
-
-## Specification of mandatory, check relevant fields an optional fields for Field Mapping Table
-- Mantatory fields:
-    - `name` -> ONLY the name field is mandatory.
-- Check relevant fields:
-- `name` -> is check relevant AND mandatory
-- `name1` -> is check relevant
-- `name2` -> is check relevant
-- `name3` -> is check relevant
-- `name4` -> is check relevant
-- `addressType` -> is check relevant
-- `street` -> is check relevant
-- `pc` -> is check relevant
-- `city` -> is check relevant
-- `countryISO` -> is check relevant
-- `postbox` -> is check relevant
-- `pcPostbox` -> is check relevant
-- `condition` with `value` -> is check relevant
-- `description` and `ids` with `idType` and `idValue` -> are check relevant
-- Recommended optional fields: `referenceId`, `referenceComment`, `info`.
-
-## Understanding Compliance Screening check
-
-One of the main functions of Trade Compliance Management is the product Compliance Screening. Compliance Screening lets you screen your business partners against various restricted party lists. The following synonyms can be used to describe this function:
-
-- Screening check
-- Compliance Screening check
-- Restricted party screening (RPS)
-- Restricted entity check
-- Sanctions party check
-- Denied Person Screening (DPS)
-- Business partner check
-- Watchlist Screening
-- Blacklist Screening
-
-All these terms include the checking of both individuals, companies and means of transports, i.e., master data records and transactional movement data can be checked with them.
-
-## Important Guidelines
-
-- **Always ask clarifying questions** about ambiguous customer data
-- **Validate data quality** requirements and suggest improvements
-- **Consider compliance context** - different screening needs may require different approaches
-- **Explain trade-offs** between mapping options
-- **Provide fallback strategies** for missing or incomplete data
-- **Indicate the limitation of the master data check** for bulk operations. A typical batch size could be 100 addresses. However, if you plan to use very big restricted party lists (e.g. from Dow Jones), it may be neccessary to choose smaller block sizes to get acceptable response times.
-- **Suggest data enrichment for check relevant and recommended fields** where beneficial
-- **Only relevant information** should be mapped if possible (mandatory fields, check relevant fields, recommended reference fields, and useful optional fields). If further information is available in the meta data provided by customers (e.g., items, block statuses, dates), this should not be used in the mapping.
-
-## Common Scenarios
-
-1. **Master Data Records** - Periodic screening check of business Partners (customers, vendors)
-2. **New Master Data Records** - Screening check during the onboarding of new business partners (customers, vendors)
-3. **Transactional Movement Data Screening** - Event based screening check of transactional movement data (orders, deliveries, shipments, purchase orders) with multiple addresses
-4. **Employee Screening** - Periodic creening check employees of the company itself
-5. **Bank Screening** - Periodic Screening check of bank records
-6. **Financial Transactions** - Screening check with the participating partners (bank details and payees) before the payment run for all due payments
-
-## Error Handling & Edge Cases
-
-- Handle missing mandatory fields gracefully
-- Suggest data normalization for better matching
-- Account for international address formats
-- Consider name variations and aliases
-- Handle incomplete person vs. entity classification
-- Manage data encoding and character set issues
-
-Remember: Your goal is to maximize screening accuracy while minimizing false positives, ensuring compliance requirements are met efficiently and effectively.
+    sys = static_system_message()
+
+    human = HumanMessage(content=f"""
+The user now can ask questions about this result and ask you to improve it.
+The user question might be a general question about the Screening API. For this you can use the information from the documentation excerpts provided below.
+The user can ask a question or suggest an improvement to the mapping result. 
+Please answer the question or implement the suggested improvement.
 
 Available configuration:
 {context_str}
@@ -1358,26 +1087,48 @@ Available configuration:
 Document excerpts:
 {snippets_text}
 
-        """
-    )
+User question: {question}
+""")
 
-    human = HumanMessage(content=f"""
-The user now can ask questions about this result and ask you to improve it.
-The user question might be a general question about the Screening API. For this you can use the information from the documentation excerpts provided below.
-The user can ask a question or suggest an improvement to the mapping result. 
-Please answer the question or implement the suggested improvement.
+    history = window_history(
+        messages, state, mapping_result=state.get("mapping_result"))
+    check_context_budget("qa_mode", static_prefix_tokens(),
+                         count_message_tokens([*history.messages, human], Config.OPENAI_MODEL))
+    return history, [sys, *history.messages, human]
 
-User question: {question}
 
-""")
+def _revises_mapping(content: Any) -> bool:
+    """True for answers that contain a (revised) mapping: the system prompt requires a
+    Field Mapping Table with every mapping."""
+    return isinstance(content, str) and "field mapping table" in content.lower() and bool(
+        re.search(r"^\s*\|.*\|\s*$", content, re.MULTILINE))
 
-    resp = llm.invoke([sys, *messages, human])
+
+def _qa_update(history: HistoryWindow, resp: BaseMessage) -> dict:
+    log_prompt_cache_usage("qa_mode", resp)
 
     # Preserve any resume flag so the next node can restore the proper
     # interrupt (for example, the ask_endpoints interrupt).
-    return {
+    update = {
         "messages": [resp],
+        **history.state_update(),
     }
+    # A revised mapping supersedes the pinned one once the answer leaves the window
+    if _revises_mapping(resp.content):
+        update["mapping_result"] = resp.content
+    return update
+
+
+def qa_mode_node(state: ApiMappingState) -> dict:
+    """Handle free-flowing Q&A after the initial flow is completed."""
+    history, prompt = _qa_prompt(state)
+    return _qa_update(history, mapping_qa_llm.invoke(prompt))
+
+
+async def aqa_mode_node(state: ApiMappingState) -> dict:
+    """Handle free-flowing Q&A after the initial flow is completed."""
+    history, prompt = await asyncio.to_thread(_qa_prompt, state)
+    return _qa_update(history, await mapping_qa_llm.ainvoke(prompt))
 
 
 def route_from_qa_mode(state: ApiMappingState, config: RunnableConfig) -> str:
@@ -39,3 +39,7 @@ class ApiMappingState(TypedDict):
     rag_snippets: List[str]
 
     mapping_result: str | None
+
+    # Rolling summary of the thread messages that no longer fit the history window
+    history_summary: str | None
+    history_summarized_count: int
@@ -0,0 +1,138 @@
+"""In-process BM25 index over the chunks of a vector store.
+
+Embedding search is weak at exact API identifiers (`suppressLogging`,
+`clientIdentCode`, ...). The lexical index is built over the same chunk ids as the
+vector store, persisted next to it and kept in sync by `rag.sync_index`.
+"""
+
+import json
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BM25_FILENAME = "bm25_index.json"
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_.]*[A-Za-z0-9_]|[A-Za-z0-9]+")
+_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def _is_identifier(word: str) -> bool:
+    # camelCase / PascalCase with an inner capital, snake_case or dotted.path
+    return bool(re.search(r"[a-z][A-Z]", word)) or "_" in word or "." in word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms. Identifiers are kept whole and additionally split into their
+    parts, so `suppressLogging` matches both the exact name and "suppress logging".
+    """
+    terms: List[str] = []
+    for word in _WORD_RE.findall(text):
+        terms.append(word.lower())
+        if _is_identifier(word):
+            parts = [p.lower() for p in _PART_RE.findall(word)]
+            if len(parts) > 1:
+                terms.extend(parts)
+    return terms
+
+
+def identifiers(text: str) -> List[str]:
+    """The identifier-like words of `text`, lowercased."""
+    return [w.lower() for w in _WORD_RE.findall(text) if _is_identifier(w)]
+
+
+class BM25Index:
+    """Okapi BM25 over chunk ids, with the chunk text and source kept for lookups."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict] = {}   # id -> {"text", "source", "tf"}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self.docs
+
+    def add(self, id_: str, text: str, source: str = "") -> None:
+        if id_ in self.docs:
+            return
+        tf: Dict[str, int] = {}
+        for term in tokenize(text):
+            tf[term] = tf.get(term, 0) + 1
+        self._index(id_, {"text": text, "source": source, "tf": tf})
+
+    def _index(self, id_: str, doc: Dict) -> None:
+        self.docs[id_] = doc
+        doc["len"] = sum(doc["tf"].values())
+        self._total_len += doc["len"]
+        for term, count in doc["tf"].items():
+            self._postings.setdefault(term, {})[id_] = count
+
+    def remove(self, id_: str) -> None:
+        doc = self.docs.pop(id_, None)
+        if doc is None:
+            return
+        self._total_len -= doc["len"]
+        for term in doc["tf"]:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(id_, None)
+                if not posting:
+                    del self._postings[term]
+
+    def document_frequency(self, term: str) -> int:
+        return len(self._postings.get(term, ()))
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """Return up to `k` (chunk id, score) pairs, best first."""
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        avg_len = self._total_len / n or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for id_, tf in posting.items():
+                norm = tf + self.k1 * \
+                    (1 - self.b + self.b * self.docs[id_]["len"] / avg_len)
+                scores[id_] = scores.get(id_, 0.0) + \
+                    idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+    def reconcile(self, live_ids: Iterable[str]) -> List[str]:
+        """Drop chunks that are no longer live; return the live ids still missing here."""
+        live = set(live_ids)
+        for id_ in [i for i in self.docs if i not in live]:
+            self.remove(id_)
+        return [i for i in live if i not in self.docs]
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "k1": self.k1, "b": self.b,
+            "docs": {id_: {"text": d["text"], "source": d["source"], "tf": d["tf"]}
+                     for id_, d in self.docs.items()},
+        }), encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BM25Index"]:
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"[warn] Could not read BM25 index {path}: {e}")
+            return None
+        index = cls(data.get("k1", 1.5), data.get("b", 0.75))
+        for id_, doc in data.get("docs", {}).items():
+            index._index(id_, doc)
+        return index
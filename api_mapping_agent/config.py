@@ -21,5 +21,131 @@ class Config:
     KNOWLEDGE_BASE_VECTOR_STORE = WRITABLE_ROOT / "vectorstore_min"
     API_DATA_DIR = WRITABLE_ROOT / "api_data"
     API_DATA_VECTOR_STORE = WRITABLE_ROOT / "api_data_vectorstore"
+    # Large API metadata files are not sent through the interrupt payload: the UI
+    # writes them here and passes the path. Files above SCHEMA_STREAMING_MIN_BYTES are
+    # never read whole; a streaming parser reduces them to a field catalog
+    API_UPLOAD_DIR = WRITABLE_ROOT / "uploads"
+    API_UPLOAD_MAX_MB = int(os.getenv("API_UPLOAD_MAX_MB", "1024"))
+    SCHEMA_STREAMING_MIN_BYTES = int(
+        os.getenv("SCHEMA_STREAMING_MIN_BYTES", str(5 * 1024 * 1024)))
+    # Uploaded API data is stored by content hash and shared by all threads; thread
+    # references unused for API_DATA_TTL seconds and the objects no thread references
+    # any more are evicted (checked at most every API_DATA_JANITOR_INTERVAL seconds).
+    # The vector collection of an upload is dropped API_DATA_INDEX_TTL seconds after
+    # its last use (0 = kept as long as the upload)
+    API_DATA_TTL = float(os.getenv("API_DATA_TTL", str(7 * 24 * 3600)))
+    API_DATA_INDEX_TTL = float(os.getenv("API_DATA_INDEX_TTL", str(24 * 3600)))
+    API_DATA_JANITOR_INTERVAL = float(
+        os.getenv("API_DATA_JANITOR_INTERVAL", "3600"))
+    # Context window of OPENAI_MODEL and the share of it kept free for the answer
+    MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "128000"))
+    MODEL_OUTPUT_RESERVE_TOKENS = int(
+        os.getenv("MODEL_OUTPUT_RESERVE_TOKENS", "16384"))
+    # Thread history sent with each LLM call; older turns are folded into a rolling
+    # summary, after which the newest turns fill HISTORY_KEEP_RATIO of the budget
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "12000"))
+    HISTORY_KEEP_RATIO = float(os.getenv("HISTORY_KEEP_RATIO", "0.6"))
+    # Persistent response cache for temperature 0 LLM calls: "read_through",
+    # "write_only" (record, never serve) or "disabled"; TTL in seconds
+    LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "read_through").lower()
+    LLM_CACHE_PATH = WRITABLE_ROOT / "llm_cache.sqlite3"
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+    # Client-side OpenAI limits shared by all threads of the process (requests and
+    # tokens per minute, requests in flight; 0 disables a limit). Chat calls reserve
+    # the prompt tokens plus OPENAI_CHAT_COMPLETION_ESTIMATE until the usage is known
+    OPENAI_CHAT_RPM = int(os.getenv("OPENAI_CHAT_RPM", "500"))
+    OPENAI_CHAT_TPM = int(os.getenv("OPENAI_CHAT_TPM", "450000"))
+    OPENAI_CHAT_MAX_CONCURRENCY = int(
+        os.getenv("OPENAI_CHAT_MAX_CONCURRENCY", "16"))
+    OPENAI_CHAT_COMPLETION_ESTIMATE = int(
+        os.getenv("OPENAI_CHAT_COMPLETION_ESTIMATE", "1000"))
+    OPENAI_EMBEDDINGS_RPM = int(os.getenv("OPENAI_EMBEDDINGS_RPM", "3000"))
+    OPENAI_EMBEDDINGS_TPM = int(os.getenv("OPENAI_EMBEDDINGS_TPM", "1000000"))
+    OPENAI_EMBEDDINGS_MAX_CONCURRENCY = int(
+        os.getenv("OPENAI_EMBEDDINGS_MAX_CONCURRENCY", "8"))
+    # Identical concurrent LLM and embedding requests share one upstream call
+    SINGLE_FLIGHT_ENABLED = os.getenv(
+        "SINGLE_FLIGHT_ENABLED", "true").lower() in {"1", "true", "yes"}
+    # Model per call route. Short RAG-grounded answers go to the fast model, the
+    # mapping to the strongest one; mapping and its follow-up Q&A share the cached
+    # prompt prefix, which only pays off while both run on the same model
+    LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+    LLM_ROUTE_MODELS = {
+        "side_question": os.getenv("LLM_MODEL_SIDE_QUESTION", LLM_FAST_MODEL),
+        "docs": os.getenv("LLM_MODEL_DOCS", LLM_FAST_MODEL),
+        "error_help": os.getenv("LLM_MODEL_ERROR_HELP", LLM_FAST_MODEL),
+        "summary": os.getenv("LLM_MODEL_SUMMARY", LLM_FAST_MODEL),
+        "validation": os.getenv("LLM_MODEL_VALIDATION", OPENAI_MODEL),
+        "mapping": os.getenv("LLM_MODEL_MAPPING", OPENAI_MODEL),
+        "mapping_qa": os.getenv("LLM_MODEL_MAPPING_QA", OPENAI_MODEL),
+    }
+    # Answers of these routes that fail the cheap check (empty, cut off at the token
+    # limit, filtered) are asked again on LLM_ESCALATION_MODEL
+    LLM_ESCALATION_MODEL = os.getenv("LLM_ESCALATION_MODEL", OPENAI_MODEL)
+    LLM_ESCALATING_ROUTES = {
+        r.strip() for r in os.getenv(
+            "LLM_ESCALATING_ROUTES", "side_question,docs,error_help").split(",") if r.strip()}
+    # "chroma" or "numpy" (brute-force search over a memory-mapped matrix, which
+    # opens and queries faster for small corpora such as the knowledge base)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+    # Persistent cache of chunk embeddings, shared by all stores
+    EMBEDDING_CACHE_ENABLED = os.getenv(
+        "EMBEDDING_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+    EMBEDDING_CACHE_PATH = WRITABLE_ROOT / "embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+    # Embedding request packing (OpenAI allows 300k tokens per request; the
+    # LangChain client sends at most 1000 inputs per request)
+    EMBEDDING_MAX_TOKENS_PER_BATCH = int(
+        os.getenv("EMBEDDING_MAX_TOKENS_PER_BATCH", "250000"))
+    EMBEDDING_MAX_INPUTS_PER_BATCH = int(
+        os.getenv("EMBEDDING_MAX_INPUTS_PER_BATCH", "1000"))
+    EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+    # Indexing pipeline: files are read on threads and split on processes once the
+    # input is large enough to amortize the process start-up
+    INDEX_READ_THREADS = int(os.getenv("INDEX_READ_THREADS", "8"))
+    INDEX_SPLIT_PROCESSES = int(
+        os.getenv("INDEX_SPLIT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+    INDEX_PARALLEL_MIN_BYTES = int(
+        os.getenv("INDEX_PARALLEL_MIN_BYTES", str(2 * 1024 * 1024)))
+    INDEX_PIPELINE_WINDOW = int(os.getenv("INDEX_PIPELINE_WINDOW", "16"))
+    # Chunks at least this similar (estimated Jaccard over word shingles) to a chunk
+    # of another file are not embedded again; 0 disables near-duplicate filtering
+    NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))
+    # In-process LRU caches for query embeddings and final rag_search results
+    # (TTL in seconds, 0 = no expiry; a size of 0 disables the cache)
+    QUERY_EMBEDDING_CACHE_SIZE = int(
+        os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    QUERY_EMBEDDING_CACHE_TTL = float(
+        os.getenv("QUERY_EMBEDDING_CACHE_TTL", "0"))
+    RAG_RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "256"))
+    RAG_RESULT_CACHE_TTL = float(os.getenv("RAG_RESULT_CACHE_TTL", "3600"))
+    # Semantic answer cache of the documentation Q&A graph (cosine similarity of
+    # question embeddings; TTL in seconds)
+    SEMANTIC_CACHE_ENABLED = os.getenv(
+        "SEMANTIC_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+    SEMANTIC_CACHE_THRESHOLD = float(
+        os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(
+        os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+    SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "21600"))
+    # rag_search fuses BM25 and vector rankings; an identifier query whose best BM25
+    # hit outscores the runner-up by this factor is answered without embedding it
+    RAG_HYBRID_SEARCH = os.getenv(
+        "RAG_HYBRID_SEARCH", "true").lower() in {"1", "true", "yes"}
+    RAG_LEXICAL_DECISIVE_RATIO = float(
+        os.getenv("RAG_LEXICAL_DECISIVE_RATIO", "2.0"))
+    # Customer API data too large for the prompt is searched with one query per AEB
+    # field group, run concurrently; the fused hits are capped at RAG_MULTI_QUERY_MAX_RESULTS
+    RAG_MULTI_QUERY_K = int(os.getenv("RAG_MULTI_QUERY_K", "4"))
+    RAG_MULTI_QUERY_MAX_RESULTS = int(
+        os.getenv("RAG_MULTI_QUERY_MAX_RESULTS", "12"))
+    RAG_MULTI_QUERY_THREADS = int(os.getenv("RAG_MULTI_QUERY_THREADS", "6"))
+    # Customer API data above this many tokens is reduced to the candidate table of the
+    # deterministic field pre-matcher plus the objects around the candidates (0 = off)
+    FIELD_MATCH_MIN_TOKENS = int(os.getenv("FIELD_MATCH_MIN_TOKENS", "8000"))
+    FIELD_MATCH_MIN_SCORE = float(os.getenv("FIELD_MATCH_MIN_SCORE", "0.6"))
+    FIELD_MATCH_TOP_K = int(os.getenv("FIELD_MATCH_TOP_K", "5"))
     ENDPOINTS_HELP_URL = os.getenv(
         "AEB_ENDPOINTS_HELP_URL", "<link-zu-Erläuterungen-für-Endpoints>")
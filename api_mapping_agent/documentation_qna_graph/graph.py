@@ -3,6 +3,7 @@ from langgraph.graph import StateGraph, START, END
 from api_mapping_agent.documentation_qna_graph.state import DocumentationQnaState, QnaNodeNames
 from api_mapping_agent.documentation_qna_graph.nodes import (
     welcome_node,
+    aanswer_question_node,
     answer_question_node,
     route_from_welcome,
     route_from_answer
@@ -17,12 +18,13 @@ if root_dir not in sys.path:
     sys.path.insert(0, root_dir)
 
 
-def create_documentation_qna_graph() -> StateGraph:
-    """Create the documentation Q&A subgraph."""
+def create_documentation_qna_graph(use_async: bool = False) -> StateGraph:
+    """Create the documentation Q&A subgraph (with a coroutine answer node if `use_async`)."""
 
     g = StateGraph(DocumentationQnaState)
 
-    g.add_node(QnaNodeNames.ANSWER_QUESTION, answer_question_node)
+    g.add_node(QnaNodeNames.ANSWER_QUESTION,
+               aanswer_question_node if use_async else answer_question_node)
 
     g.add_edge(START, QnaNodeNames.ANSWER_QUESTION)
     g.add_conditional_edges(QnaNodeNames.ANSWER_QUESTION, route_from_answer)
@@ -31,3 +33,6 @@ def create_documentation_qna_graph() -> StateGraph:
 
 
 documentation_qna_graph = create_documentation_qna_graph().compile()
+# Registered with the LangGraph server, see langgraph.json
+documentation_qna_graph_async = create_documentation_qna_graph(
+    use_async=True).compile()
@@ -1,16 +1,44 @@
 from __future__ import annotations
 from api_mapping_agent.documentation_qna_graph.tools import get_tcm_api_documentation_url
 from api_mapping_agent.utils import get_latest_user_message
-from api_mapping_agent.rag import rag_search, ensure_index_built
-from api_mapping_agent.llm import get_llm
+from api_mapping_agent.rag import rag_search, ensure_index_built, embed_query, index_generation
+from api_mapping_agent.history import HistoryWindow, window_history
+from api_mapping_agent.llm import ainvoke_routed, invoke_routed
+from api_mapping_agent.semantic_cache import SemanticCache
 from .state import DocumentationQnaState, QnaNodeNames
-from typing import Dict, Any
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from typing import Dict, Any, List, NamedTuple, Optional, Sequence, Union
+import asyncio
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END
 from api_mapping_agent.config import Config
 
 
-llm = get_llm().bind_tools([get_tcm_api_documentation_url])
+TOOLS = [get_tcm_api_documentation_url]
+
+# Answers to standalone questions, shared by all threads of this process
+answer_cache = SemanticCache(Config.SEMANTIC_CACHE_THRESHOLD,
+                             Config.SEMANTIC_CACHE_MAX_ENTRIES,
+                             Config.SEMANTIC_CACHE_TTL)
+
+
+class _AnswerRequest(NamedTuple):
+    prompt: List[BaseMessage]
+    history: HistoryWindow
+    search_results: List[str]
+    question_vector: Optional[List[float]]
+    generation: int
+
+
+def _use_answer_cache(messages: Sequence[BaseMessage], config: Optional[RunnableConfig]) -> bool:
+    """
+    Only standalone questions are cached: with earlier turns in the thread the answer
+    depends on the conversation. Callers can opt out per request with
+    `{"configurable": {"use_semantic_cache": False}}`.
+    """
+    if not Config.SEMANTIC_CACHE_ENABLED or len(messages) != 1:
+        return False
+    return (config or {}).get("configurable", {}).get("use_semantic_cache", True)
 
 
 def welcome_node(state: DocumentationQnaState) -> Dict[str, Any]:
@@ -49,8 +77,12 @@ def welcome_node(state: DocumentationQnaState) -> Dict[str, Any]:
     return {}
 
 
-def answer_question_node(state: DocumentationQnaState) -> Dict[str, Any]:
-    """Answer user questions using RAG search on the knowledge base."""
+def _prepare_answer(state: DocumentationQnaState, config: Optional[RunnableConfig]) -> Union[Dict[str, Any], _AnswerRequest]:
+    """
+    Look the question up in the answer cache and build the prompt with RAG snippets
+    (blocking embedding and vector store I/O). Returns the node result if no LLM call
+    is needed.
+    """
     messages = state.get("messages", [])
     user_input = get_latest_user_message(messages).strip()
 
@@ -66,9 +98,27 @@ def answer_question_node(state: DocumentationQnaState) -> Dict[str, Any]:
     ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(),
                        Config.KNOWLEDGE_BASE_VECTOR_STORE)
 
+    query = f"API documentation question: {user_input}"
+    question_vector: Optional[List[float]] = None
+    generation = index_generation(Config.KNOWLEDGE_BASE_VECTOR_STORE)
+    if _use_answer_cache(messages, config):
+        try:
+            # Same text as the RAG query, so rag_search reuses this embedding
+            question_vector = embed_query(query)
+            cached = answer_cache.lookup(question_vector, generation)
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            print(f"Semantic cache hit: {answer_cache.stats()}")
+            return {
+                "messages": [AIMessage(content=cached["answer"])],
+                "search_results": list(cached["search_results"]),
+            }
+
     # Perform RAG search on the knowledge base
     try:
-        snippets = rag_search(f"API documentation question: {user_input}")
+        snippets = rag_search(query)
         search_results = snippets if snippets else []
     except Exception as e:
         search_results = []
@@ -106,42 +156,84 @@ If the documentation is not sufficient, use the get_tcm_api_documentation_url to
 Use clear structuring with Markdown formatting.
 """)
 
-    try:
-        conversation_messages = [sys] + list(messages) + [human]
-        ai_response = llm.invoke(conversation_messages)
+    history = window_history(messages, state)
+    return _AnswerRequest([sys] + history.messages + [human], history, search_results,
+                          question_vector, generation)
 
-        response_messages = [ai_response]
 
-        # TODO: Maybe there is a better way to include the info from a Tool call. See ToolNode?
-        tool_calls = getattr(ai_response, 'tool_calls', None)
-        if tool_calls:
-            for tool_call in tool_calls:
-                if tool_call["name"] == "get_tcm_api_documentation_url":
-                    tool_result = get_tcm_api_documentation_url.invoke({})
+def _tool_messages(ai_response: BaseMessage) -> List[BaseMessage]:
+    # TODO: Maybe there is a better way to include the info from a Tool call. See ToolNode?
+    tool_messages: List[BaseMessage] = []
+    for tool_call in getattr(ai_response, 'tool_calls', None) or []:
+        if tool_call["name"] == "get_tcm_api_documentation_url":
+            tool_result = get_tcm_api_documentation_url.invoke({})
 
-                    tool_message = ToolMessage(
-                        content=str(tool_result),
-                        tool_call_id=tool_call["id"]
-                    )
-                    response_messages.append(tool_message)
+            tool_messages.append(ToolMessage(
+                content=str(tool_result),
+                tool_call_id=tool_call["id"]
+            ))
+    return tool_messages
 
-            if len(response_messages) > 1:  # Tool was executed
-                final_conversation = conversation_messages + response_messages
-                final_response = llm.invoke(final_conversation)
-                response_messages.append(final_response)
-
-    except Exception as e:
-        response_messages = [AIMessage(content=(
-            f"Sorry, an error occurred while processing your question: {str(e)}  \n\n"
-            "Please try again or rephrase your question."
-        ))]
 
+def _finish_answer(request: _AnswerRequest, response_messages: List[BaseMessage]) -> Dict[str, Any]:
+    answer = response_messages[-1].content
+    if request.question_vector is not None and isinstance(answer, str) and answer.strip():
+        answer_cache.store(request.question_vector, request.generation, {
+            "answer": answer,
+            "search_results": tuple(request.search_results),
+        })
     return {
         "messages": response_messages,
-        "search_results": search_results,
+        "search_results": request.search_results,
+        **request.history.state_update(),
     }
 
 
+def _error_answer(request: _AnswerRequest, e: Exception) -> Dict[str, Any]:
+    return {
+        "messages": [AIMessage(content=(
+            f"Sorry, an error occurred while processing your question: {str(e)}  \n\n"
+            "Please try again or rephrase your question."
+        ))],
+        "search_results": request.search_results,
+        **request.history.state_update(),
+    }
+
+
+def answer_question_node(state: DocumentationQnaState, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """Answer user questions using RAG search on the knowledge base."""
+    request = _prepare_answer(state, config)
+    if isinstance(request, dict):
+        return request
+    try:
+        response_messages = [invoke_routed("docs", request.prompt, tools=TOOLS)]
+        tool_messages = _tool_messages(response_messages[0])
+        if tool_messages:  # Tool was executed
+            response_messages += tool_messages
+            response_messages.append(
+                invoke_routed("docs", request.prompt + response_messages, tools=TOOLS))
+    except Exception as e:
+        return _error_answer(request, e)
+    return _finish_answer(request, response_messages)
+
+
+async def aanswer_question_node(state: DocumentationQnaState, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """Async `answer_question_node`: retrieval runs in a worker thread, the LLM calls on the event loop."""
+    request = await asyncio.to_thread(_prepare_answer, state, config)
+    if isinstance(request, dict):
+        return request
+    try:
+        response_messages = [await ainvoke_routed("docs", request.prompt, tools=TOOLS)]
+        tool_messages = _tool_messages(response_messages[0])
+        if tool_messages:  # Tool was executed
+            response_messages += tool_messages
+            response_messages.append(
+                await ainvoke_routed("docs", request.prompt + response_messages, tools=TOOLS))
+    except Exception as e:
+        return _error_answer(request, e)
+    return _finish_answer(request, response_messages)
+
+
 def route_from_welcome(state: DocumentationQnaState) -> str:
     """Route from welcome node based on user input."""
     messages = state.get("messages", [])
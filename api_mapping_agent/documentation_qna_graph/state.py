@@ -16,3 +16,6 @@ class DocumentationQnaState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
     search_results: List[str] | None
     completed: bool
+    # Rolling summary of the thread messages that no longer fit the history window
+    history_summary: str | None
+    history_summarized_count: int
@@ -0,0 +1,137 @@
+"""Token-aware, concurrent embedding of index chunks.
+
+Chunks are packed into batches by their real token count (tiktoken) up to the
+provider's per-request limits, embedded with a bounded number of requests in flight,
+and handed to a writer callback on the calling thread. A failing batch is retried on
+its own with exponential backoff, without redoing the other batches.
+"""
+
+import contextvars
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from api_mapping_agent.config import Config
+from api_mapping_agent.tokens import count_tokens
+
+# (text, metadata, id)
+IndexItem = Tuple[str, Dict[str, Any], str]
+# Called with (texts, metadatas, ids, embeddings) for every finished batch
+BatchWriter = Callable[[List[str], List[Dict[str, Any]],
+                        List[str], List[List[float]]], None]
+
+
+class EmbeddingBatch:
+    def __init__(self, number: int):
+        self.number = number
+        self.texts: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self.ids: List[str] = []
+        self.tokens = 0
+
+    def add(self, item: IndexItem, tokens: int) -> None:
+        text, meta, id_ = item
+        self.texts.append(text)
+        self.metas.append(meta)
+        self.ids.append(id_)
+        self.tokens += tokens
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+
+class EmbeddingBatcher:
+    """Pack, embed and write index chunks in concurrent, token-bounded batches."""
+
+    def __init__(
+        self,
+        embedder: Embeddings,
+        writer: BatchWriter,
+        model: Optional[str] = None,
+        max_tokens_per_batch: int = Config.EMBEDDING_MAX_TOKENS_PER_BATCH,
+        max_inputs_per_batch: int = Config.EMBEDDING_MAX_INPUTS_PER_BATCH,
+        max_in_flight: int = Config.EMBEDDING_MAX_IN_FLIGHT,
+        max_retries: int = Config.EMBEDDING_MAX_RETRIES,
+        retry_base_delay: float = 1.0,
+    ):
+        self.embedder = embedder
+        self.writer = writer
+        self.model = model or Config.OPENAI_EMBEDDINGS_MODEL
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_inputs_per_batch = max_inputs_per_batch
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+    def iter_batches(self, items: Iterable[IndexItem]) -> Iterable[EmbeddingBatch]:
+        """Greedily pack items in order without exceeding the batch limits."""
+        batch = EmbeddingBatch(1)
+        for item in items:
+            tokens = count_tokens(item[0], self.model)
+            if len(batch) and (batch.tokens + tokens > self.max_tokens_per_batch
+                               or len(batch) >= self.max_inputs_per_batch):
+                yield batch
+                batch = EmbeddingBatch(batch.number + 1)
+            # A single oversized chunk still gets its own batch; the client splits it
+            batch.add(item, tokens)
+        if len(batch):
+            yield batch
+
+    def _embed_with_retry(self, batch: EmbeddingBatch) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embedder.embed_documents(batch.texts)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.retry_base_delay * \
+                    (2 ** attempt) * (1 + random.random())
+                print(
+                    f"[warn] Embedding batch {batch.number} failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    def run(self, items: Iterable[IndexItem]) -> Dict[str, int]:
+        """Embed and write all items. Raises after all batches ran if any batch failed."""
+        stats = {"batches": 0, "texts": 0, "tokens": 0, "failed_batches": 0}
+        errors: List[BaseException] = []
+
+        def collect(done: Set[Future]) -> None:
+            for fut in done:
+                batch = in_flight.pop(fut)
+                try:
+                    vectors = fut.result()
+                except Exception as e:
+                    print(
+                        f"[ERROR] Embedding batch {batch.number} failed permanently: {e}")
+                    stats["failed_batches"] += 1
+                    errors.append(e)
+                    continue
+                # Writes happen on the calling thread, one batch at a time
+                self.writer(batch.texts, batch.metas, batch.ids, vectors)
+                stats["texts"] += len(batch)
+                print(
+                    f"  Embedded batch {batch.number} ({len(batch)} texts, {batch.tokens:,} tokens)")
+
+        in_flight: Dict[Future, EmbeddingBatch] = {}
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed") as pool:
+            for batch in self.iter_batches(items):
+                stats["batches"] += 1
+                stats["tokens"] += batch.tokens
+                if len(in_flight) >= self.max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                # Workers run in the caller's context, e.g. its rate limiter priority
+                in_flight[pool.submit(contextvars.copy_context().run,
+                                      self._embed_with_retry, batch)] = batch
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        if errors:
+            raise RuntimeError(
+                f"{stats['failed_batches']} of {stats['batches']} embedding batches failed") from errors[0]
+        return stats
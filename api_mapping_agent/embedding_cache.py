@@ -0,0 +1,209 @@
+"""Persistent on-disk cache for document embeddings.
+
+Vectors are stored as float32 blobs in SQLite, keyed by the chunk hash together with
+the embeddings model, so a chunk is only sent to the embeddings API once per model -
+across index rebuilds, sessions and process restarts.
+"""
+
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from api_mapping_agent.cache import TTLCache
+from api_mapping_agent.config import Config
+
+
+class EmbeddingCache:
+    """SQLite-backed vector cache with size-based LRU eviction."""
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._size_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, keys: List[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors for `keys`; missing keys are simply absent."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's host parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[key] = vec.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND key = ?",
+                    [(now, model, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Store vectors and evict least recently used entries if over budget."""
+        if not vectors:
+            return
+        now = time.time()
+        rows = [(model, key, array("f", vec).tobytes(), now)
+                for key, vec in vectors.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._size_bytes += sum(len(r[2]) for r in rows)
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Evict down to 90% of the budget so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        self._size_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 500").fetchall()
+            if not rows:
+                break
+            freed, rowids = 0, []
+            for rowid, size in rows:
+                rowids.append((rowid,))
+                freed += size
+                if self._size_bytes - freed <= target:
+                    break
+            self._conn.executemany(
+                "DELETE FROM embeddings WHERE rowid = ?", rowids)
+            self._size_bytes -= freed
+            self.evictions += len(rowids)
+        self._conn.commit()
+        print(
+            f"Embedding cache evicted down to {self._size_bytes:,} bytes ({self.evictions} evictions so far)")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves document vectors from an `EmbeddingCache`.
+
+    Only `embed_documents` is cached; query embeddings are one-off and pass through.
+    """
+
+    def __init__(self, inner: Embeddings, model: str, cache: EmbeddingCache, key_fn: Callable[[str], str]):
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+        self.key_fn = key_fn
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key_fn(t) for t in texts]
+        found = self.cache.get_many(self.model, keys)
+
+        # Embed every missing key once, even if it occurs several times in `texts`
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            new = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model, new)
+            found.update(new)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that keeps recent query embeddings in an in-process LRU.
+
+    Nodes send the same prefixed questions over and over; a query vector only depends
+    on the text and the model, so entries stay valid across index rebuilds.
+    """
+
+    def __init__(self, inner: Embeddings, model: str, cache: TTLCache):
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.model, text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache configured in `Config`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(Config.EMBEDDING_CACHE_PATH,
+                                    Config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
@@ -1,17 +1,19 @@
 from __future__ import annotations
 from api_mapping_agent.error_detection_graph.state import ErrorDetectionState, ErrorDetectionNodeNames
 from api_mapping_agent.error_detection_graph.nodes import (
+    achat_node,
     chat_node,
     route_chat
 )
 from langgraph.graph import StateGraph, START, END
 
 
-def create_error_detection_graph() -> StateGraph:
-    """Create the error detection subgraph."""
+def create_error_detection_graph(use_async: bool = False) -> StateGraph:
+    """Create the error detection subgraph (with a coroutine chat node if `use_async`)."""
 
     g = StateGraph(ErrorDetectionState)
-    g.add_node(ErrorDetectionNodeNames.CHAT, chat_node)
+    g.add_node(ErrorDetectionNodeNames.CHAT,
+               achat_node if use_async else chat_node)
     g.add_edge(START, ErrorDetectionNodeNames.CHAT)
     g.add_conditional_edges(
         ErrorDetectionNodeNames.CHAT, route_chat, {END: END})
@@ -20,3 +22,5 @@ def create_error_detection_graph() -> StateGraph:
 
 
 error_detection_graph = create_error_detection_graph().compile()
+# Registered with the LangGraph server, see langgraph.json
+error_detection_graph_async = create_error_detection_graph(use_async=True).compile()
@@ -1,24 +1,23 @@
 from __future__ import annotations
 from api_mapping_agent.utils import get_latest_user_message
 from api_mapping_agent.rag import rag_search, ensure_index_built
-from api_mapping_agent.llm import get_llm
+from api_mapping_agent.history import HistoryWindow, window_history
+from api_mapping_agent.llm import ainvoke_routed, invoke_routed
 from .state import ErrorDetectionState
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
 from langgraph.graph import END
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage
 from api_mapping_agent.config import Config
 
 
-llm = get_llm()
-
-
-def chat_node(state: ErrorDetectionState) -> Dict[str, Any]:
-    """Handle conversational API error help."""
+def _chat_prompt(state: ErrorDetectionState) -> Tuple[Optional[Tuple[HistoryWindow, List[BaseMessage]]], Dict[str, Any]]:
+    """Build the chat prompt with RAG snippets; returns (None, node result) if there is nothing to answer."""
     messages = state.get("messages", [])
 
     # If no messages yet, show the welcome message
     if not messages:
-        return {
+        return None, {
             "messages": [
                 AIMessage(content=(
                     """
@@ -36,7 +35,7 @@ def chat_node(state: ErrorDetectionState) -> Dict[str, Any]:
     user_input = get_latest_user_message(messages)
 
     if not user_input or not user_input.strip():
-        return {}
+        return None, {}
 
     ensure_index_built(Config.KNOWLEDGE_BASE_DIR.as_posix(),
                        Config.KNOWLEDGE_BASE_VECTOR_STORE)
@@ -75,14 +74,43 @@ def chat_node(state: ErrorDetectionState) -> Dict[str, Any]:
     ))
 
     human = HumanMessage(content=user_input)
+    history = window_history(messages, state)
+    return (history, [sys, *history.messages, human]), {}
+
+
+def chat_node(state: ErrorDetectionState) -> Dict[str, Any]:
+    """Handle conversational API error help."""
+    prepared, result = _chat_prompt(state)
+    if prepared is None:
+        return result
+    history, prompt = prepared
+    try:
+        response = invoke_routed("error_help", prompt)
+    except Exception as e:
+        response = AIMessage(
+            content=f"Sorry, an error occurred: {str(e)}")
+
+    return {
+        "messages": [response],
+        **history.state_update(),
+    }
+
+
+async def achat_node(state: ErrorDetectionState) -> Dict[str, Any]:
+    """Async `chat_node`: retrieval runs in a worker thread, the LLM call on the event loop."""
+    prepared, result = await asyncio.to_thread(_chat_prompt, state)
+    if prepared is None:
+        return result
+    history, prompt = prepared
     try:
-        response = llm.invoke([sys, *messages, human])
+        response = await ainvoke_routed("error_help", prompt)
     except Exception as e:
         response = AIMessage(
             content=f"Sorry, an error occurred: {str(e)}")
 
     return {
-        "messages": [response]
+        "messages": [response],
+        **history.state_update(),
     }
 
 
@@ -14,3 +14,6 @@ class ErrorDetectionState(TypedDict):
     """State for the error detection subgraph."""
     messages: Annotated[Sequence[BaseMessage], add_messages]
     completed: bool
+    # Rolling summary of the thread messages that no longer fit the history window
+    history_summary: str | None
+    history_summarized_count: int
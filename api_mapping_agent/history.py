@@ -0,0 +1,139 @@
+"""Token-budgeted conversation history for LLM calls.
+
+Nodes used to send the whole thread history with every call, so long sessions grew
+prompt size, latency and cost with every turn. `window_history` keeps the newest
+messages within a token budget and folds older ones into a rolling summary that lives
+in the graph state. The summary is only refreshed when the window overflows, and the
+latest mapping result can be pinned so it never drops out of the context.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.constants import TAG_NOSTREAM
+
+from api_mapping_agent.config import Config
+from api_mapping_agent.tokens import count_message_tokens
+
+# Keys the windowing state is stored under in the graph states
+SUMMARY_KEY = "history_summary"
+SUMMARIZED_COUNT_KEY = "history_summarized_count"
+
+
+class HistoryWindow(NamedTuple):
+    messages: List[BaseMessage]   # summary + pinned result + recent turns, ready for the prompt
+    summary: Optional[str]
+    summarized_count: int         # how many of the oldest thread messages the summary covers
+    updated: bool                 # the summary changed and must be written back to the state
+
+    def state_update(self) -> Dict[str, Any]:
+        """The state keys to return from the node (empty if nothing changed)."""
+        if not self.updated:
+            return {}
+        return {SUMMARY_KEY: self.summary, SUMMARIZED_COUNT_KEY: self.summarized_count}
+
+
+def _tokens(messages: Sequence[BaseMessage]) -> int:
+    return count_message_tokens(messages, Config.OPENAI_MODEL)
+
+
+def _summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+
+
+def _pinned_message(mapping_result: str) -> SystemMessage:
+    return SystemMessage(content=f"Latest mapping result (as revised so far in this conversation):\n{mapping_result}")
+
+
+def _render_transcript(messages: Sequence[BaseMessage]) -> str:
+    lines = []
+    for m in messages:
+        role = {"human": "User", "ai": "Assistant"}.get(m.type, m.type.capitalize())
+        content = m.content if isinstance(m.content, str) else str(m.content)
+        if content.strip():
+            lines.append(f"{role}: {content}")
+    return "\n\n".join(lines)
+
+
+def summarize_messages(previous_summary: Optional[str], messages: Sequence[BaseMessage]) -> str:
+    """Fold `messages` into the rolling summary with the model of the "summary" route."""
+    # Imported here so modules that only window history don't create the client
+    from api_mapping_agent.llm import get_llm
+
+    prompt = [
+        SystemMessage(content=(
+            "You maintain a running summary of a support conversation about mapping customer data "
+            "to the AEB TCM Screening API. Update the summary with the new messages. Keep every "
+            "decision, provided configuration value (endpoints, clientIdentCode, system names), "
+            "field mapping detail and open question. Be concise; use bullet points."
+        )),
+        HumanMessage(content=(
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New messages:\n{_render_transcript(messages)}"
+        )),
+    ]
+    # The nostream tag keeps the summary out of the token stream shown to the user
+    response = get_llm("summary").invoke(prompt, config={"tags": [TAG_NOSTREAM]})
+    return response.content if isinstance(response.content, str) else str(response.content)
+
+
+def _window_start(messages: Sequence[BaseMessage], budget: int) -> int:
+    """Index of the oldest message such that messages[index:] fits into `budget`."""
+    start, used = len(messages), 0
+    while start > 0:
+        cost = _tokens([messages[start - 1]])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    # Never start with tool results whose tool call was cut off
+    while start < len(messages) and isinstance(messages[start], ToolMessage):
+        start += 1
+    return start
+
+
+def window_history(
+    messages: Sequence[BaseMessage],
+    state: Dict[str, Any],
+    budget_tokens: Optional[int] = None,
+    mapping_result: Optional[str] = None,
+) -> HistoryWindow:
+    """
+    Return the history to send for `messages` (the full thread) within `budget_tokens`.
+
+    Messages already covered by the summary in `state` are replaced by it. When the rest
+    does not fit, the oldest messages are summarized so that the newest ones fill about
+    `Config.HISTORY_KEEP_RATIO` of the budget, leaving room for a few more turns before
+    the next summary refresh.
+    """
+    budget = Config.HISTORY_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    summary: Optional[str] = state.get(SUMMARY_KEY)
+    summarized = min(state.get(SUMMARIZED_COUNT_KEY) or 0, len(messages))
+    recent = list(messages[summarized:])
+
+    def assemble(summary_text: Optional[str], window: List[BaseMessage]) -> List[BaseMessage]:
+        head = [_summary_message(summary_text)] if summary_text else []
+        # Pin the mapping result unless it is still part of the window itself
+        if mapping_result and not any(isinstance(m, AIMessage) and m.content == mapping_result for m in window):
+            head.append(_pinned_message(mapping_result))
+        return head + window
+
+    if _tokens(assemble(summary, recent)) <= budget:
+        return HistoryWindow(assemble(summary, recent), summary, summarized, False)
+
+    # Window overflow: fold the oldest recent messages into the summary
+    reserve = _tokens(assemble(summary, []))
+    keep_budget = max(0, int(budget * Config.HISTORY_KEEP_RATIO) - reserve)
+    start = _window_start(recent, keep_budget)
+    folded, window = recent[:start], recent[start:]
+    if folded:
+        try:
+            summary = summarize_messages(summary, folded)
+            summarized += len(folded)
+            print(
+                f"History: summarized {len(folded)} older messages, keeping {len(window)} recent ones")
+        except Exception as e:
+            # Without a summary the old turns are simply dropped from this call
+            print(f"[warn] History summary failed ({e}); dropping {len(folded)} older messages")
+            return HistoryWindow(assemble(summary, window), summary, summarized, False)
+    return HistoryWindow(assemble(summary, window), summary, summarized, bool(folded))
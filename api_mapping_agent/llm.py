@@ -2,23 +2,509 @@
 
 This module provides a single instance of the LangChain LLM to be shared
 across all subgraphs and components, avoiding multiple initializations.
+
+Deterministic (temperature 0) models go through a persistent SQLite response
+cache, so replaying an identical message list does not call the provider again.
+Requests that do reach the provider are coalesced with identical in-flight requests
+(see `singleflight`) and admitted by the shared client-side rate limiter (see
+`rate_limit`).
+
+Nodes ask for the model of their route (`get_llm(route)`): each route runs on the
+model configured in `Config.LLM_ROUTE_MODELS` and records its own latency and token
+metrics (`route_stats()`). `invoke_routed` additionally re-asks the escalation model
+when the routed model's answer fails a cheap check.
 """
 
+import copy
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult, Generation, LLMResult
+from langchain_core.runnables import RunnableConfig, ensure_config
 from langchain_openai import ChatOpenAI
 from api_mapping_agent.config import Config
+from api_mapping_agent.rate_limit import get_rate_limiter
+from api_mapping_agent.singleflight import get_single_flight
+from api_mapping_agent.tokens import count_message_tokens
+
+LLM_CACHE_MODES = ("read_through", "write_only", "disabled")
+
+
+class SQLiteLLMCache(BaseCache):
+    """LangChain response cache in SQLite with TTL and size-based LRU eviction.
+
+    Entries are keyed by a hash of the model string (model name and all call
+    parameters, including bound tools) and the serialized message list.
+    In "write_only" mode responses are recorded but never served.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, ttl: Optional[float] = None, mode: str = "read_through"):
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(
+                f"Unknown LLM cache mode {mode!r}, expected one of {LLM_CACHE_MODES}")
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._size_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        if self.mode != "read_through":
+            return None
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and row[1] + self.ttl < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._size_bytes -= len(row[0])
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return loads(row[0])
+        except Exception as e:
+            print(f"[warn] Could not deserialize cached LLM response: {e}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if self.mode == "disabled":
+            return
+        key = self._key(prompt, llm_string)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT LENGTH(value) FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._conn.commit()
+            self._size_bytes += len(value) - (old[0] if old else 0)
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Expired entries go first, then least recently used down to 90% of the budget
+        if self.ttl:
+            expired = self._conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            self.evictions += max(expired, 0)
+        target = int(self.max_bytes * 0.9)
+        self._size_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses").fetchone()[0]
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(value) FROM responses ORDER BY last_access LIMIT 100").fetchall()
+            if not rows:
+                break
+            freed, rowids = 0, []
+            for rowid, size in rows:
+                rowids.append((rowid,))
+                freed += size
+                if self._size_bytes - freed <= target:
+                    break
+            self._conn.executemany(
+                "DELETE FROM responses WHERE rowid = ?", rowids)
+            self._size_bytes -= freed
+            self.evictions += len(rowids)
+        self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_response_cache: Optional[SQLiteLLMCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[SQLiteLLMCache]:
+    """Return the process-wide LLM response cache, or None if it is disabled."""
+    global _response_cache
+    if Config.LLM_CACHE_MODE == "disabled":
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            try:
+                _response_cache = SQLiteLLMCache(Config.LLM_CACHE_PATH,
+                                                 Config.LLM_CACHE_MAX_MB * 1024 * 1024,
+                                                 Config.LLM_CACHE_TTL,
+                                                 Config.LLM_CACHE_MODE)
+            except (sqlite3.Error, OSError) as e:
+                print(f"[warn] LLM response cache unavailable: {e}")
+                return None
+        return _response_cache
+
+
+def _cache_for(temperature: float) -> Any:
+    # Sampled answers are not reproducible, caching them would freeze one sample.
+    # False (rather than None) keeps a globally set LangChain cache out as well.
+    if temperature != 0:
+        return False
+    return get_response_cache() or False
+
+
+class GovernedChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that waits for the shared chat rate limiter before each request.
+
+    Cache hits are answered before `_generate` is reached and cost no admission.
+    The reservation covers the prompt plus the expected completion and is settled
+    against the reported token usage afterwards. Identical concurrent requests
+    (same model parameters and messages) share one upstream call, streamed or not;
+    every caller gets its own copy of the result, since LangChain stamps run ids
+    into the returned messages.
+    """
+
+    def _estimate_tokens(self, messages: List[BaseMessage]) -> int:
+        completion = self.max_tokens or Config.OPENAI_CHAT_COMPLETION_ESTIMATE
+        return count_message_tokens(messages, self.model_name) + completion
+
+    @staticmethod
+    def _result_tokens(result: ChatResult) -> Optional[int]:
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        return usage.get("total_tokens")
+
+    @staticmethod
+    def _chunk_tokens(chunk: ChatGenerationChunk) -> Optional[int]:
+        usage = getattr(chunk.message, "usage_metadata", None)
+        return usage.get("total_tokens") if usage else None
+
+    def _flight_key(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                    kwargs: Dict[str, Any]) -> Optional[str]:
+        if get_single_flight("chat") is None:
+            return None
+        try:
+            return SQLiteLLMCache._key(dumps(messages), self._get_llm_string(stop=stop, **kwargs))
+        except Exception:
+            return None  # Not serializable, e.g. unusual tool objects
+
+    def _limited_generate(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                          run_manager: Any, **kwargs: Any) -> ChatResult:
+        with get_rate_limiter("chat").limit(self._estimate_tokens(messages)) as reservation:
+            result = super()._generate(messages, stop=stop,
+                                       run_manager=run_manager, **kwargs)
+            reservation.used(self._result_tokens(result))
+            return result
+
+    async def _limited_agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                                 run_manager: Any, **kwargs: Any) -> ChatResult:
+        async with get_rate_limiter("chat").alimit(self._estimate_tokens(messages)) as reservation:
+            result = await super()._agenerate(messages, stop=stop,
+                                              run_manager=run_manager, **kwargs)
+            reservation.used(self._result_tokens(result))
+            return result
+
+    def _limited_stream(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                        run_manager: Any, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        with get_rate_limiter("chat").limit(self._estimate_tokens(messages)) as reservation:
+            for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                reservation.used(self._chunk_tokens(chunk))
+                yield chunk
+
+    async def _limited_astream(self, messages: List[BaseMessage], stop: Optional[List[str]],
+                               run_manager: Any, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async with get_rate_limiter("chat").alimit(self._estimate_tokens(messages)) as reservation:
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                reservation.used(self._chunk_tokens(chunk))
+                yield chunk
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.streaming:
+            # Delegates to _stream, which takes the admission
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        # Without streaming the run manager is not used for the request itself
+        key = self._flight_key(messages, stop, kwargs)
+        if key is None:
+            return self._limited_generate(messages, stop, run_manager, **kwargs)
+        result = get_single_flight("chat").do(
+            key, lambda: self._limited_generate(messages, stop, None, **kwargs))
+        return copy.deepcopy(result)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.streaming:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        key = self._flight_key(messages, stop, kwargs)
+        if key is None:
+            return await self._limited_agenerate(messages, stop, run_manager, **kwargs)
+        result = await get_single_flight("chat").ado(
+            key, lambda: self._limited_agenerate(messages, stop, None, **kwargs))
+        return copy.deepcopy(result)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # With a run manager the OpenAI client reports tokens to that one caller only
+        key = None if run_manager is not None else self._flight_key(messages, stop, kwargs)
+        if key is None:
+            yield from self._limited_stream(messages, stop, run_manager, **kwargs)
+            return
+        shared = get_single_flight("chat").stream(
+            key, lambda: self._limited_stream(messages, stop, None, **kwargs))
+        for chunk in shared:
+            yield copy.deepcopy(chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key = None if run_manager is not None else self._flight_key(messages, stop, kwargs)
+        if key is None:
+            async for chunk in self._limited_astream(messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+        shared = get_single_flight("chat").astream(
+            key, lambda: self._limited_astream(messages, stop, None, **kwargs))
+        async for chunk in shared:
+            yield copy.deepcopy(chunk)
+
+
+class RouteMetrics(BaseCallbackHandler):
+    """Calls, latency and token usage of the LLM calls made on one route.
+
+    Cache hits are counted but left out of the latency and token figures, which
+    describe upstream requests only.
+    """
+
+    run_inline = True
+
+    def __init__(self, route: str, model: str):
+        self.route = route
+        self.model = model
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.escalations = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._started: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]],
+                            *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._started[run_id] = time.monotonic()
+
+    @staticmethod
+    def _usage(response: LLMResult) -> Tuple[bool, int, int]:
+        """(cache hit, prompt tokens, completion tokens) of a finished call."""
+        usage = (response.llm_output or {}).get("token_usage")
+        if usage:
+            return False, usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+        message = getattr(response.generations[0][0], "message", None) if response.generations else None
+        metadata = getattr(message, "usage_metadata", None) or {}
+        # LangChain zeroes the cost of responses served from the cache
+        if metadata.get("total_cost") == 0:
+            return True, 0, 0
+        return False, metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        cached, prompt_tokens, completion_tokens = self._usage(response)
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            self.calls += 1
+            if cached:
+                self.cache_hits += 1
+                return
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            if started is not None:
+                latency = time.monotonic() - started
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._started.pop(run_id, None)
+            self.calls += 1
+            self.errors += 1
+
+    def record_escalation(self) -> None:
+        with self._lock:
+            self.escalations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            upstream = self.calls - self.cache_hits - self.errors
+            return {
+                "model": self.model,
+                "calls": self.calls,
+                "cache_hits": self.cache_hits,
+                "errors": self.errors,
+                "escalations": self.escalations,
+                "avg_latency_seconds": self.latency_total / upstream if upstream > 0 else 0.0,
+                "max_latency_seconds": self.latency_max,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
 
 
 # Single LLM instance to be shared across the application
-llm = ChatOpenAI(model=Config.OPENAI_MODEL, temperature=0)
+llm = GovernedChatOpenAI(model=Config.OPENAI_MODEL,
+                         temperature=0, cache=_cache_for(0))
+
+
+_route_llms: Dict[str, ChatOpenAI] = {}
+_route_metrics: Dict[str, RouteMetrics] = {}
+_routes_lock = threading.Lock()
+
+# Pseudo route of the escalation calls of all routes
+ESCALATION_ROUTE = "escalation"
+# Run metadata of an escalation call: id of the rejected message it replaces
+REPLACES_MESSAGE_KEY = "replaces_message_id"
+
 
+def _route_model(route: str) -> str:
+    if route == ESCALATION_ROUTE:
+        return Config.LLM_ESCALATION_MODEL
+    try:
+        return Config.LLM_ROUTE_MODELS[route]
+    except KeyError:
+        raise ValueError(f"Unknown LLM route {route!r}, expected one of "
+                         f"{sorted(Config.LLM_ROUTE_MODELS)}") from None
 
-def get_llm() -> ChatOpenAI:
-    """Get the shared LLM instance.
+
+def get_llm(route: Optional[str] = None) -> ChatOpenAI:
+    """Get the LLM instance of a route, or the shared default instance.
+
+    Args:
+        route: A key of `Config.LLM_ROUTE_MODELS` (e.g. "mapping", "side_question").
 
     Returns:
-        ChatOpenAI: The configured LLM instance.
+        ChatOpenAI: The configured LLM instance. Route instances use the response
+        cache, rate limiter and request coalescing like the default one and report
+        to the route's metrics.
     """
-    return llm
+    if route is None:
+        return llm
+    with _routes_lock:
+        instance = _route_llms.get(route)
+        if instance is None:
+            model = _route_model(route)
+            metrics = _route_metrics[route] = RouteMetrics(route, model)
+            instance = _route_llms[route] = GovernedChatOpenAI(
+                model=model, temperature=0, cache=_cache_for(0),
+                callbacks=[metrics], tags=[f"route:{route}"])
+        return instance
+
+
+def route_stats() -> Dict[str, Dict[str, Any]]:
+    """Latency, token and escalation figures per route used so far."""
+    with _routes_lock:
+        metrics = dict(_route_metrics)
+    return {route: m.stats() for route, m in metrics.items()}
+
+
+def passes_basic_check(response: BaseMessage) -> bool:
+    """Cheap acceptance check: a tool call, or non-empty text that was not cut off."""
+    if getattr(response, "tool_calls", None):
+        return True
+    content = response.content if isinstance(response.content, str) else str(response.content)
+    if not content.strip():
+        return False
+    finish_reason = response.response_metadata.get("finish_reason")
+    return finish_reason not in {"length", "content_filter"}
+
+
+def _escalates(route: str) -> bool:
+    return (route in Config.LLM_ESCALATING_ROUTES
+            and Config.LLM_ESCALATION_MODEL != _route_model(route))
+
+
+def _bind(instance: ChatOpenAI, tools: Optional[Sequence[Any]]) -> Any:
+    return instance.bind_tools(tools) if tools else instance
+
+
+def _escalation_config(config: Optional[Dict[str, Any]], rejected: BaseMessage) -> RunnableConfig:
+    """Config of the escalation call. The rejected answer was already streamed; its id
+    in the run metadata lets the UI replace it with the escalated one."""
+    # Merged into the inherited run config, whose metadata the graph's streaming needs
+    config = ensure_config(config)
+    config["metadata"] = {**config.get("metadata", {}), REPLACES_MESSAGE_KEY: rejected.id}
+    return config
+
+
+def invoke_routed(route: str, messages: List[BaseMessage], config: Optional[Dict[str, Any]] = None,
+                  tools: Optional[Sequence[Any]] = None,
+                  check: Callable[[BaseMessage], bool] = passes_basic_check) -> AIMessage:
+    """Invoke the model of `route`; escalate once if the answer fails `check`."""
+    response = _bind(get_llm(route), tools).invoke(messages, config=config)
+    if check(response) or not _escalates(route):
+        return response
+    _route_metrics[route].record_escalation()
+    print(f"LLM route {route}: answer failed the check, asking {Config.LLM_ESCALATION_MODEL}")
+    return _bind(get_llm(ESCALATION_ROUTE), tools).invoke(
+        messages, config=_escalation_config(config, response))
+
+
+async def ainvoke_routed(route: str, messages: List[BaseMessage], config: Optional[Dict[str, Any]] = None,
+                         tools: Optional[Sequence[Any]] = None,
+                         check: Callable[[BaseMessage], bool] = passes_basic_check) -> AIMessage:
+    """Async `invoke_routed`."""
+    response = await _bind(get_llm(route), tools).ainvoke(messages, config=config)
+    if check(response) or not _escalates(route):
+        return response
+    _route_metrics[route].record_escalation()
+    print(f"LLM route {route}: answer failed the check, asking {Config.LLM_ESCALATION_MODEL}")
+    return await _bind(get_llm(ESCALATION_ROUTE), tools).ainvoke(
+        messages, config=_escalation_config(config, response))
 
 
 def create_custom_llm(model: str | None = None, temperature: float = 0) -> ChatOpenAI:
@@ -29,7 +515,8 @@ def create_custom_llm(model: str | None = None, temperature: float = 0) -> ChatO
         temperature: The temperature setting (defaults to 0)
 
     Returns:
-        ChatOpenAI: A new LLM instance with custom parameters.
+        ChatOpenAI: A new LLM instance with custom parameters. Only
+        temperature 0 instances use the response cache.
     """
     model = model or Config.OPENAI_MODEL
-    return ChatOpenAI(model=model, temperature=temperature)
+    return GovernedChatOpenAI(model=model, temperature=temperature, cache=_cache_for(temperature))
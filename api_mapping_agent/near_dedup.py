@@ -0,0 +1,97 @@
+"""Corpus-wide near-duplicate detection for index chunks (MinHash LSH).
+
+Chunks are turned into word shingles, summarized as MinHash signatures and bucketed
+with locality sensitive hashing. A chunk whose estimated Jaccard similarity to an
+already seen chunk reaches the threshold is reported as a duplicate of it.
+"""
+
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_PRIME = (1 << 31) - 1
+
+
+def _shingles(text: str, size: int) -> List[str]:
+    words = text.lower().split()
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Pick (bands, rows) whose LSH threshold (1/b)^(1/r) lies just below `threshold`."""
+    best = (num_perm, 1)
+    best_gap = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        lsh_threshold = (1 / bands) ** (1 / rows)
+        # Candidates are verified afterwards, so err on the side of recall
+        if lsh_threshold <= threshold and threshold - lsh_threshold < best_gap:
+            best, best_gap = (bands, rows), threshold - lsh_threshold
+    return best
+
+
+class MinHashLSH:
+    """MinHash signatures + banded LSH index with similarity verification."""
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[str]]] = [
+            {} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._payloads: Dict[str, Any] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+             for s in _shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        ) & np.uint64(_PRIME)
+        # (a * x + b) mod p stays below 2^62, so uint64 cannot overflow
+        permuted = (hashes[:, None] * self._a + self._b) % np.uint64(_PRIME)
+        return permuted.min(axis=0)
+
+    def _band_keys(self, sig: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def insert(self, key: str, text: str, payload: Any = None, sig: Optional[np.ndarray] = None) -> None:
+        """Index `text` under `key`. Re-inserting a known key only updates its payload."""
+        self._payloads[key] = payload
+        if key in self._signatures:
+            return
+        sig = self.signature(text) if sig is None else sig
+        self._signatures[key] = sig
+        for band, band_key in self._band_keys(sig):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def query(self, text: str, accept=None, sig: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Return the key of the most similar indexed chunk at or above the threshold.
+        `accept(key, payload)` can veto candidates.
+        """
+        sig = self.signature(text) if sig is None else sig
+        candidates = set()
+        for band, band_key in self._band_keys(sig):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        best, best_sim = None, 0.0
+        for key in candidates:
+            if accept is not None and not accept(key, self._payloads[key]):
+                continue
+            sim = float(np.mean(self._signatures[key] == sig))
+            if sim >= self.threshold and sim > best_sim:
+                best, best_sim = key, sim
+        return best
+
+    def __len__(self) -> int:
+        return len(self._signatures)
@@ -1,15 +1,30 @@
 import hashlib
 import json
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter, RecursiveJsonSplitter, MarkdownTextSplitter
-from langchain_chroma import Chroma
 
+from api_mapping_agent.bm25 import BM25_FILENAME, BM25Index, identifiers
+from api_mapping_agent.cache import TTLCache
 from api_mapping_agent.config import Config
+from api_mapping_agent.embedding_batcher import EmbeddingBatcher
+from api_mapping_agent.embedding_cache import CachedEmbeddings, CachedQueryEmbeddings, get_embedding_cache
+from api_mapping_agent.near_dedup import MinHashLSH
+from api_mapping_agent.rate_limit import GovernedEmbeddings, Priority, get_rate_limiter, priority
+from api_mapping_agent.schema_splitters import SCHEMA_SUFFIXES, chunk_path, split_schema
+from api_mapping_agent.singleflight import CoalescingEmbeddings, get_single_flight
+from api_mapping_agent.vectorstores import COLLECTIONS_DIR, ChromaBackend, VectorBackend, open_backend
 
-ALLOWED_EXTS = {".md", ".txt", ".json", ".yaml", ".yml"}
+ALLOWED_EXTS = {".md", ".txt", ".json", ".yaml", ".yml", ".xml", ".xsd", ".csv"}
 
 
 def _normalize_text(s: str) -> str:
@@ -20,8 +35,148 @@ def _hash_text(s: str) -> str:
     return hashlib.sha1(_normalize_text(s).encode("utf-8")).hexdigest()
 
 
-def _embedder() -> OpenAIEmbeddings:
-    return OpenAIEmbeddings(model=Config.OPENAI_EMBEDDINGS_MODEL)
+# Process-wide registry of open vector stores and embedding clients.
+# Opening a store (e.g. Chroma's SQLite + client startup) and creating a new OpenAI client on every
+# query is expensive, so every store_dir gets exactly one shared handle. The LangGraph
+# server runs nodes on worker threads, therefore all access goes through the lock.
+_REGISTRY_LOCK = threading.RLock()
+_vectorstores: Dict[str, VectorBackend] = {}
+_embedders: Dict[str, Embeddings] = {}
+_bm25_indexes: Dict[str, BM25Index] = {}
+# Bumped whenever a store changes; part of every result cache key
+_generations: Dict[str, int] = {}
+
+_query_embedding_cache = TTLCache(Config.QUERY_EMBEDDING_CACHE_SIZE,
+                                  Config.QUERY_EMBEDDING_CACHE_TTL, "query_embeddings")
+_result_cache = TTLCache(Config.RAG_RESULT_CACHE_SIZE,
+                         Config.RAG_RESULT_CACHE_TTL, "rag_results")
+
+# Reciprocal rank fusion constant (Cormack et al.)
+RRF_K = 60
+
+
+def _store_key(store_dir: Path, collection: Optional[str] = None) -> str:
+    key = str(Path(store_dir).resolve())
+    return f"{key}#{collection}" if collection else key
+
+
+def _meta_dir(store_dir: Path, collection: Optional[str] = None) -> Path:
+    """Directory of the manifest and BM25 index of a store or one of its collections."""
+    return Path(store_dir) / COLLECTIONS_DIR / collection if collection else Path(store_dir)
+
+
+def _embedder() -> Embeddings:
+    model = Config.OPENAI_EMBEDDINGS_MODEL
+    with _REGISTRY_LOCK:
+        embedder = _embedders.get(model)
+        if embedder is None:
+            # Innermost, so cache hits never wait for the rate limiter
+            embedder = GovernedEmbeddings(OpenAIEmbeddings(
+                model=model), model, get_rate_limiter("embeddings"))
+            flight = get_single_flight("embeddings")
+            if flight is not None:
+                # Identical concurrent requests (cache misses) share one upstream call
+                embedder = CoalescingEmbeddings(embedder, model, flight)
+            if Config.EMBEDDING_CACHE_ENABLED:
+                # Identical chunks (by normalized hash) are embedded only once per model
+                embedder = CachedEmbeddings(
+                    embedder, model, get_embedding_cache(), _hash_text)
+            if Config.QUERY_EMBEDDING_CACHE_SIZE > 0:
+                embedder = CachedQueryEmbeddings(
+                    embedder, model, _query_embedding_cache)
+            _embedders[model] = embedder
+        return embedder
+
+
+def embed_query(query: str) -> List[float]:
+    """Embed `query` with the shared embeddings client (served from the query cache if possible)."""
+    return _embedder().embed_query(query)
+
+
+def get_vectorstore(store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE,
+                    collection: Optional[str] = None) -> Optional[VectorBackend]:
+    """
+    Return the shared, already opened vectorstore for `store_dir` (or its named `collection`).
+    Opens the store on first use; returns None if there is no (non-empty) index yet.
+    """
+    key = _store_key(store_dir, collection)
+    with _REGISTRY_LOCK:
+        vs = _vectorstores.get(key)
+        if vs is not None:
+            return vs
+
+        if not _index_exists(_meta_dir(store_dir, collection)):
+            return None
+
+        print(f"Opening vectorstore from {store_dir}" + (f" (collection {collection})..." if collection else "..."))
+        vs = open_backend(store_dir, _embedder(), collection=collection)
+        try:
+            collection_count = vs.count()
+            print(f"Collection contains {collection_count} documents")
+            if collection_count == 0:
+                # Don't cache an empty store, a later build should be picked up
+                print("ERROR: Vectorstore is empty!")
+                return None
+        except Exception as e:
+            print(f"Warning: Could not get collection count: {e}")
+
+        _vectorstores[key] = vs
+        return vs
+
+
+def get_bm25_index(store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE,
+                   collection: Optional[str] = None) -> Optional[BM25Index]:
+    """Return the shared lexical index persisted next to `store_dir`, or None if there is none."""
+    key = _store_key(store_dir, collection)
+    with _REGISTRY_LOCK:
+        index = _bm25_indexes.get(key)
+        if index is None:
+            index = BM25Index.load(_meta_dir(store_dir, collection) / BM25_FILENAME)
+            if index is None or not len(index):
+                return None
+            _bm25_indexes[key] = index
+        return index
+
+
+def index_generation(store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE,
+                     collection: Optional[str] = None) -> int:
+    """A counter that changes whenever the index in `store_dir` is rebuilt or synced with changes."""
+    with _REGISTRY_LOCK:
+        return _generations.get(_store_key(store_dir, collection), 0)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit-rate metrics of the retrieval caches, for sizing them."""
+    stats = {"query_embeddings": _query_embedding_cache.stats(),
+             "rag_results": _result_cache.stats()}
+    if Config.EMBEDDING_CACHE_ENABLED:
+        stats["document_embeddings"] = get_embedding_cache().stats()
+    return stats
+
+
+def invalidate_vectorstore(store_dir: Path, collection: Optional[str] = None) -> None:
+    """
+    Drop the cached handles for `store_dir` so the next access reopens the store.
+    Bumps the index generation, which invalidates cached search results.
+    """
+    with _REGISTRY_LOCK:
+        key = _store_key(store_dir, collection)
+        _generations[key] = _generations.get(key, 0) + 1
+        _bm25_indexes.pop(key, None)
+        if _vectorstores.pop(key, None) is not None:
+            print(f"Invalidated cached vectorstore handle for {store_dir}")
+
+
+def warm_up_vectorstores(*store_dirs: Path) -> None:
+    """
+    Open the given stores ahead of the first query (e.g. at server start).
+    Stores without an index are skipped; nothing is built here.
+    """
+    for store_dir in store_dirs or (Config.KNOWLEDGE_BASE_VECTOR_STORE,):
+        try:
+            get_vectorstore(store_dir)
+        except Exception as e:
+            print(f"[warn] Could not warm up vectorstore {store_dir}: {e}")
 
 
 def _read_text(path: Path) -> Optional[str]:
@@ -62,11 +217,18 @@ def _split_file_by_suffix(path: Path, content: str) -> List[str]:
     suf = path.suffix.lower().strip()
     if suf in {".md", ".markdown"}:
         return _split_markdown(content)
-    elif suf == ".json":
+    if suf in SCHEMA_SUFFIXES:
+        # One chunk per object/record type; documents without fields are split as before
+        try:
+            chunks = split_schema(content, path.name)
+        except Exception as e:
+            print(f"[warn] Schema split failed for {path}: {e}")
+            chunks = []
+        if chunks:
+            return chunks
+    if suf == ".json":
         return _split_json(content)
-    else:
-        # TODO: Maybe add CSV splitter
-        return _split_plain(content)
+    return _split_plain(content)
 
 
 def _dedup_texts(texts: List[str]) -> List[str]:
@@ -82,13 +244,13 @@ def _dedup_texts(texts: List[str]) -> List[str]:
 
 
 def _index_exists(store_dir: Path) -> bool:
-    """Check if a Chroma index already exists in the store directory."""
+    """Check if an index already exists in the store directory."""
     try:
         if not store_dir.exists():
             print(f"DEBUG: Store directory {store_dir} does not exist")
             return False
 
-        # Check if there are any files that suggest a Chroma store exists
+        # Check if there are any files that suggest a store exists
         chroma_files = list(store_dir.glob("*"))
         print(f"DEBUG: Found {len(chroma_files)} files in {store_dir}")
         for f in chroma_files[:5]:  # Show first 5 files
@@ -112,15 +274,12 @@ def debug_vectorstore_contents(store_dir: Path = Config.KNOWLEDGE_BASE_DIR):
             print(f"  - {f.name} ({f.stat().st_size} bytes)")
 
     try:
-        vs = Chroma(persist_directory=str(store_dir),
-                    embedding_function=_embedder())
-        # Try to get collection info
-        collection = vs._collection
-        print(f"Collection name: {collection.name}")
-        print(f"Collection count: {collection.count()}")
+        vs = open_backend(store_dir, _embedder())
+        print(f"Backend: {vs.name}")
+        print(f"Collection count: {vs.count()}")
 
         # Try a simple test query
-        test_results = vs.similarity_search("test", k=1)
+        test_results = vs.search("test", k=1, mmr=False)
         print(f"Test query returned {len(test_results)} results")
         if test_results:
             print(
@@ -167,6 +326,7 @@ def debug_knowledge_base_files(docs_dir: str):
 
 def clear_vectorstore(store_dir: Path):
     """Clear/delete an existing vectorstore to start fresh."""
+    invalidate_vectorstore(store_dir)
     try:
         if store_dir.exists():
             import shutil
@@ -199,327 +359,608 @@ def clear_vectorstore(store_dir: Path):
         raise
 
 
-def build_index_fresh(docs_dir: str, store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE, clear_existing: bool = False):
-    """
-    Build a fresh Chroma store from files in `docs_dir`.
-    If clear_existing=True, removes any existing vectorstore first.
-    """
-    print(f"\n=== BUILDING {'FRESH ' if clear_existing else ''}INDEX ===")
-    print(f"Docs directory: {docs_dir}")
-    print(f"Store directory: {store_dir}")
-    print(f"Clear existing: {clear_existing}")
+MANIFEST_FILENAME = "index_manifest.json"
 
-    if clear_existing:
-        clear_vectorstore(store_dir)
+# Serializes builds/syncs of the same store across worker threads
+_build_locks: Dict[str, threading.Lock] = {}
+_synced_stores: set = set()
 
-    root = Path(docs_dir)
 
-    # Ensure the store directory exists and is writable
-    try:
-        store_dir.mkdir(parents=True, exist_ok=True)
-        # Test write permissions by creating a temporary file
-        test_file = store_dir / "test_write"
-        test_file.write_text("test")
-        test_file.unlink()
-    except (PermissionError, OSError) as e:
-        print(f"[ERROR] Cannot write to directory {store_dir}: {e}")
-        print("Using fallback temporary directory...")
-        import tempfile
-        store_dir = Path(tempfile.mkdtemp(prefix="chroma_"))
-        print(f"Using fallback directory: {store_dir}")
+def _build_lock(store_dir: Path, collection: Optional[str] = None) -> threading.Lock:
+    key = _store_key(store_dir, collection)
+    with _REGISTRY_LOCK:
+        lock = _build_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _build_locks[key] = lock
+        return lock
 
-    # Debug the knowledge base files first
-    debug_knowledge_base_files(docs_dir)
 
-    # Check if index already exists (unless we're clearing)
-    if not clear_existing and _index_exists(store_dir):
-        print(f"Index already exists at {store_dir}, skipping build.")
-        debug_vectorstore_contents(store_dir)
-        return
+def _file_sha(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
 
-    texts: List[str] = []
-    metas: List[Dict[str, Any]] = []
 
-    print(f"Scanning for files in {root}...")
-    file_count = 0
-    for p in root.rglob("*"):
-        if not p.is_file() or p.suffix.lower() not in ALLOWED_EXTS:
-            continue
+def _chunk_id(source: str, text: str) -> str:
+    return _hash_text(source + " :: " + text)
 
-        file_count += 1
-        print(f"Processing file {file_count}: {p.relative_to(root)}")
 
-        content = _read_text(p)
-        if not content:
-            print(f"[warn] Skipping unreadable file: {p}")
-            continue
+def _chunk_metadata(source: str, text: str) -> Dict[str, Any]:
+    """Metadata of a new chunk; schema chunks also carry the path of their object."""
+    path = chunk_path(text)
+    return {"source": source, "path": path} if path else {"source": source}
 
-        print(f"  File content length: {len(content)} characters")
 
-        try:
-            chunks = _split_file_by_suffix(p, content)
-            print(f"  Split into {len(chunks)} chunks")
-        except Exception as e:
-            print(
-                f"[warn] Split failed for {p}: {e}; falling back to plain splitter")
-            chunks = _split_plain(content)
-            print(f"  Fallback split into {len(chunks)} chunks")
+def _iter_source_files(root: Path) -> List[Path]:
+    return sorted(p for p in root.rglob("*")
+                  if p.is_file() and p.suffix.lower() in ALLOWED_EXTS)
 
-        if not chunks:
-            print(f"  No chunks generated for {p}")
-            continue
 
-        # OPTIONAL: small local dedup per file
-        chunks = _dedup_texts(chunks)
-        print(f"  After dedup: {len(chunks)} chunks")
+def _split_and_dedup(p: Path, content: str) -> List[str]:
+    try:
+        chunks = _split_file_by_suffix(p, content)
+        print(f"  Split into {len(chunks)} chunks")
+    except Exception as e:
+        print(
+            f"[warn] Split failed for {p}: {e}; falling back to plain splitter")
+        chunks = _split_plain(content)
+        print(f"  Fallback split into {len(chunks)} chunks")
 
-        texts.extend(chunks)
-        metas.extend([{"source": str(p)}] * len(chunks))
+    # OPTIONAL: small local dedup per file
+    chunks = _dedup_texts(chunks)
+    print(f"  After dedup: {len(chunks)} chunks")
+    return chunks
 
-    print(f"\nTotal processing results:")
-    print(f"Files processed: {file_count}")
-    print(f"Total text chunks: {len(texts)}")
 
-    if not texts:
-        print("[ERROR] No documents found to index!")
-        return
+def _load_manifest(store_dir: Path) -> Optional[Dict[str, Any]]:
+    path = store_dir / MANIFEST_FILENAME
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[warn] Could not read index manifest {path}: {e}")
+        return None
+
+
+def _save_manifest(store_dir: Path, manifest: Dict[str, Any]) -> None:
+    path = store_dir / MANIFEST_FILENAME
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _manifest_matches_config(manifest: Dict[str, Any]) -> bool:
+    """
+    An index can only be synced incrementally with the backend and embeddings model it
+    was built with. Manifests written before these were recorded came from Chroma.
+    """
+    return (manifest.get("backend", "chroma") == Config.VECTOR_BACKEND
+            and manifest.get("embedding_model", Config.OPENAI_EMBEDDINGS_MODEL) == Config.OPENAI_EMBEDDINGS_MODEL)
+
+
+def _manifest_from_collection(vs: VectorBackend) -> Dict[str, Any]:
+    """
+    Bootstrap a manifest for a store that was built before manifests existed.
+    Chunk ids are content hashes, so unchanged chunks are still recognized; the
+    file SHAs are unknown, which just means every file gets re-split once.
+    """
+    files: Dict[str, Dict[str, Any]] = {}
+    try:
+        existing = vs.get()
+    except Exception as e:
+        print(f"[warn] Could not read existing collection: {e}")
+        return {"files": files}
+    for id_, meta in zip(existing.get("ids") or [], existing.get("metadatas") or []):
+        source = (meta or {}).get("source", "")
+        files.setdefault(source, {"sha": None, "ids": []})["ids"].append(id_)
+    return {"files": files}
 
-    print(f"Building Chroma vectorstore at {store_dir}...")
 
-    # Build or load persistent store, then add docs with stable ids (content hash)
+def _open_vectorstore(store_dir: Path, collection: Optional[str] = None) -> Tuple[VectorBackend, Path]:
+    """Open (or create) the persistent store used for writing."""
     try:
-        vs = Chroma(persist_directory=str(store_dir),
-                    embedding_function=_embedder())
+        vs = open_backend(store_dir, _embedder(), collection=collection)
     except Exception as e:
-        print(f"[ERROR] Failed to create ChromaDB at {store_dir}: {e}")
+        print(f"[ERROR] Failed to create vectorstore at {store_dir}: {e}")
         # Try with a fresh temporary directory
         import tempfile
         store_dir = Path(tempfile.mkdtemp(prefix="chroma_fallback_"))
         print(f"Retrying with fresh directory: {store_dir}")
-        vs = Chroma(persist_directory=str(store_dir),
-                    embedding_function=_embedder())
-
-    # Chroma.add_texts allows ids, but raises on duplicates; since we only build once per process,
-    # we can just add once here. If you call build_index repeatedly in the same process, hash IDs help.
-    ids = [_hash_text(m["source"] + " :: " + t) for t, m in zip(texts, metas)]
+        vs = open_backend(store_dir, _embedder())
+    return vs, store_dir
 
-    print(f"Adding {len(texts)} texts to vectorstore...")
 
-    # Estimate total tokens (rough estimate: 4 chars per token)
-    total_chars = sum(len(t) for t in texts)
-    estimated_tokens = total_chars // 4
-    # Conservative limit (OpenAI limit is 300k)
-    MAX_TOKENS_PER_REQUEST = 250000
+class _VectorstoreWriter:
+    """Batch writer for `EmbeddingBatcher` that upserts precomputed embeddings into the store."""
 
-    # Only batch if estimated tokens exceed the limit
-    use_batching = estimated_tokens > MAX_TOKENS_PER_REQUEST
-
-    if use_batching:
-        print(
-            f"⚠️  Large dataset detected (~{estimated_tokens:,} tokens). Using batched processing...")
-        BATCH_SIZE = 100
+    def __init__(self, vs: VectorBackend):
+        self.vs = vs
+        self.persisted = True
 
-    try:
-        if use_batching:
-            total_batches = (len(texts) + BATCH_SIZE - 1) // BATCH_SIZE
-            for i in range(0, len(texts), BATCH_SIZE):
-                batch_num = (i // BATCH_SIZE) + 1
-                batch_texts = texts[i:i + BATCH_SIZE]
-                batch_metas = metas[i:i + BATCH_SIZE]
-                batch_ids = ids[i:i + BATCH_SIZE]
-                print(
-                    f"  Adding batch {batch_num}/{total_batches} ({len(batch_texts)} texts)...")
-                vs.add_texts(texts=batch_texts,
-                             metadatas=batch_metas, ids=batch_ids)
-        else:
-            vs.add_texts(texts=texts, metadatas=metas, ids=ids)
-    except Exception as e:
-        if "readonly database" in str(e).lower():
+    def __call__(self, texts: List[str], metas: List[Dict[str, Any]], ids: List[str], vectors: List[List[float]]) -> None:
+        try:
+            self.vs.upsert(ids, texts, metas, vectors)
+        except Exception as e:
+            if not self.persisted or "readonly database" not in str(e).lower():
+                raise
             print(f"[ERROR] Database is readonly. Trying in-memory vector store...")
-            # Fallback to in-memory ChromaDB
-            vs = Chroma(embedding_function=_embedder())
-            # Retry with same batching strategy
-            if use_batching:
-                total_batches = (len(texts) + BATCH_SIZE - 1) // BATCH_SIZE
-                for i in range(0, len(texts), BATCH_SIZE):
-                    batch_num = (i // BATCH_SIZE) + 1
-                    batch_texts = texts[i:i + BATCH_SIZE]
-                    batch_metas = metas[i:i + BATCH_SIZE]
-                    batch_ids = ids[i:i + BATCH_SIZE]
-                    print(
-                        f"  Adding batch {batch_num}/{total_batches} ({len(batch_texts)} texts)...")
-                    vs.add_texts(texts=batch_texts,
-                                 metadatas=batch_metas, ids=batch_ids)
-            else:
-                vs.add_texts(texts=texts, metadatas=metas, ids=ids)
+            # Fallback to in-memory ChromaDB for this and all following batches
+            self.vs = ChromaBackend(None, _embedder())
+            self.persisted = False
             print(f"⚠️  Using in-memory vectorstore (data will not persist)")
-        else:
-            raise e
+            self.vs.upsert(ids, texts, metas, vectors)
 
-    print(f"✅ Successfully indexed {len(texts)} chunks → {store_dir}")
 
-    # Verify the index was created
-    debug_vectorstore_contents(store_dir)
-    print(f"=== END INDEX BUILD ===\n")
+class _FileResult(NamedTuple):
+    path: Path
+    sha: Optional[str]            # None: file unreadable
+    chunks: Optional[List[str]]   # None: unchanged, not split
 
 
-def build_index(docs_dir: str, store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE):
-    """
-    Build a Chroma store from files in `docs_dir`, using a splitter chosen by file ending.
-    Checks if index already exists to avoid rebuilding unnecessarily.
-    """
-    print(f"\n=== BUILDING INDEX ===")
-    print(f"Docs directory: {docs_dir}")
-    print(f"Store directory: {store_dir}")
+def _read_file(p: Path) -> Tuple[Optional[str], Optional[str]]:
+    content = _read_text(p)
+    return content, (_file_sha(content) if content else None)
 
-    root = Path(docs_dir)
-    store_dir.mkdir(parents=True, exist_ok=True)
 
-    # Debug the knowledge base files first
-    debug_knowledge_base_files(docs_dir)
+def _iter_file_results(paths: List[Path], needs_split: Callable[[Path, str], bool]) -> Iterator[_FileResult]:
+    """
+    Read files on a thread pool, split the changed ones (on a process pool for large
+    inputs with more than one changed file) and yield the results in path order. At
+    most INDEX_PIPELINE_WINDOW files are held in memory at any time.
+    """
+    splitter: Optional[ProcessPoolExecutor] = None
+    total_bytes = sum(p.stat().st_size for p in paths)
+    use_processes = Config.INDEX_SPLIT_PROCESSES > 1 and total_bytes >= Config.INDEX_PARALLEL_MIN_BYTES
+    changed_files = 0
+
+    def start_splitter() -> None:
+        nonlocal splitter, use_processes
+        use_processes = False
+        try:
+            # Never fork: the server process runs threads (and their locks) of its own
+            splitter = ProcessPoolExecutor(max_workers=Config.INDEX_SPLIT_PROCESSES,
+                                           mp_context=multiprocessing.get_context("spawn"))
+            print(
+                f"Splitting {total_bytes:,} bytes on {Config.INDEX_SPLIT_PROCESSES} processes")
+        except Exception as e:
+            print(f"[warn] No process pool available ({e}); splitting inline")
+            return
+        # Changed files waiting for an inline split go to the pool as well
+        for i, (p, sha, content, split_future) in enumerate(splits):
+            if content is not None and split_future is None:
+                splits[i] = (p, sha, content, splitter.submit(_split_and_dedup, p, content))
+
+    window = max(2, Config.INDEX_PIPELINE_WINDOW)
+    path_iter = iter(paths)
+    # (path, read future) -> (path, sha, content, split future | None)
+    reads: Deque[Tuple[Path, Future]] = deque()
+    splits: Deque[Tuple[Path, Optional[str], Optional[str], Optional[Future]]] = deque()
 
-    # Check if index already exists
-    if _index_exists(store_dir):
-        print(f"Index already exists at {store_dir}, skipping build.")
-        debug_vectorstore_contents(store_dir)
+    try:
+        with ThreadPoolExecutor(max_workers=Config.INDEX_READ_THREADS, thread_name_prefix="index-read") as readers:
+            def refill() -> None:
+                while len(reads) + len(splits) < window:
+                    p = next(path_iter, None)
+                    if p is None:
+                        return
+                    reads.append((p, readers.submit(_read_file, p)))
+
+            refill()
+            while reads or splits:
+                # Hand finished reads to the split stage; block only if nothing else is ready
+                while reads and (reads[0][1].done() or not splits):
+                    p, read_future = reads.popleft()
+                    content, sha = read_future.result()
+                    if content is None or not needs_split(p, sha):
+                        splits.append((p, sha, None, None))
+                    elif splitter is not None:
+                        splits.append(
+                            (p, sha, content, splitter.submit(_split_and_dedup, p, content)))
+                    else:
+                        splits.append((p, sha, content, None))
+                        changed_files += 1
+                        # A single changed file (e.g. one upload) gains nothing from processes
+                        if use_processes and changed_files > 1:
+                            start_splitter()
+                    refill()
+
+                p, sha, content, split_future = splits.popleft()
+                if content is None:
+                    yield _FileResult(p, sha, None)
+                elif split_future is None:
+                    yield _FileResult(p, sha, _split_and_dedup(p, content))
+                else:
+                    try:
+                        chunks = split_future.result()
+                    except BrokenProcessPool as e:
+                        print(f"[warn] Split process died ({e}); splitting {p} inline")
+                        chunks = _split_and_dedup(p, content)
+                    yield _FileResult(p, sha, chunks)
+                refill()
+    finally:
+        if splitter is not None:
+            splitter.shutdown(cancel_futures=True)
+
+
+def _seed_near_dup_index(lsh: MinHashLSH, vs: VectorBackend, old_files: Dict[str, Dict[str, Any]]) -> None:
+    """Index the chunks already in the store, so new chunks can be matched against them."""
+    old_ids = [id_ for entry in old_files.values() for id_ in entry["ids"]]
+    for i in range(0, len(old_ids), 500):
+        got = vs.get(old_ids[i:i + 500])
+        for id_, doc, meta in zip(got["ids"], got["documents"], got["metadatas"]):
+            if chunk_path(doc or "") is not None:
+                continue
+            lsh.insert(id_, doc or "", ((meta or {}).get("source", ""), True))
+    print(f"Near-duplicate index seeded with {len(lsh)} existing chunks")
+
+
+def _duplicate_sources(files: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Map every representative chunk id to the sources of its near-duplicates."""
+    reps: Dict[str, set] = {}
+    for source, entry in files.items():
+        for rep_id in entry.get("near_duplicates", {}).values():
+            reps.setdefault(rep_id, set()).add(source)
+    return {rep_id: sorted(sources) for rep_id, sources in reps.items()}
+
+
+def _orphaned_chunks(files: Dict[str, Dict[str, Any]], stats: Dict[str, int]) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+    """
+    Yield near-duplicate chunks whose representative is no longer in the store, so they
+    get embedded themselves. Their files are re-split to recover the chunk texts.
+    """
+    live = {id_ for entry in files.values() for id_ in entry["ids"]}
+    for source, entry in files.items():
+        orphaned = {dup_id for dup_id, rep_id in entry.get("near_duplicates", {}).items()
+                    if rep_id not in live}
+        if not orphaned:
+            continue
+        print(
+            f"Re-adding {len(orphaned)} chunks of {source} whose representative was removed")
+        content = _read_text(Path(source))
+        chunks = _split_and_dedup(Path(source), content) if content else []
+        for t in chunks:
+            id_ = _chunk_id(source, t)
+            if id_ in orphaned:
+                orphaned.discard(id_)
+                del entry["near_duplicates"][id_]
+                entry["ids"].append(id_)
+                stats["added"] += 1
+                yield t, _chunk_metadata(source, t), id_
+        if orphaned:
+            # The file changed since it was indexed; force a full re-split next time
+            entry["sha"] = None
+            for dup_id in orphaned:
+                del entry["near_duplicates"][dup_id]
+
+
+def _update_duplicate_sources(vs: VectorBackend, old_reps: Dict[str, List[str]], new_files: Dict[str, Dict[str, Any]]) -> None:
+    """Record on each representative chunk which other files contain a near-duplicate of it."""
+    new_reps = _duplicate_sources(new_files)
+    live = {id_ for entry in new_files.values() for id_ in entry["ids"]}
+    changed = [rep_id for rep_id in set(old_reps) | set(new_reps)
+               if rep_id in live and old_reps.get(rep_id) != new_reps.get(rep_id)]
+    if not changed:
         return
+    vs.update_metadata(changed, [
+        {"duplicate_sources": "; ".join(new_reps[rep_id]) if rep_id in new_reps else None}
+        for rep_id in changed
+    ])
 
-    texts: List[str] = []
-    metas: List[Dict[str, Any]] = []
 
-    print(f"Scanning for files in {root}...")
-    file_count = 0
-    for p in root.rglob("*"):
-        if not p.is_file() or p.suffix.lower() not in ALLOWED_EXTS:
-            continue
+def _add_to_bm25(bm25: BM25Index, items: Iterator[Tuple[str, Dict[str, Any], str]]) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+    for text, meta, id_ in items:
+        bm25.add(id_, text, meta["source"])
+        yield text, meta, id_
 
-        file_count += 1
-        print(f"Processing file {file_count}: {p.relative_to(root)}")
 
-        content = _read_text(p)
-        if not content:
-            print(f"[warn] Skipping unreadable file: {p}")
-            continue
+def _sync_bm25_index(bm25: BM25Index, vs: VectorBackend, files: Dict[str, Dict[str, Any]]) -> None:
+    """Make the lexical index cover exactly the stored chunks (e.g. for stores built before it existed)."""
+    missing = bm25.reconcile(id_ for entry in files.values() for id_ in entry["ids"])
+    for i in range(0, len(missing), 500):
+        got = vs.get(missing[i:i + 500])
+        for id_, doc, meta in zip(got["ids"], got["documents"], got["metadatas"]):
+            bm25.add(id_, doc or "", (meta or {}).get("source", ""))
+    if missing:
+        print(f"Added {len(missing)} existing chunks to the BM25 index")
 
-        print(f"  File content length: {len(content)} characters")
 
-        try:
-            chunks = _split_file_by_suffix(p, content)
-            print(f"  Split into {len(chunks)} chunks")
-        except Exception as e:
+def sync_index(docs_dir: str, store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE,
+               collection: Optional[str] = None) -> Dict[str, int]:
+    """
+    Bring the vector store in `store_dir` in line with the files in `docs_dir`.
+
+    A manifest next to the store records the SHA and chunk ids of every indexed file.
+    Unchanged files are skipped without splitting; for changed files only chunks whose
+    content-hash id is new get embedded, and chunks that disappeared get deleted.
+    Files are read, split and embedded as a stream, so the full corpus is never held
+    in memory. New chunks that nearly duplicate a chunk of another file are not
+    embedded; the representative lists their sources in `duplicate_sources`.
+    With `collection`, the named collection of `store_dir` is synced instead of its
+    default one; nothing else in the store is touched.
+    Returns chunk counts: added, removed, unchanged, near_duplicates.
+    """
+    stats = {"added": 0, "removed": 0, "unchanged": 0, "near_duplicates": 0,
+             "files_changed": 0, "files_removed": 0}
+    root = Path(docs_dir)
+
+    # Index builds yield to interactive requests at the shared embeddings rate limiter
+    with _build_lock(store_dir, collection), priority(Priority.BULK):
+        meta_dir = _meta_dir(store_dir, collection)
+        manifest = _load_manifest(meta_dir)
+        if manifest is not None and not _manifest_matches_config(manifest):
+            print(
+                f"Index at {meta_dir} was built with {manifest.get('backend', 'chroma')}/"
+                f"{manifest.get('embedding_model', Config.OPENAI_EMBEDDINGS_MODEL)}, "
+                f"rebuilding for {Config.VECTOR_BACKEND}/{Config.OPENAI_EMBEDDINGS_MODEL}")
+            if collection:
+                _drop_collection(store_dir, collection, manifest.get("backend", "chroma"))
+            else:
+                clear_vectorstore(store_dir)
+            manifest = None
+
+        vs, opened_dir = _open_vectorstore(store_dir, collection)
+        if opened_dir != store_dir:
+            store_dir, meta_dir = opened_dir, _meta_dir(opened_dir, collection)
+        if manifest is not None and vs.count() != sum(len(f["ids"]) for f in manifest.get("files", {}).values()):
+            # The store lost chunks the manifest lists (e.g. it was found inconsistent)
+            print(f"Index at {meta_dir} does not match its manifest, re-checking every file")
+            manifest = None
+        if manifest is None:
+            manifest = _manifest_from_collection(vs)
+            if manifest["files"]:
+                print(
+                    f"No manifest found, bootstrapped from {sum(len(f['ids']) for f in manifest['files'].values())} existing chunks")
+        old_files: Dict[str, Dict[str, Any]] = manifest.get("files", {})
+        old_reps = _duplicate_sources(old_files)
+        new_files: Dict[str, Dict[str, Any]] = {}
+        ids_to_delete: List[str] = []
+
+        bm25 = BM25Index.load(meta_dir / BM25_FILENAME) or BM25Index()
+
+        lsh = MinHashLSH(Config.NEAR_DUP_THRESHOLD) if Config.NEAR_DUP_THRESHOLD > 0 else None
+        lsh_seeded = False
+
+        def needs_split(p: Path, sha: str) -> bool:
+            old_entry = old_files.get(str(p))
+            return not (old_entry and old_entry.get("sha") == sha)
+
+        def changed_chunks() -> Iterator[Tuple[str, Dict[str, Any], str]]:
+            nonlocal lsh_seeded
+            print(f"Scanning for files in {root}...")
+            paths = _iter_source_files(root)
+            for file_count, result in enumerate(_iter_file_results(paths, needs_split), 1):
+                p, source = result.path, str(result.path)
+                print(f"Processed file {file_count}: {p.relative_to(root)}")
+
+                if result.sha is None:
+                    print(f"[warn] Skipping unreadable file: {p}")
+                    continue
+
+                old_entry = old_files.get(source)
+                if result.chunks is None:
+                    print(f"  Unchanged ({len(old_entry['ids'])} chunks)")
+                    new_files[source] = old_entry
+                    stats["unchanged"] += len(old_entry["ids"])
+                    continue
+
+                if not result.chunks:
+                    print(f"  No chunks generated for {p}")
+
+                if lsh is not None and not lsh_seeded:
+                    _seed_near_dup_index(lsh, vs, old_files)
+                    lsh_seeded = True
+
+                old_ids = set(old_entry["ids"]) if old_entry else set()
+                stored_ids: List[str] = []
+                near_duplicates: Dict[str, str] = {}
+
+                def accept(key: str, payload: Tuple[str, bool]) -> bool:
+                    # Only chunks of other files are representatives; similar chunks
+                    # within one file are kept, and its previous version is replaced
+                    return payload[0] != source
+
+                for t in result.chunks:
+                    id_ = _chunk_id(source, t)
+                    # Schema chunks of sibling objects differ only in their path, which
+                    # is what retrieval needs, so they are never near-duplicates
+                    if lsh is not None and chunk_path(t) is None:
+                        sig = lsh.signature(t)
+                        # Chunks that are already stored stay, no need to re-check them
+                        rep_id = None if id_ in old_ids else lsh.query(t, accept, sig)
+                        if rep_id is not None:
+                            near_duplicates[id_] = rep_id
+                            stats["near_duplicates"] += 1
+                            continue
+                        lsh.insert(id_, t, (source, False), sig)
+                    stored_ids.append(id_)
+                    if id_ not in old_ids:
+                        stats["added"] += 1
+                        yield t, _chunk_metadata(source, t), id_
+                if near_duplicates:
+                    print(f"  {len(near_duplicates)} near-duplicate chunks skipped")
+
+                ids_to_delete.extend(old_ids - set(stored_ids))
+                stats["files_changed"] += 1
+                stats["unchanged"] += len(old_ids & set(stored_ids))
+                new_files[source] = {"sha": result.sha, "ids": stored_ids}
+                if near_duplicates:
+                    new_files[source]["near_duplicates"] = near_duplicates
+
+        writer = _VectorstoreWriter(vs)
+        batch_stats = EmbeddingBatcher(_embedder(), writer).run(
+            _add_to_bm25(bm25, changed_chunks()))
+        if batch_stats["texts"]:
             print(
-                f"[warn] Split failed for {p}: {e}; falling back to plain splitter")
-            chunks = _split_plain(content)
-            print(f"  Fallback split into {len(chunks)} chunks")
+                f"Embedded {batch_stats['texts']} texts (~{batch_stats['tokens']:,} tokens) in {batch_stats['batches']} batches")
+
+        for source, entry in old_files.items():
+            if source not in new_files:
+                print(f"File removed from docs: {source}")
+                ids_to_delete.extend(entry["ids"])
+                stats["files_removed"] += 1
+
+        if not new_files and not old_files:
+            print("[ERROR] No documents found to index!")
+            return stats
+
+        # Near-duplicates lose their representative when its file changed or went away
+        EmbeddingBatcher(_embedder(), writer).run(
+            _add_to_bm25(bm25, _orphaned_chunks(new_files, stats)))
+        _update_duplicate_sources(writer.vs, old_reps, new_files)
+
+        if ids_to_delete:
+            print(f"Deleting {len(ids_to_delete)} stale chunks...")
+            vs.delete(ids=ids_to_delete)
+            stats["removed"] = len(ids_to_delete)
+
+        vs.flush()
+        if writer.persisted:
+            _sync_bm25_index(bm25, writer.vs, new_files)
+            meta_dir.mkdir(parents=True, exist_ok=True)
+            bm25.save(meta_dir / BM25_FILENAME)
+            _save_manifest(meta_dir, {"backend": vs.name,
+                                       "embedding_model": Config.OPENAI_EMBEDDINGS_MODEL,
+                                       "files": new_files})
 
-        if not chunks:
-            print(f"  No chunks generated for {p}")
-            continue
+        print(
+            f"Index sync: {stats['added']} added, {stats['removed']} removed, {stats['unchanged']} unchanged chunks, "
+            f"{stats['near_duplicates']} near-duplicates skipped "
+            f"({stats['files_changed']} files changed, {stats['files_removed']} removed) → {meta_dir}")
 
-        # OPTIONAL: small local dedup per file
-        chunks = _dedup_texts(chunks)
-        print(f"  After dedup: {len(chunks)} chunks")
+        if stats["added"] or stats["removed"]:
+            # Searches must not keep using a handle opened before this build
+            invalidate_vectorstore(store_dir, collection)
 
-        texts.extend(chunks)
-        metas.extend([{"source": str(p)}] * len(chunks))
+    return stats
 
-    print(f"\nTotal processing results:")
-    print(f"Files processed: {file_count}")
-    print(f"Total text chunks: {len(texts)}")
 
-    if not texts:
-        print("[ERROR] No documents found to index!")
-        return
+def build_index_fresh(docs_dir: str, store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE, clear_existing: bool = False) -> Dict[str, int]:
+    """
+    Build a fresh vector store from files in `docs_dir`.
+    If clear_existing=True, removes any existing vectorstore first; otherwise the
+    existing store is synced incrementally (see `sync_index`).
+    """
+    print(f"\n=== BUILDING {'FRESH ' if clear_existing else ''}INDEX ===")
+    print(f"Docs directory: {docs_dir}")
+    print(f"Store directory: {store_dir}")
+    print(f"Clear existing: {clear_existing}")
 
-    print(f"Building Chroma vectorstore at {store_dir}...")
+    if clear_existing:
+        clear_vectorstore(store_dir)
 
-    # Build or load persistent store, then add docs with stable ids (content hash)
+    # Ensure the store directory exists and is writable
     try:
-        vs = Chroma(persist_directory=str(store_dir),
-                    embedding_function=_embedder())
-    except Exception as e:
-        print(f"[ERROR] Failed to create ChromaDB at {store_dir}: {e}")
-        # Try with a fresh temporary directory
+        store_dir.mkdir(parents=True, exist_ok=True)
+        # Test write permissions by creating a temporary file
+        test_file = store_dir / "test_write"
+        test_file.write_text("test")
+        test_file.unlink()
+    except (PermissionError, OSError) as e:
+        print(f"[ERROR] Cannot write to directory {store_dir}: {e}")
+        print("Using fallback temporary directory...")
         import tempfile
-        store_dir = Path(tempfile.mkdtemp(prefix="chroma_fallback_"))
-        print(f"Retrying with fresh directory: {store_dir}")
-        vs = Chroma(persist_directory=str(store_dir),
-                    embedding_function=_embedder())
+        store_dir = Path(tempfile.mkdtemp(prefix="chroma_"))
+        print(f"Using fallback directory: {store_dir}")
 
-    # Chroma.add_texts allows ids, but raises on duplicates; since we only build once per process,
-    # we can just add once here. If you call build_index repeatedly in the same process, hash IDs help.
-    ids = [_hash_text(m["source"] + " :: " + t) for t, m in zip(texts, metas)]
+    # Debug the knowledge base files first
+    debug_knowledge_base_files(docs_dir)
 
-    print(f"Adding {len(texts)} texts to vectorstore...")
+    stats = sync_index(docs_dir, store_dir)
 
-    # Estimate total tokens (rough estimate: 4 chars per token)
-    total_chars = sum(len(t) for t in texts)
-    estimated_tokens = total_chars // 4
-    # Conservative limit (OpenAI limit is 300k)
-    MAX_TOKENS_PER_REQUEST = 250000
+    # Verify the index was created
+    debug_vectorstore_contents(store_dir)
+    print(f"=== END INDEX BUILD ===\n")
+    return stats
 
-    # Only batch if estimated tokens exceed the limit
-    use_batching = estimated_tokens > MAX_TOKENS_PER_REQUEST
 
-    if use_batching:
-        print(
-            f"⚠️  Large dataset detected (~{estimated_tokens:,} tokens). Using batched processing...")
-        BATCH_SIZE = 100
+def build_index(docs_dir: str, store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE,
+                collection: Optional[str] = None) -> Dict[str, int]:
+    """
+    Build a vector store from files in `docs_dir`, using a splitter chosen by file ending.
+    An existing index is updated incrementally, so only changed chunks get embedded.
+    """
+    print(f"\n=== BUILDING INDEX ===")
+    print(f"Docs directory: {docs_dir}")
+    print(f"Store directory: {store_dir}" + (f", collection: {collection}" if collection else ""))
 
-    try:
-        if use_batching:
-            total_batches = (len(texts) + BATCH_SIZE - 1) // BATCH_SIZE
-            for i in range(0, len(texts), BATCH_SIZE):
-                batch_num = (i // BATCH_SIZE) + 1
-                batch_texts = texts[i:i + BATCH_SIZE]
-                batch_metas = metas[i:i + BATCH_SIZE]
-                batch_ids = ids[i:i + BATCH_SIZE]
-                print(
-                    f"  Adding batch {batch_num}/{total_batches} ({len(batch_texts)} texts)...")
-                vs.add_texts(texts=batch_texts,
-                             metadatas=batch_metas, ids=batch_ids)
-        else:
-            vs.add_texts(texts=texts, metadatas=metas, ids=ids)
-    except Exception as e:
-        if "readonly database" in str(e).lower():
-            print(f"[ERROR] Database is readonly. Trying in-memory vector store...")
-            # Fallback to in-memory ChromaDB
-            vs = Chroma(embedding_function=_embedder())
-            # Retry with same batching strategy
-            if use_batching:
-                total_batches = (len(texts) + BATCH_SIZE - 1) // BATCH_SIZE
-                for i in range(0, len(texts), BATCH_SIZE):
-                    batch_num = (i // BATCH_SIZE) + 1
-                    batch_texts = texts[i:i + BATCH_SIZE]
-                    batch_metas = metas[i:i + BATCH_SIZE]
-                    batch_ids = ids[i:i + BATCH_SIZE]
-                    print(
-                        f"  Adding batch {batch_num}/{total_batches} ({len(batch_texts)} texts)...")
-                    vs.add_texts(texts=batch_texts,
-                                 metadatas=batch_metas, ids=batch_ids)
-            else:
-                vs.add_texts(texts=texts, metadatas=metas, ids=ids)
-            print(f"⚠️  Using in-memory vectorstore (data will not persist)")
-        else:
-            raise e
+    store_dir.mkdir(parents=True, exist_ok=True)
 
-    print(f"✅ Successfully indexed {len(texts)} chunks → {store_dir}")
+    # Debug the knowledge base files first
+    debug_knowledge_base_files(docs_dir)
+
+    stats = sync_index(docs_dir, store_dir, collection)
 
-    # Verify the index was created
-    debug_vectorstore_contents(store_dir)
     print(f"=== END INDEX BUILD ===\n")
+    return stats
 
 
 def ensure_index_built(docs_dir: str, store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE):
     """
-    Ensure that the index is built for the given docs directory.
-    This is a convenience function that can be called before any RAG search.
+    Ensure that the index is built and up to date for the given docs directory.
+    This is a convenience function that can be called before any RAG search; the
+    incremental sync runs once per process and store, later calls are no-ops.
     """
-    if not _index_exists(store_dir):
-        print(f"Building index for {docs_dir}...")
-        build_index(docs_dir, store_dir)
-    else:
-        print(f"Index already exists at {store_dir}")
+    key = _store_key(store_dir)
+    if key in _synced_stores:
+        return
+    print(f"Syncing index for {docs_dir}...")
+    build_index(docs_dir, store_dir)
+    _synced_stores.add(key)
+
+
+def _drop_collection(store_dir: Path, collection: str, backend: Optional[str] = None) -> None:
+    invalidate_vectorstore(store_dir, collection)
+    meta_dir = _meta_dir(store_dir, collection)
+    try:
+        open_backend(store_dir, _embedder(), backend, collection).drop()
+    except Exception as e:
+        print(f"[warn] Could not drop collection {collection} in {store_dir}: {e}")
+    import shutil
+    shutil.rmtree(meta_dir, ignore_errors=True)
+
+
+def drop_collection(store_dir: Path, collection: str) -> None:
+    """Delete a named collection with its manifest and BM25 index; the rest of the store stays."""
+    with _build_lock(store_dir, collection):
+        manifest = _load_manifest(_meta_dir(store_dir, collection)) or {}
+        _drop_collection(store_dir, collection, manifest.get("backend"))
+        print(f"Dropped collection {collection} from {store_dir}")
+
+
+def collections_last_used(store_dir: Path) -> Dict[str, float]:
+    """Named collections of `store_dir` with the time of their last sync."""
+    root = Path(store_dir) / COLLECTIONS_DIR
+    if not root.is_dir():
+        return {}
+    out: Dict[str, float] = {}
+    for meta_dir in root.iterdir():
+        manifest = meta_dir / MANIFEST_FILENAME
+        out[meta_dir.name] = (manifest if manifest.exists() else meta_dir).stat().st_mtime
+    return out
+
+
+def _lexical_is_decisive(bm25: BM25Index, query: str, hits: List[Tuple[str, float]]) -> bool:
+    """
+    True for identifier lookups (e.g. `suppressLogging`) whose best BM25 hit contains
+    every identifier of the query and clearly outscores the runner-up.
+    """
+    terms = [t for t in identifiers(query) if bm25.document_frequency(t)]
+    if not terms or not hits:
+        return False
+    top_id, top_score = hits[0]
+    if not all(t in bm25.docs[top_id]["tf"] for t in terms):
+        return False
+    runner_up = hits[1][1] if len(hits) > 1 else 0.0
+    return top_score >= Config.RAG_LEXICAL_DECISIVE_RATIO * runner_up
+
+
+def _rrf_fuse(rankings: List[List[str]]) -> List[str]:
+    """Reciprocal rank fusion of several rankings of chunk ids."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, 1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(scores, key=lambda id_: scores[id_], reverse=True)
 
 
 def rag_search(
@@ -529,55 +970,73 @@ def rag_search(
     mmr: bool = True,
     fetch_k: int = 20,
     lambda_mult: float = 0.5,
+    hybrid: bool = Config.RAG_HYBRID_SEARCH,
+    collection: Optional[str] = None,
 ) -> List[str]:
     """
     MMR retrieval to reduce duplicate results. Falls back to similarity if mmr=False.
+    With hybrid=True the vector ranking is fused with a BM25 ranking (reciprocal rank
+    fusion); decisive exact-identifier matches skip the embedding call entirely.
+    `collection` searches a named collection of `store_dir` instead of its default one.
     Ensures index exists before searching.
     """
     try:
         print(f"\n=== RAG SEARCH ===")
         print(f"Query: '{query}'")
-        print(f"Store directory: {store_dir}")
-        print(f"K: {k}, MMR: {mmr}")
-
-        if not _index_exists(store_dir):
+        print(f"Store directory: {store_dir}" + (f", collection: {collection}" if collection else ""))
+        print(f"K: {k}, MMR: {mmr}, hybrid: {hybrid}")
+
+        def cache_key() -> tuple:
+            return (_store_key(store_dir, collection), index_generation(store_dir, collection),
+                    query, k, mmr, fetch_k, lambda_mult, hybrid)
+
+        key = cache_key()
+        cached = _result_cache.get(key)
+        if cached is not None:
+            print(f"Result cache hit ({len(cached)} snippets)")
+            print(f"=== END RAG SEARCH ===\n")
+            return list(cached)
+
+        vs = get_vectorstore(store_dir, collection)
+        # API data collections are built by their caller from one stored upload
+        if vs is None and store_dir == Config.KNOWLEDGE_BASE_VECTOR_STORE and not collection:
             print(f"Index not found at {store_dir}, building it now...")
-            # Try to build from knowledge base or docs directory
-            docs_dir = Config.KNOWLEDGE_BASE_DIR.as_posix(
-            ) if store_dir == Config.KNOWLEDGE_BASE_VECTOR_STORE else Config.API_DATA_DIR.as_posix()
+            docs_dir = Config.KNOWLEDGE_BASE_DIR.as_posix()
             print(f"Building index from docs directory: {docs_dir}")
             build_index(docs_dir, store_dir)
+            vs = get_vectorstore(store_dir)
+            key = cache_key()
 
-        if not store_dir.exists():
+        if vs is None:
             print(
-                f"ERROR: Vector store directory {store_dir} does not exist after build attempt")
+                f"ERROR: No usable vectorstore at {store_dir} after build attempt")
             return []
 
-        print(f"Loading vectorstore from {store_dir}...")
-        vs = Chroma(persist_directory=str(store_dir),
-                    embedding_function=_embedder())
-
-        # Check collection stats
-        try:
-            collection_count = vs._collection.count()
-            print(f"Collection contains {collection_count} documents")
-            if collection_count == 0:
-                print("ERROR: Vectorstore is empty!")
-                return []
-        except Exception as e:
-            print(f"Warning: Could not get collection count: {e}")
-
-        print(f"Performing {'MMR' if mmr else 'similarity'} search...")
-
-        if mmr:
-            retriever = vs.as_retriever(
-                search_type="mmr",
-                search_kwargs={"k": k, "fetch_k": fetch_k,
-                               "lambda_mult": lambda_mult},
-            )
-            docs = retriever.invoke(query)
+        bm25 = get_bm25_index(store_dir, collection) if hybrid else None
+        lexical = bm25.search(query, fetch_k) if bm25 is not None else []
+
+        if bm25 is not None and _lexical_is_decisive(bm25, query, lexical):
+            print("Decisive lexical match, skipping vector search")
+            docs = [Document(page_content=bm25.docs[id_]["text"],
+                             metadata={"source": bm25.docs[id_]["source"]})
+                    for id_, _ in lexical[:k]]
+        elif lexical:
+            print(f"Performing hybrid {'MMR' if mmr else 'similarity'} + BM25 search...")
+            vector_docs = vs.search(
+                query, min(fetch_k, 2 * k) if mmr else fetch_k, mmr, fetch_k, lambda_mult)
+            by_id: Dict[str, Document] = {}
+            for d in vector_docs:
+                by_id[_chunk_id(d.metadata.get("source", ""), d.page_content)] = d
+            fused = _rrf_fuse([list(by_id), [id_ for id_, _ in lexical]])
+            docs = []
+            for id_ in fused[:k]:
+                if id_ not in by_id:
+                    by_id[id_] = Document(page_content=bm25.docs[id_]["text"],
+                                          metadata={"source": bm25.docs[id_]["source"]})
+                docs.append(by_id[id_])
         else:
-            docs = vs.similarity_search(query, k=k)
+            print(f"Performing {'MMR' if mmr else 'similarity'} search...")
+            docs = vs.search(query, k, mmr, fetch_k, lambda_mult)
 
         print(f"Raw search returned {len(docs)} documents")
 
@@ -593,6 +1052,9 @@ def rag_search(
         print(f"After dedup and truncation: {len(snippets)} snippets")
         print(f"=== END RAG SEARCH ===\n")
 
+        if snippets:
+            _result_cache.set(key, tuple(snippets))
+
         return snippets
 
     except Exception as e:
@@ -600,3 +1062,38 @@ def rag_search(
         import traceback
         traceback.print_exc()
         return []
+
+
+def rag_multi_search(
+    queries: List[str],
+    k: int = Config.RAG_MULTI_QUERY_K,
+    max_results: int = Config.RAG_MULTI_QUERY_MAX_RESULTS,
+    store_dir: Path = Config.KNOWLEDGE_BASE_VECTOR_STORE,
+    collection: Optional[str] = None,
+) -> List[str]:
+    """
+    Fan-out retrieval: runs `rag_search` with `k` for every query concurrently and
+    fuses the per-query rankings (reciprocal rank fusion), so each query contributes
+    its best hits and snippets found by several queries rank first. Returns at most
+    `max_results` distinct snippets; wall-clock time is that of the slowest query.
+    """
+    if not queries:
+        return []
+    workers = max(1, min(len(queries), Config.RAG_MULTI_QUERY_THREADS))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-query") as pool:
+        results = list(pool.map(
+            lambda q: rag_search(q, k=k, store_dir=store_dir, collection=collection), queries))
+
+    snippets: Dict[str, str] = {}
+    rankings: List[List[str]] = []
+    for result in results:
+        ranking = []
+        for snippet in result:
+            key = _hash_text(snippet)
+            snippets.setdefault(key, snippet)
+            ranking.append(key)
+        rankings.append(ranking)
+    fused = [snippets[key] for key in _rrf_fuse(rankings)[:max_results]]
+    print(f"Multi-query RAG search: {len(queries)} queries, "
+          f"{sum(map(len, results))} hits, {len(fused)} fused snippets")
+    return fused
@@ -0,0 +1,329 @@
+"""Client-side rate limiting for OpenAI calls.
+
+Every chat and embeddings request is admitted by a shared `RateLimiter`: token
+buckets for requests and tokens per minute plus a bound on requests in flight.
+Waiting callers are admitted strictly by priority class, then in arrival order, so
+an interactive question overtakes the batches of a running index build instead of
+queueing behind them. The priority is taken from a context variable that callers
+set with `priority(...)`.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from api_mapping_agent.config import Config
+from api_mapping_agent.tokens import count_tokens
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "openai_request_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def priority(level: Priority) -> Iterator[None]:
+    """Run the OpenAI calls of the block (and of threads started with its context) at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+# Async waiters cannot be woken by the condition variable and poll at most this long
+_ASYNC_POLL_SECONDS = 0.05
+
+
+class _TokenBucket:
+    """Refills continuously at `per_minute`; a limit of 0 disables the bucket."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level +
+                         (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, now: float) -> None:
+        if self.capacity:
+            self._refill(now)
+            self.level = min(self.level, 0.0)
+
+
+class Reservation:
+    """An admitted request. Report the real token usage with `used()` once known."""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+    def used(self, tokens: Optional[int]) -> None:
+        if tokens:
+            self.actual_tokens = int(tokens)
+
+
+class RateLimiter:
+    """Priority-aware admission control for one upstream API (thread- and asyncio-safe)."""
+
+    def __init__(self, name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 max_concurrency: int = 0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []   # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._in_flight = 0
+        self._throttled = 0
+        self._max_queue_depth = 0
+        self._admitted = {p: 0 for p in Priority}
+        self._waiting = {p: 0 for p in Priority}
+        self._wait_total = {p: 0.0 for p in Priority}
+        self._wait_max = {p: 0.0 for p in Priority}
+
+    def _enqueue(self, level: Priority) -> Tuple[int, int]:
+        entry = (int(level), next(self._tickets))
+        heapq.heappush(self._queue, entry)
+        self._waiting[level] += 1
+        self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+        return entry
+
+    def _dequeue(self, entry: Tuple[int, int]) -> None:
+        if self._queue and self._queue[0] == entry:
+            heapq.heappop(self._queue)
+        else:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        self._waiting[Priority(entry[0])] -= 1
+        # The head of the queue changed
+        self._cond.notify_all()
+
+    def _try_admit(self, entry: Tuple[int, int], tokens: int) -> Optional[float]:
+        """Admit `entry` (returns 0), or return how long to wait (None = until notified)."""
+        if self._queue[0] != entry:
+            return None
+        if self.max_concurrency and self._in_flight >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        wait = max(self._requests.wait_time(1, now),
+                   self._tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        self._requests.take(1)
+        self._tokens.take(tokens)
+        self._in_flight += 1
+        self._dequeue(entry)
+        return 0.0
+
+    def _record(self, level: Priority, waited: float) -> None:
+        self._admitted[level] += 1
+        self._wait_total[level] += waited
+        self._wait_max[level] = max(self._wait_max[level], waited)
+        if waited >= 1.0:
+            print(f"Rate limiter {self.name}: {level.name.lower()} request waited {waited:.1f}s "
+                  f"({len(self._queue)} still queued)")
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a request of `tokens` may be sent; returns the seconds waited."""
+        level = current_priority()
+        start = time.monotonic()
+        with self._cond:
+            entry = self._enqueue(level)
+            try:
+                while True:
+                    wait = self._try_admit(entry, tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                if entry in self._queue:
+                    self._dequeue(entry)
+                raise
+            waited = time.monotonic() - start
+            self._record(level, waited)
+        return waited
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Async `acquire`: waits on the event loop instead of blocking a thread."""
+        level = current_priority()
+        start = time.monotonic()
+        with self._cond:
+            entry = self._enqueue(level)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_admit(entry, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait or _ASYNC_POLL_SECONDS, _ASYNC_POLL_SECONDS))
+        except BaseException:
+            with self._cond:
+                if entry in self._queue:
+                    self._dequeue(entry)
+            raise
+        waited = time.monotonic() - start
+        with self._cond:
+            self._record(level, waited)
+        return waited
+
+    def release(self, reservation: Reservation) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if reservation.actual_tokens is not None:
+                # Settle the estimate against the real usage
+                diff = reservation.estimated_tokens - reservation.actual_tokens
+                if diff > 0:
+                    self._tokens.give_back(diff)
+                else:
+                    self._tokens.take(-diff)
+            self._cond.notify_all()
+
+    def throttle(self) -> None:
+        """The provider answered 429: empty the buckets so all callers back off together."""
+        with self._cond:
+            now = time.monotonic()
+            self._requests.drain(now)
+            self._tokens.drain(now)
+            self._throttled += 1
+
+    def _is_rate_limit_error(self, e: BaseException) -> bool:
+        return type(e).__name__ == "RateLimitError" or getattr(e, "status_code", None) == 429
+
+    @contextmanager
+    def limit(self, tokens: int = 0) -> Iterator[Reservation]:
+        """Hold an admission for the duration of the block."""
+        reservation = Reservation(tokens)
+        self.acquire(tokens)
+        try:
+            yield reservation
+        except Exception as e:
+            if self._is_rate_limit_error(e):
+                self.throttle()
+            raise
+        finally:
+            self.release(reservation)
+
+    @asynccontextmanager
+    async def alimit(self, tokens: int = 0) -> AsyncIterator[Reservation]:
+        reservation = Reservation(tokens)
+        await self.aacquire(tokens)
+        try:
+            yield reservation
+        except Exception as e:
+            if self._is_rate_limit_error(e):
+                self.throttle()
+            raise
+        finally:
+            self.release(reservation)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self._max_queue_depth,
+                "throttled": self._throttled,
+                "priorities": {
+                    p.name.lower(): {
+                        "waiting": self._waiting[p],
+                        "admitted": self._admitted[p],
+                        "avg_wait_seconds": self._wait_total[p] / self._admitted[p] if self._admitted[p] else 0.0,
+                        "max_wait_seconds": self._wait_max[p],
+                    }
+                    for p in Priority
+                },
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(kind: str) -> RateLimiter:
+    """Return the process-wide limiter for "chat" or "embeddings" calls."""
+    with _limiters_lock:
+        limiter = _limiters.get(kind)
+        if limiter is None:
+            if kind == "chat":
+                limiter = RateLimiter("chat", Config.OPENAI_CHAT_RPM, Config.OPENAI_CHAT_TPM,
+                                      Config.OPENAI_CHAT_MAX_CONCURRENCY)
+            elif kind == "embeddings":
+                limiter = RateLimiter("embeddings", Config.OPENAI_EMBEDDINGS_RPM,
+                                      Config.OPENAI_EMBEDDINGS_TPM,
+                                      Config.OPENAI_EMBEDDINGS_MAX_CONCURRENCY)
+            else:
+                raise ValueError(f"Unknown rate limiter {kind!r}")
+            _limiters[kind] = limiter
+        return limiter
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {kind: limiter.stats() for kind, limiter in limiters.items()}
+
+
+class GovernedEmbeddings(Embeddings):
+    """Embeddings wrapper that admits every request through a `RateLimiter`."""
+
+    def __init__(self, inner: Embeddings, model: str, limiter: RateLimiter):
+        self.inner = inner
+        self.model = model
+        self.limiter = limiter
+
+    def _tokens(self, texts: List[str]) -> int:
+        return sum(count_tokens(t, self.model) for t in texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.limiter.limit(self._tokens(texts)):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.limiter.limit(self._tokens([text])):
+            return self.inner.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        async with self.limiter.alimit(self._tokens(texts)):
+            return await self.inner.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        async with self.limiter.alimit(self._tokens([text])):
+            return await self.inner.aembed_query(text)
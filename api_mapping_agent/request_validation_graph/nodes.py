@@ -8,7 +8,7 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 import json
 
 
-llm = get_llm()
+llm = get_llm("validation")
 
 
 def get_request_node(state: RequestValidationState) -> Dict[str, Any]:
@@ -0,0 +1,546 @@
+"""Streaming ingestion of uploaded customer API metadata.
+
+SAP and other ERP systems export OpenAPI documents and XSDs of several hundred MB.
+Such files are never read into memory as a whole: the UI hands them over out-of-band
+(see `upload_store.store_upload`), and an incremental parser (iterparse for XML/XSD,
+a chunked tokenizer for JSON, PyYAML events for YAML, the csv reader for CSV) extracts
+field paths, types and descriptions into a compact field catalog stored next to the
+file.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple, Union
+
+from api_mapping_agent.api_mapping_graph.field_matcher import SchemaField
+
+# Not one of the RAG index extensions, so catalogs never end up in the API data index
+CATALOG_SUFFIX = ".catalog"
+# Named schema types are expanded into every place that references them up to this depth
+_MAX_REF_DEPTH = 8
+_MAX_FIELDS = 50_000
+_MAX_DESCRIPTION = 200
+_READ_CHUNK = 1 << 20
+
+
+class SchemaParseError(ValueError):
+    """A metadata file that cannot be parsed as its (detected) format."""
+
+
+class FieldCatalog(NamedTuple):
+    source: str
+    format: str
+    size_bytes: int
+    fields: List[SchemaField]
+
+
+class SchemaOutline(NamedTuple):
+    """Fields of a document before references to named types are expanded.
+
+    Schema fields are rooted at their named type (`Partner.zipCode`); `refs` maps the
+    path of a field - or of a type extending another one - to the named type it uses.
+    Example documents, XML instances and CSV files have no refs.
+    """
+    format: str
+    fields: List[SchemaField]
+    refs: Dict[str, str]
+    named: Set[str]
+
+
+# --- Event streams ----------------------------------------------------------------
+# JSON and YAML are both turned into ("start_map" | "end_map" | "start_array" |
+# "end_array", None), ("key", name) and ("scalar", (type, text)) events.
+
+Event = Tuple[str, Any]
+
+_JSON_TOKEN = re.compile(
+    r'\s*(?:([{}\[\]:,])|"((?:[^"\\]|\\.)*)"|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)|(true|false|null))')
+_JSON_LITERAL_TYPES = {"true": "boolean", "false": "boolean", "null": "null"}
+# Characters after a number that a chunk boundary may separate from it (`.5`, `e+3`)
+_TOKEN_LOOKAHEAD = 4
+
+
+def _json_tokens(stream: TextIO) -> Iterator[Tuple[str, str]]:
+    """(kind, text) tokens of a JSON document, read in chunks."""
+    buffer, pos, eof = "", 0, False
+    while True:
+        match = _JSON_TOKEN.match(buffer, pos)
+        # A token touching the end of the buffer may continue in the next chunk; a number
+        # or literal close to it may be a prefix (`12` of `12.5`, `1` of `1e+3`)
+        if not eof and (match is None or match.end() == len(buffer) or (
+                (match.group(3) or match.group(4))
+                and len(buffer) - match.end() < _TOKEN_LOOKAHEAD)):
+            chunk = stream.read(_READ_CHUNK)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        if match is None:
+            if buffer[pos:].strip():
+                raise ValueError(f"Invalid JSON near: {buffer[pos:pos + 40]!r}")
+            return
+        pos = match.end()
+        punctuation, string, number, literal = match.groups()
+        if punctuation:
+            yield "punct", punctuation
+        elif string is not None:
+            yield "string", json.loads(f'"{string}"') if "\\" in string else string
+        elif number is not None:
+            yield "number", number
+        else:
+            yield "literal", literal
+
+
+def _json_events(stream: TextIO) -> Iterator[Event]:
+    stack: List[List[Any]] = []   # [container kind, expecting a key]
+    for kind, text in _json_tokens(stream):
+        if kind == "punct":
+            if text in "{[":
+                stack.append(["map" if text == "{" else "array", text == "{"])
+                yield ("start_map" if text == "{" else "start_array"), None
+            elif text in "}]":
+                if not stack or stack[-1][0] != ("map" if text == "}" else "array"):
+                    raise ValueError(f"Unbalanced {text!r} in JSON")
+                stack.pop()
+                yield ("end_map" if text == "}" else "end_array"), None
+                if stack and stack[-1][0] == "map":
+                    stack[-1][1] = True
+            continue
+        if stack and stack[-1][0] == "map" and stack[-1][1]:
+            stack[-1][1] = False
+            yield "key", text
+            continue
+        type_ = {"string": "string", "number": "number"}.get(kind) or _JSON_LITERAL_TYPES[text]
+        yield "scalar", (type_, text)
+        if stack and stack[-1][0] == "map":
+            stack[-1][1] = True
+    if stack:
+        raise ValueError(f"JSON document ends inside {len(stack)} open containers (truncated?)")
+
+
+_YAML_NUMBER = re.compile(r"^[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?$")
+
+
+def _yaml_events(stream: TextIO) -> Iterator[Event]:
+    import yaml
+
+    stack: List[List[Any]] = []   # [container kind, expecting a key]
+
+    def value_done() -> None:
+        if stack and stack[-1][0] == "map":
+            stack[-1][1] = True
+
+    for event in yaml.parse(stream):
+        if isinstance(event, yaml.MappingStartEvent):
+            stack.append(["map", True])
+            yield "start_map", None
+        elif isinstance(event, yaml.SequenceStartEvent):
+            stack.append(["array", False])
+            yield "start_array", None
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            kind = stack.pop()[0]
+            yield ("end_map" if kind == "map" else "end_array"), None
+            value_done()
+        elif isinstance(event, (yaml.ScalarEvent, yaml.AliasEvent)):
+            text = getattr(event, "value", "")
+            if stack and stack[-1][0] == "map" and stack[-1][1]:
+                stack[-1][1] = False
+                yield "key", text
+                continue
+            if isinstance(event, yaml.AliasEvent) or not event.implicit[0]:
+                type_ = "string"
+            elif text in ("true", "false", "True", "False"):
+                type_ = "boolean"
+            elif text in ("", "~", "null", "Null"):
+                type_ = "null"
+            else:
+                type_ = "number" if _YAML_NUMBER.match(text) else "string"
+            yield "scalar", (type_, text)
+            value_done()
+
+
+# --- JSON / YAML catalog ----------------------------------------------------------
+
+_SCHEMA_MARKERS = {"openapi", "swagger", "$schema", "components", "definitions", "$defs"}
+_COMBINATORS = {"allOf", "anyOf", "oneOf"}
+
+
+def _join(path: str, name: str) -> str:
+    return f"{path}.{name}" if path else name
+
+
+def _schema_location(keys: List[str]) -> Optional[str]:
+    """Field path of the schema object at `keys`, or None if it is no schema object.
+
+    Schemas start at the document root, at definitions/<Name>, $defs/<Name> or
+    components/schemas/<Name> and nest through properties/<field>, items and the
+    entries of allOf/anyOf/oneOf.
+    """
+    if keys[:2] == ["components", "schemas"] and len(keys) > 2:
+        path, i = keys[2], 3
+    elif keys[:1] in (["definitions"], ["$defs"]) and len(keys) > 1:
+        path, i = keys[1], 2
+    else:
+        path, i = "", 0
+    while i < len(keys):
+        key = keys[i]
+        if key == "properties" and i + 1 < len(keys):
+            path, i = _join(path, keys[i + 1]), i + 2
+        elif key == "items":
+            path, i = path + "[]", i + 1
+        elif key in _COMBINATORS and i + 1 < len(keys) and keys[i + 1] == "[]":
+            i += 2
+        else:
+            return None
+    return path
+
+
+def _field_name(path: str) -> str:
+    return path.rsplit(".", 1)[-1].replace("[]", "").lstrip("@")
+
+
+class _StructuredCatalog:
+    """Collects both readings of a JSON/YAML document in one pass: the leaf paths of
+    an example document and the fields of a JSON Schema / OpenAPI document."""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.root_keys: Set[str] = set()
+        self.examples: Dict[str, SchemaField] = {}
+        self.schema_fields: Dict[str, SchemaField] = {}
+        self.refs: Dict[str, str] = {}
+        self.named: Set[str] = set()
+        # Per open map: schema location (or None) and the scalars seen in it
+        self.maps: List[Tuple[Optional[str], Dict[str, str], Set[str]]] = []
+
+    def feed(self, events: Iterator[Event]) -> None:
+        pending_key: Optional[str] = None
+        containers: List[str] = []
+        for kind, value in events:
+            if kind == "key":
+                pending_key = value
+                if len(containers) == 1:
+                    self.root_keys.add(value)
+                continue
+            # Entering a value: extend the key path by its key or by the array marker
+            if kind in ("start_map", "start_array", "scalar") and containers:
+                self.keys.append(pending_key if containers[-1] == "map" else "[]")
+            if kind == "start_map":
+                containers.append("map")
+                location = _schema_location(self.keys)
+                self.maps.append((location, {}, set()))
+                if location and self.keys[-2:-1] in (["schemas"], ["definitions"], ["$defs"]):
+                    self.named.add(location)
+                continue
+            if kind == "start_array":
+                containers.append("array")
+                continue
+            if kind in ("end_map", "end_array"):
+                containers.pop()
+                if kind == "end_map":
+                    self._close_schema(*self.maps.pop())
+            elif kind == "scalar":
+                self._scalar(*value)
+            if self.keys:
+                if self.maps and self.keys[-1] in ("properties", "items", *_COMBINATORS):
+                    self.maps[-1][2].add(self.keys[-1])
+                self.keys.pop()
+
+    def _scalar(self, type_: str, text: str) -> None:
+        if self.keys and self.maps and self.maps[-1][0] is not None:
+            key = self.keys[-1]
+            if key in ("type", "description", "$ref", "format"):
+                self.maps[-1][1][key] = text
+        if len(self.examples) < _MAX_FIELDS and self.keys:
+            path = ".".join(self.keys).replace(".[]", "[]")
+            if path not in self.examples:
+                self.examples[path] = SchemaField(path, _field_name(path), type_)
+
+    def _close_schema(self, location: Optional[str], scalars: Dict[str, str], nested: Set[str]) -> None:
+        if location is None or not location or len(self.schema_fields) >= _MAX_FIELDS:
+            return
+        if "$ref" in scalars:
+            self.refs[location] = scalars["$ref"].rsplit("/", 1)[-1]
+        elif not nested:
+            self.schema_fields[location] = SchemaField(
+                location, _field_name(location), scalars.get("type", ""),
+                scalars.get("description", "")[:_MAX_DESCRIPTION])
+
+    def is_schema(self) -> bool:
+        return bool(self.root_keys & _SCHEMA_MARKERS) or bool(
+            "properties" in self.root_keys and self.schema_fields)
+
+    def outline(self, fmt: str) -> SchemaOutline:
+        if not self.is_schema():
+            return SchemaOutline(fmt, list(self.examples.values()), {}, set())
+        return SchemaOutline(f"{fmt} schema", list(self.schema_fields.values()), self.refs, self.named)
+
+
+def _root(path: str) -> str:
+    return re.split(r"[.\[]", path, 1)[0]
+
+
+def _expand_refs(fields: List[SchemaField], refs: Dict[str, str],
+                 named: Set[str]) -> List[SchemaField]:
+    """Place the fields of referenced named types under every referencing path."""
+    by_root: Dict[str, List[Tuple[str, Any]]] = {}
+    for field in fields:
+        by_root.setdefault(_root(field.path), []).append((field.path, field))
+    for path, target in refs.items():
+        by_root.setdefault(_root(path), []).append((path, target))
+
+    out: List[SchemaField] = []
+
+    def expand(type_name: str, prefix: str, chain: Tuple[str, ...]) -> None:
+        for path, item in by_root.get(type_name, ()):
+            if len(out) >= _MAX_FIELDS:
+                return
+            relative = path[len(type_name):]
+            full = prefix + relative
+            if isinstance(item, SchemaField):
+                if relative or full != type_name:
+                    out.append(item._replace(path=full, name=_field_name(full)))
+            elif item not in chain and len(chain) < _MAX_REF_DEPTH:
+                expand(item, full, chain + (item,))
+
+    roots = {_root(p) for p in [*(f.path for f in fields), *refs]}
+    for root in sorted(roots):
+        expand(root, root, (root,))
+    # Named primitive types are no fields of their own
+    return [f for f in out if f.path not in named]
+
+
+# --- XML / XSD catalog ------------------------------------------------------------
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
+
+
+def _xml_outline(source: Union[str, io.BytesIO]) -> SchemaOutline:
+    events = ET.iterparse(source, events=("start", "end"))
+    _, root = next(events)
+    if _local(root.tag) == "schema":
+        return _xsd_outline(root, events)
+    return SchemaOutline("xml", _xml_instance_fields(root, events), {}, set())
+
+
+def _xml_instance_fields(root: ET.Element, events: Iterator[Tuple[str, ET.Element]]) -> List[SchemaField]:
+    fields: Dict[str, SchemaField] = {}
+    names = [_local(root.tag)]
+    has_children = [False]
+    parents = [root]
+
+    def attributes(el: ET.Element, path: str) -> None:
+        for attr in el.attrib:
+            name = _local(attr)
+            attr_path = f"{path}.@{name}"
+            if attr_path not in fields and len(fields) < _MAX_FIELDS:
+                fields[attr_path] = SchemaField(attr_path, name, "attribute")
+
+    attributes(root, names[0])
+    for event, el in events:
+        if event == "start":
+            has_children[-1] = True
+            names.append(_local(el.tag))
+            has_children.append(False)
+            parents.append(el)
+            attributes(el, ".".join(names))
+            continue
+        path = ".".join(names)
+        if not has_children[-1] and path not in fields and len(fields) < _MAX_FIELDS:
+            fields[path] = SchemaField(path, names[-1], "element")
+        names.pop()
+        has_children.pop()
+        parents.pop()
+        # Drop finished elements so memory stays bounded by the nesting depth
+        el.clear()
+        if parents:
+            del parents[-1][-1]
+    return list(fields.values())
+
+
+def _xsd_outline(root: ET.Element, events: Iterator[Tuple[str, ET.Element]]) -> SchemaOutline:
+    fields: Dict[str, SchemaField] = {}
+    refs: Dict[str, str] = {}
+    named: Set[str] = set()
+    # Per open element: [tag, path of the enclosing named field or type, has inline
+    # type, documentation]; children are freed before their parent ends
+    stack: List[List[Any]] = [["schema", "", False, ""]]
+    parents = [root]
+
+    for event, el in events:
+        tag = _local(el.tag)
+        if event == "start":
+            path = stack[-1][1]
+            name = el.get("name")
+            if tag == "element" and name:
+                path = _join(path, name)
+                if el.get("maxOccurs") not in (None, "1"):
+                    path += "[]"
+            elif tag == "complexType" and name and len(stack) == 1:
+                path = name
+                named.add(name)
+            elif tag == "complexType" and len(stack) > 1:
+                stack[-1][2] = True
+            elif tag == "attribute" and name:
+                path = f"{path}.@{name}" if path else f"@{name}"
+            elif tag == "extension" and el.get("base"):
+                refs[f"{path}.<base:{len(refs)}>"] = el.get("base").split(":")[-1]
+            stack.append([tag, path, False, ""])
+            parents.append(el)
+            continue
+
+        _, path, inline, doc = stack.pop()
+        parents.pop()
+        if tag == "documentation" and el.text:
+            for entry in reversed(stack):
+                if entry[0] in ("element", "attribute", "complexType"):
+                    entry[3] = entry[3] or el.text.strip()[:_MAX_DESCRIPTION]
+                    break
+        if tag in ("element", "attribute") and el.get("name") and path:
+            type_ = (el.get("type") or "").split(":")[-1]
+            if tag == "element" and type_ and not inline:
+                refs[path] = type_
+                fields.setdefault(f"{path}.<type>", SchemaField(path, el.get("name"), type_, doc))
+            elif not inline and len(fields) < _MAX_FIELDS:
+                fields[path] = SchemaField(path, el.get("name"), type_, doc)
+        el.clear()
+        if parents:
+            del parents[-1][-1]
+
+    # Element types: named complex types are references, simple types make leaves
+    leaf_fields: Dict[str, SchemaField] = {}
+    type_refs: Dict[str, str] = {}
+    for key, field in fields.items():
+        if key.endswith(".<type>"):
+            path = key[:-len(".<type>")]
+            if refs.get(path) not in named:
+                leaf_fields[path] = field  # simple type such as xs:string
+        else:
+            leaf_fields[key] = field
+    for path, target in refs.items():
+        if target in named:
+            # Base types of extensions contribute their fields to the extending type
+            type_refs[path.split(".<base:", 1)[0] if ".<base:" in path else path] = target
+    return SchemaOutline("xsd", list(leaf_fields.values()), type_refs, named)
+
+
+# --- Entry points -----------------------------------------------------------------
+
+def _detect_format(filename: str, head: str) -> str:
+    suffix = Path(filename).suffix.lower().lstrip(".")
+    if suffix in ("xml", "xsd", "wsdl"):
+        return "xml"
+    if suffix in ("json", "yaml", "yml", "csv"):
+        return "yaml" if suffix == "yml" else suffix
+    head = head.lstrip()
+    if head.startswith("<"):
+        return "xml"
+    if head[:1] in ("{", "["):
+        return "json"
+    first_line = head.split("\n", 1)[0]
+    if any(d in first_line for d in ",;\t|") and ":" not in first_line:
+        return "csv"
+    return "yaml"
+
+
+def _csv_fields(f: TextIO) -> List[SchemaField]:
+    sample = f.read(64 * 1024)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    header = next(csv.reader(f, dialect), [])
+    return [SchemaField(name.strip(), name.strip(), "column") for name in header if name.strip()]
+
+
+def _open_text(source: Union[Path, str]) -> TextIO:
+    if isinstance(source, Path):
+        return open(source, encoding="utf-8", errors="replace", newline="")
+    return io.StringIO(source, newline="")
+
+
+def read_outline(source: Union[Path, str], filename: str = "") -> SchemaOutline:
+    """Outline of a metadata file (a Path, read as a stream) or of already read text
+    (a str, whose format is taken from `filename` or sniffed)."""
+    with _open_text(source) as f:
+        fmt = _detect_format(filename or (source.name if isinstance(source, Path) else ""), f.read(4096))
+        f.seek(0)
+        if fmt == "csv":
+            return SchemaOutline("csv", _csv_fields(f), {}, set())
+        if fmt != "xml":
+            collector = _StructuredCatalog()
+            collector.feed(_json_events(f) if fmt == "json" else _yaml_events(f))
+            return collector.outline(fmt)
+    return _xml_outline(str(source) if isinstance(source, Path) else io.BytesIO(source.encode("utf-8")))
+
+
+def expand_outline(outline: SchemaOutline) -> List[SchemaField]:
+    """Fields of an outline with every named type expanded where it is used."""
+    if not outline.refs and not outline.named:
+        return list(outline.fields)
+    fields = _expand_refs(outline.fields, outline.refs, outline.named)
+    if outline.format == "xsd":
+        # Named XSD types only describe elements, they are no document roots
+        fields = [f for f in fields if _root(f.path) not in outline.named]
+    return fields
+
+
+def build_catalog(path: Path) -> FieldCatalog:
+    """Extract the field catalog of a metadata file in one streaming pass."""
+    path = Path(path)
+    start = time.monotonic()
+    try:
+        outline = read_outline(path)
+    except (ValueError, ET.ParseError) as e:
+        raise SchemaParseError(f"Cannot parse {path.name}: {e}") from e
+    except Exception as e:
+        import yaml
+        if isinstance(e, yaml.YAMLError):
+            raise SchemaParseError(f"Cannot parse {path.name}: {e}") from e
+        raise
+    fields, fmt = expand_outline(outline), outline.format
+    catalog = FieldCatalog(path.name, fmt, path.stat().st_size, fields)
+    print(f"Field catalog of {path.name}: {len(fields)} fields ({fmt}, "
+          f"{catalog.size_bytes / 1024 / 1024:.1f} MB) in {time.monotonic() - start:.1f}s")
+    return catalog
+
+
+def catalog_path(data_file: Path) -> Path:
+    return data_file.with_name(data_file.name + CATALOG_SUFFIX)
+
+
+def save_catalog(catalog: FieldCatalog, path: Path) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": catalog.source, "format": catalog.format,
+                   "size_bytes": catalog.size_bytes,
+                   "fields": [list(field) for field in catalog.fields]}, f)
+    os.replace(tmp, path)
+
+
+def load_catalog(path: Path) -> FieldCatalog:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return FieldCatalog(data["source"], data["format"], data["size_bytes"],
+                        [SchemaField(*field) for field in data["fields"]])
+
+
+def ensure_catalog(data_file: Path) -> FieldCatalog:
+    """Load the stored catalog of `data_file`, building it if missing or stale.
+    Raises SchemaParseError for files that are not valid in their format."""
+    stored = catalog_path(data_file)
+    if stored.exists() and stored.stat().st_mtime >= data_file.stat().st_mtime:
+        try:
+            return load_catalog(stored)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[warn] Rebuilding unreadable field catalog {stored.name}: {e}")
+    catalog = build_catalog(data_file)
+    save_catalog(catalog, stored)
+    return catalog
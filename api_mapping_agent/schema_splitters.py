@@ -0,0 +1,93 @@
+"""Structure-aware chunking of customer API metadata for the RAG index.
+
+Splitting JSON, XML, CSV or YAML as plain text cuts field definitions mid-object. These
+splitters emit one chunk per object or record type instead - a named schema type, an
+inline object, an XML element with child elements, the header of a CSV file - listing
+its fields with type and description. Named types are chunked once, with the paths
+that use them, rather than once per use.
+
+Every chunk starts with a `path:` line naming the full path of its object; the indexer
+stores it as chunk metadata (see `chunk_path`).
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from api_mapping_agent.schema_ingest import SchemaOutline, read_outline
+
+SCHEMA_SUFFIXES = {".json", ".yaml", ".yml", ".xml", ".xsd", ".csv"}
+PATH_PREFIX = "path: "
+_MAX_CHUNK_CHARS = 1500
+_MAX_USED_AT = 20
+
+
+def _last_segment(path: str) -> str:
+    return path.rsplit(".", 1)[-1]
+
+
+def _parent(path: str) -> str:
+    return path.rsplit(".", 1)[0] if "." in path else ""
+
+
+def _objects(outline: SchemaOutline) -> Dict[str, List[str]]:
+    """Field lines per object path, in document order."""
+    objects: Dict[str, List[str]] = {}
+    for field in outline.fields:
+        details = ", ".join(x for x in (field.type, field.description) if x)
+        objects.setdefault(_parent(field.path), []).append(
+            f"- {_last_segment(field.path)}" + (f" ({details})" if details else ""))
+    for path, target in outline.refs.items():
+        if path in outline.named:
+            # A type extending another one
+            objects.setdefault(path, []).insert(0, f"extends {target}")
+        else:
+            objects.setdefault(_parent(path), []).append(f"- {_last_segment(path)} -> {target}")
+    return objects
+
+
+def _pack(header: List[str], lines: List[str]) -> List[str]:
+    """Chunks of at most `_MAX_CHUNK_CHARS` (unless a single line is longer), each
+    starting with `header`."""
+    parts: List[List[str]] = [[]]
+    size = 0
+    budget = _MAX_CHUNK_CHARS - sum(len(h) + 1 for h in header)
+    for line in lines:
+        if parts[-1] and size + len(line) + 1 > budget:
+            parts.append([])
+            size = 0
+        parts[-1].append(line)
+        size += len(line) + 1
+    if len(parts) == 1:
+        return ["\n".join(header + parts[0])]
+    return ["\n".join(header + [f"part {i} of {len(parts)}"] + part)
+            for i, part in enumerate(parts, 1)]
+
+
+def split_schema(content: str, filename: str) -> List[str]:
+    """One chunk per object or record type of `content`; empty if it has no fields."""
+    outline = read_outline(content, filename)
+    if not outline.fields and not outline.refs:
+        return []
+    used_at: Dict[str, List[str]] = {}
+    for path, target in outline.refs.items():
+        used_at.setdefault(target, []).append(path)
+    root_label = Path(filename).stem or "(root)"
+
+    chunks: List[str] = []
+    for path, lines in _objects(outline).items():
+        header = [PATH_PREFIX + (path or root_label)]
+        if outline.format == "csv":
+            header.append("record type: CSV columns")
+        if path in used_at:
+            uses = sorted(used_at[path])
+            more = f" (+{len(uses) - _MAX_USED_AT} more)" if len(uses) > _MAX_USED_AT else ""
+            header.append("used at: " + ", ".join(uses[:_MAX_USED_AT]) + more)
+        chunks.extend(_pack(header, lines))
+    return chunks
+
+
+def chunk_path(text: str) -> Optional[str]:
+    """Object path of a chunk produced by `split_schema`, None for other chunks."""
+    if not text.startswith(PATH_PREFIX):
+        return None
+    return text.split("\n", 1)[0][len(PATH_PREFIX):]
@@ -0,0 +1,99 @@
+"""In-process semantic cache for LLM answers.
+
+Questions are looked up by the cosine similarity of their embeddings, so a rephrased
+but equivalent question is answered from the cache. Every entry belongs to a
+knowledge-base generation; after the index changes, older answers no longer match.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """Thread-safe nearest-neighbour answer cache with TTL and LRU eviction."""
+
+    def __init__(self, threshold: float, maxsize: int, ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._vectors: List[np.ndarray] = []
+        self._entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / (np.linalg.norm(v) or 1.0)
+
+    def _drop(self, index: int) -> None:
+        del self._vectors[index]
+        del self._entries[index]
+
+    def lookup(self, vector: List[float], generation: int) -> Optional[Any]:
+        """Return the value of the most similar entry of `generation`, if similar enough."""
+        q = self._normalize(vector)
+        with self._lock:
+            now = time.monotonic()
+            for i in reversed(range(len(self._entries))):
+                if self._entries[i]["expires"] and self._entries[i]["expires"] < now:
+                    self._drop(i)
+                    self.expirations += 1
+
+            best, best_sim = None, self.threshold
+            if self._vectors:
+                sims = np.stack(self._vectors) @ q
+                for i in np.argsort(-sims):
+                    if sims[i] < best_sim:
+                        break
+                    if self._entries[i]["generation"] == generation:
+                        best = int(i)
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries[best]["last_used"] = now
+            return self._entries[best]["value"]
+
+    def store(self, vector: List[float], generation: int, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._vectors.append(self._normalize(vector))
+            self._entries.append({
+                "generation": generation,
+                "value": value,
+                "last_used": now,
+                "expires": now + self.ttl if self.ttl else 0.0,
+            })
+            while len(self._entries) > self.maxsize:
+                lru = min(range(len(self._entries)),
+                          key=lambda i: self._entries[i]["last_used"])
+                self._drop(lru)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors.clear()
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
@@ -0,0 +1,19 @@
+"""Custom app mounted into the LangGraph server, see "http" in langgraph.json."""
+
+from contextlib import asynccontextmanager
+
+import anyio
+from starlette.applications import Starlette
+
+from api_mapping_agent.config import Config
+from api_mapping_agent.rag import warm_up_vectorstores
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Open the knowledge base store once at server start instead of on the first question
+    await anyio.to_thread.run_sync(warm_up_vectorstores, Config.KNOWLEDGE_BASE_VECTOR_STORE)
+    yield
+
+
+app = Starlette(lifespan=lifespan)
@@ -0,0 +1,281 @@
+"""Coalescing of identical in-flight calls.
+
+When the same request is already running (a double-submitted interrupt, several users
+asking the same question right after a doc update), later callers wait for the running
+call and share its result instead of sending a duplicate request upstream. Streams are
+shared too: a follower first replays the chunks that already arrived, then receives
+the rest as they come in.
+
+Works across threads and event loops. Results are shared objects; wrappers that hand
+them to code which mutates them must copy them per caller.
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from api_mapping_agent.config import Config
+
+
+class _SharedStream:
+    """Chunks of one upstream stream, readable by any number of consumers."""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def _wake(self) -> None:
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # The waiter's loop is closed
+
+    def publish(self, chunk: Any) -> None:
+        with self._cond:
+            self.chunks.append(chunk)
+            self._wake()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._wake()
+
+    def _snapshot(self, start: int) -> Tuple[List[Any], bool, Optional[BaseException]]:
+        # Chunks and the done flag are read together: once done, nothing more arrives
+        return self.chunks[start:], self.done, self.error
+
+    def read(self) -> Iterator[Any]:
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                new, done, error = self._snapshot(i)
+            i += len(new)
+            yield from new
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    async def aread(self) -> AsyncIterator[Any]:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._async_waiters.append(waiter)
+        try:
+            i = 0
+            while True:
+                waiter[1].clear()
+                with self._cond:
+                    new, done, error = self._snapshot(i)
+                i += len(new)
+                for chunk in new:
+                    yield chunk
+                if done:
+                    if error is not None:
+                        raise error
+                    return
+                if not new:
+                    await waiter[1].wait()
+        finally:
+            with self._cond:
+                self._async_waiters.remove(waiter)
+
+
+class SingleFlight:
+    """Table of in-flight calls keyed by a canonical request key."""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self._pumps: set = set()   # keeps running async pump tasks referenced
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            self.calls += 1
+            fut = self._calls.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, False
+            fut = Future()
+            self._calls[key] = fut
+            self.executed += 1
+            return fut, True
+
+    def _settle(self, key: Hashable, fut: Future, result: Any = None,
+                error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is None:
+            fut.set_result(result)
+        elif isinstance(error, Exception):
+            fut.set_exception(error)
+        else:
+            # The leader was cancelled or interrupted; followers run the call themselves
+            fut.cancel()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run `fn`, or wait for the identical call that is already running."""
+        while True:
+            fut, leader = self._join(key)
+            if not leader:
+                try:
+                    return fut.result()
+                except CancelledError:
+                    continue
+            try:
+                result = fn()
+            except BaseException as e:
+                self._settle(key, fut, error=e)
+                raise
+            self._settle(key, fut, result)
+            return result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async `do`."""
+        while True:
+            fut, leader = self._join(key)
+            if not leader:
+                try:
+                    return await asyncio.shield(asyncio.wrap_future(fut))
+                except (CancelledError, asyncio.CancelledError):
+                    if fut.cancelled():
+                        continue
+                    raise
+            try:
+                result = await fn()
+            except BaseException as e:
+                self._settle(key, fut, error=e)
+                raise
+            self._settle(key, fut, result)
+            return result
+
+    def _join_stream(self, key: Hashable) -> Tuple[_SharedStream, bool]:
+        with self._lock:
+            self.calls += 1
+            shared = self._streams.get(key)
+            if shared is not None:
+                self.coalesced += 1
+                return shared, False
+            shared = _SharedStream()
+            self._streams[key] = shared
+            self.executed += 1
+            return shared, True
+
+    def _end_stream(self, key: Hashable, shared: _SharedStream, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+        shared.finish(error)
+
+    def stream(self, key: Hashable, fn: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """Iterate the stream of `fn`, shared with identical concurrent streams.
+
+        The upstream iterator runs on its own thread, so it completes for the other
+        consumers even if the one that started it stops reading early.
+        """
+        shared, leader = self._join_stream(key)
+        if leader:
+            def pump() -> None:
+                try:
+                    for chunk in fn():
+                        shared.publish(chunk)
+                except BaseException as e:
+                    self._end_stream(key, shared, e)
+                else:
+                    self._end_stream(key, shared)
+
+            threading.Thread(target=contextvars.copy_context().run, args=(pump,),
+                             name=f"singleflight-{self.name}", daemon=True).start()
+        return shared.read()
+
+    async def astream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Async `stream`; the upstream iterator runs as a separate task."""
+        shared, leader = self._join_stream(key)
+        if leader:
+            async def pump() -> None:
+                try:
+                    async for chunk in fn():
+                        shared.publish(chunk)
+                except BaseException as e:
+                    self._end_stream(key, shared, e)
+                    if not isinstance(e, Exception):
+                        raise
+                else:
+                    self._end_stream(key, shared)
+
+            task = asyncio.ensure_future(pump())
+            self._pumps.add(task)
+            task.add_done_callback(self._pumps.discard)
+        async for chunk in shared.aread():
+            yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._streams),
+            }
+
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> Optional[SingleFlight]:
+    """Return the process-wide call table `name`, or None if coalescing is disabled."""
+    if not Config.SINGLE_FLIGHT_ENABLED:
+        return None
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = _flights[name] = SingleFlight(name)
+        return flight
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """Calls, upstream executions and saved (coalesced) calls per call table."""
+    with _flights_lock:
+        flights = dict(_flights)
+    return {name: flight.stats() for name, flight in flights.items()}
+
+
+class CoalescingEmbeddings(Embeddings):
+    """Embeddings wrapper that shares identical concurrent requests."""
+
+    def __init__(self, inner: Embeddings, model: str, flight: SingleFlight):
+        self.inner = inner
+        self.model = model
+        self.flight = flight
+
+    def _key(self, kind: str, texts: List[str]) -> Tuple[str, ...]:
+        return (self.model, kind, *texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.flight.do(self._key("documents", texts), lambda: self.inner.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.flight.do(self._key("query", [text]), lambda: self.inner.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.flight.ado(self._key("documents", texts), lambda: self.inner.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.flight.ado(self._key("query", [text]), lambda: self.inner.aembed_query(text))
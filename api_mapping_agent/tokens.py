@@ -0,0 +1,46 @@
+"""Token counting helpers based on tiktoken."""
+
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+import tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: Optional[str] = None) -> Optional[tiktoken.Encoding]:
+    """Return the tiktoken encoding for `model`, or None if it cannot be loaded."""
+    try:
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # e.g. the BPE file cannot be downloaded in an offline container
+        print(f"[warn] Could not load tiktoken encoding ({e}); estimating tokens")
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count the tokens of `text` for `model` (cl100k_base if unknown)."""
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Iterable[Any], model: Optional[str] = None) -> int:
+    """
+    Approximate prompt size of chat messages: content tokens plus the few tokens of
+    per-message framing the chat format adds.
+    """
+    total = 2
+    for message in messages:
+        content = getattr(message, "content", message)
+        if not isinstance(content, str):
+            content = str(content)
+        total += count_tokens(content, model) + 4
+    return total
@@ -0,0 +1,258 @@
+"""Content-addressed, per-thread storage of uploaded customer API data.
+
+Every upload is stored once under the SHA-256 of its content:
+
+    API_DATA_DIR/objects/<sha>/<filename>    the file (and its field catalog)
+    API_DATA_DIR/threads/<thread>/<sha>      reference of a thread to the object
+    collection "api-<sha prefix>"            RAG index of the object, a named
+                                             collection in API_DATA_VECTOR_STORE
+
+`api_file_path` in the graph state is the object path relative to API_DATA_DIR, so
+concurrent threads uploading a `schema.json` never overwrite each other, and every
+session uploading the same schema reuses its catalog and index instead of embedding
+it again. A janitor drops thread references unused for `API_DATA_TTL` seconds, then
+the objects (with their collection) that no thread references any more, and every
+collection not synced for `API_DATA_INDEX_TTL` seconds - it is rebuilt from its one
+file when needed again.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from api_mapping_agent.config import Config
+from api_mapping_agent.schema_ingest import CATALOG_SUFFIX
+
+OBJECTS_DIR = "objects"
+THREADS_DIR = "threads"
+COLLECTION_PREFIX = "api-"
+_HASH_CHUNK = 1 << 20
+
+_janitor_lock = threading.Lock()
+_last_janitor_run = 0.0
+
+
+def safe_filename(name: str) -> str:
+    """The file name part of a client supplied name; rejects names without one."""
+    name = Path(str(name).replace("\\", "/")).name
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid file name: {name!r}")
+    return name
+
+
+def _thread_key(thread_id: Optional[str]) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(thread_id or "default"))
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _object_dir(sha: str) -> Path:
+    return Config.API_DATA_DIR / OBJECTS_DIR / sha
+
+
+def _existing_object(sha: str) -> Optional[Path]:
+    """The stored file of object `sha`; catalogs and partial writes are not it."""
+    object_dir = _object_dir(sha)
+    if not object_dir.is_dir():
+        return None
+    for p in sorted(object_dir.iterdir()):
+        if p.is_file() and not p.name.startswith(".") and not p.name.endswith(CATALOG_SUFFIX):
+            return p
+    return None
+
+
+def _reference(sha: str, thread_id: Optional[str]) -> None:
+    ref = Config.API_DATA_DIR / THREADS_DIR / _thread_key(thread_id) / sha
+    ref.parent.mkdir(parents=True, exist_ok=True)
+    ref.touch()
+    os.utime(_object_dir(sha))
+
+
+def _relative(path: Path) -> str:
+    return path.relative_to(Config.API_DATA_DIR).as_posix()
+
+
+def _put(sha: str, filename: str, write) -> Path:
+    """Store object `sha` unless it exists; `write(tmp_path)` produces the content."""
+    existing = _existing_object(sha)
+    if existing is not None:
+        return existing
+    object_dir = _object_dir(sha)
+    object_dir.mkdir(parents=True, exist_ok=True)
+    target = object_dir / safe_filename(filename)
+    # Hidden temporary name in the same directory, so the final rename is atomic
+    tmp = object_dir / f".{target.name}.{threading.get_ident()}.tmp"
+    write(tmp)
+    os.replace(tmp, target)
+    return _existing_object(sha) or target
+
+
+def store_text(content: str, filename: str, thread_id: Optional[str]) -> str:
+    """Store inline uploaded content for `thread_id`; returns its `api_file_path`."""
+    data = content.encode("utf-8")
+    sha = hashlib.sha256(data).hexdigest()
+    path = _put(sha, filename, lambda tmp: tmp.write_bytes(data))
+    _reference(sha, thread_id)
+    evict_expired_throttled()
+    return _relative(path)
+
+
+def store_file(source: Path, thread_id: Optional[str], move: bool = True) -> str:
+    """Store the file `source` for `thread_id`; returns its `api_file_path`.
+
+    With `move` the file is moved into place (a rename on the same file system) and
+    removed if the content is stored already.
+    """
+    source = Path(source)
+    sha = _file_hash(source)
+
+    def write(tmp: Path) -> None:
+        (shutil.move if move else shutil.copyfile)(str(source), str(tmp))
+
+    path = _put(sha, source.name, write)
+    if move and source.exists():
+        source.unlink()
+    _reference(sha, thread_id)
+    evict_expired_throttled()
+    return _relative(path)
+
+
+def resolve_upload(path: str) -> Path:
+    """Validate an out-of-band upload path and return it resolved.
+
+    Only regular files inside `Config.API_UPLOAD_DIR` up to `Config.API_UPLOAD_MAX_MB`
+    are accepted, so a payload cannot point the agent at arbitrary server files.
+    """
+    upload_dir = Config.API_UPLOAD_DIR.resolve()
+    resolved = Path(path).resolve()
+    if not resolved.is_relative_to(upload_dir):
+        raise ValueError(f"Upload path is outside the upload directory: {path}")
+    if not resolved.is_file():
+        raise ValueError(f"Uploaded file not found: {path}")
+    size = resolved.stat().st_size
+    if size > Config.API_UPLOAD_MAX_MB * 1024 * 1024:
+        raise ValueError(
+            f"Uploaded file is too large ({size / 1024 / 1024:.0f} MB, at most {Config.API_UPLOAD_MAX_MB} MB)")
+    return resolved
+
+
+def store_upload(path: str, thread_id: Optional[str]) -> str:
+    """Move a validated out-of-band upload into the store; returns its `api_file_path`."""
+    source = resolve_upload(path)
+    api_file_path = store_file(source, thread_id)
+    # The UI writes every upload into a directory of its own
+    if source.parent != Config.API_UPLOAD_DIR.resolve():
+        try:
+            source.parent.rmdir()
+        except OSError:
+            pass
+    return api_file_path
+
+
+def content_hash(api_file_path: str) -> Optional[str]:
+    """SHA-256 of a stored object from its `api_file_path`, None for other paths."""
+    parts = Path(api_file_path).parts
+    if len(parts) == 3 and parts[0] == OBJECTS_DIR and re.fullmatch(r"[0-9a-f]{64}", parts[1]):
+        return parts[1]
+    return None
+
+
+def as_object(api_data_file: Path) -> Path:
+    """The stored object of `api_data_file`; files written directly into API_DATA_DIR
+    by older versions are copied into the store first."""
+    try:
+        relative = _relative(Path(api_data_file))
+    except ValueError:
+        relative = ""
+    if content_hash(relative):
+        return Path(api_data_file)
+    return Config.API_DATA_DIR / store_file(Path(api_data_file), thread_id=None, move=False)
+
+
+def index_collection(api_object: Path) -> str:
+    """Name of the collection in `API_DATA_VECTOR_STORE` that indexes a stored object,
+    shared by all threads using it."""
+    return f"{COLLECTION_PREFIX}{Path(api_object).parent.name[:32]}"
+
+
+def touch(api_file_path: str, thread_id: Optional[str]) -> None:
+    """Mark an object as in use by `thread_id`, which restarts its TTL."""
+    sha = content_hash(api_file_path)
+    if sha and _object_dir(sha).is_dir():
+        _reference(sha, thread_id)
+
+
+def evict_expired(max_age: Optional[float] = None, now: Optional[float] = None,
+                  index_max_age: Optional[float] = None) -> Dict[str, int]:
+    """Drop thread references older than `max_age` seconds, then every object that is
+    no longer referenced and was not used within `max_age` either, then the collections
+    of dropped objects and those not synced within `index_max_age` seconds."""
+    from api_mapping_agent.rag import collections_last_used, drop_collection
+
+    max_age = Config.API_DATA_TTL if max_age is None else max_age
+    index_max_age = Config.API_DATA_INDEX_TTL if index_max_age is None else index_max_age
+    now = time.time() if now is None else now
+    cutoff = now - max_age
+    stats = {"references": 0, "objects": 0, "collections": 0}
+    threads_dir = Config.API_DATA_DIR / THREADS_DIR
+    referenced = set()
+    if threads_dir.is_dir():
+        for thread_dir in threads_dir.iterdir():
+            for ref in thread_dir.iterdir():
+                if ref.stat().st_mtime < cutoff:
+                    ref.unlink(missing_ok=True)
+                    stats["references"] += 1
+                else:
+                    referenced.add(ref.name)
+            try:
+                thread_dir.rmdir()
+            except OSError:
+                pass  # still referencing objects
+
+    objects_dir = Config.API_DATA_DIR / OBJECTS_DIR
+    live = set()
+    if objects_dir.is_dir():
+        for object_dir in objects_dir.iterdir():
+            # The object mtime guards uploads whose reference is not written yet
+            if object_dir.name in referenced or object_dir.stat().st_mtime >= cutoff:
+                live.add(index_collection(object_dir / "_"))
+                continue
+            shutil.rmtree(object_dir, ignore_errors=True)
+            stats["objects"] += 1
+
+    index_cutoff = now - index_max_age if index_max_age > 0 else float("-inf")
+    for name, last_used in collections_last_used(Config.API_DATA_VECTOR_STORE).items():
+        if name.startswith(COLLECTION_PREFIX) and (name not in live or last_used < index_cutoff):
+            drop_collection(Config.API_DATA_VECTOR_STORE, name)
+            stats["collections"] += 1
+    if any(stats.values()):
+        print(f"API data janitor evicted {stats['references']} thread references, "
+              f"{stats['objects']} objects, {stats['collections']} collections")
+    return stats
+
+
+def evict_expired_throttled() -> None:
+    """Run the janitor at most every `API_DATA_JANITOR_INTERVAL` seconds."""
+    global _last_janitor_run
+    if Config.API_DATA_TTL <= 0:
+        return
+    now = time.time()
+    with _janitor_lock:
+        if now - _last_janitor_run < Config.API_DATA_JANITOR_INTERVAL:
+            return
+        _last_janitor_run = now
+        try:
+            evict_expired(now=now)
+        except OSError as e:
+            print(f"[warn] API data janitor failed: {e}")
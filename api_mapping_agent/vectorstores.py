@@ -0,0 +1,338 @@
+"""Pluggable vector store backends used by `rag`.
+
+`ChromaBackend` wraps a persistent (or in-memory) Chroma collection. `NumpyBackend`
+keeps normalized float32 embeddings in a memory-mapped `.npy` matrix with the chunk
+texts and metadata in a JSON file next to it (both in one version directory), and
+answers queries with a vectorized cosine top-k / MMR - for a corpus of a few hundred
+chunks that is faster to open and to query than Chroma's SQLite store. The backend is selected with `Config.VECTOR_BACKEND`.
+
+A store directory holds one default collection and any number of named ones (Chroma
+collections in the same database; for numpy a subdirectory of `COLLECTIONS_DIR`).
+"""
+
+import json
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from api_mapping_agent.config import Config
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+COLLECTIONS_DIR = "collections"
+
+
+class VectorBackend(ABC):
+    """The operations indexing and retrieval need from a vector store."""
+
+    name = ""
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def upsert(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], vectors: List[List[float]]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """Return {"ids", "documents", "metadatas"} for `ids` (all chunks if None)."""
+
+    @abstractmethod
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Merge metadata into existing chunks; a value of None removes the key."""
+
+    @abstractmethod
+    def search(self, query: str, k: int = 5, mmr: bool = True, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Document]:
+        ...
+
+    def flush(self) -> None:
+        """Persist pending writes (no-op for backends that write through)."""
+
+    @abstractmethod
+    def drop(self) -> None:
+        """Delete the collection with all its chunks."""
+
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+
+    def __init__(self, store_dir: Optional[Path], embedder: Embeddings, collection: Optional[str] = None):
+        # store_dir=None gives an in-memory collection
+        kwargs = {"collection_name": collection} if collection else {}
+        if store_dir is None:
+            self.vs = Chroma(embedding_function=embedder, **kwargs)
+        else:
+            self.vs = Chroma(persist_directory=str(store_dir),
+                             embedding_function=embedder, **kwargs)
+
+    def count(self) -> int:
+        return self.vs._collection.count()
+
+    def upsert(self, ids, texts, metadatas, vectors) -> None:
+        self.vs._collection.upsert(ids=ids, embeddings=vectors,
+                                   documents=texts, metadatas=metadatas)
+
+    def delete(self, ids: List[str]) -> None:
+        self.vs.delete(ids=ids)
+
+    def get(self, ids: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        got = self.vs.get(ids=ids, include=["documents", "metadatas"])
+        return {"ids": got.get("ids") or [],
+                "documents": got.get("documents") or [],
+                "metadatas": got.get("metadatas") or []}
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        # Chroma merges metadata on update; None removes the key
+        self.vs._collection.update(ids=ids, metadatas=metadatas)
+
+    def search(self, query: str, k: int = 5, mmr: bool = True, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Document]:
+        if mmr:
+            retriever = self.vs.as_retriever(
+                search_type="mmr",
+                search_kwargs={"k": k, "fetch_k": fetch_k,
+                               "lambda_mult": lambda_mult},
+            )
+            return retriever.invoke(query)
+        return self.vs.similarity_search(query, k=k)
+
+    def drop(self) -> None:
+        self.vs.delete_collection()
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """Maximal marginal relevance over normalized vectors; returns candidate row indexes."""
+    if not len(candidates) or k <= 0:
+        return []
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    redundancy = pairwise[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return selected
+
+
+class NumpyBackend(VectorBackend):
+    """Brute-force cosine search over a memory-mapped embedding matrix.
+
+    Every flush writes the matrix and the records into a new, uniquely named version
+    directory and then switches the `CURRENT` pointer file to it, so concurrent writers
+    (also in other processes) never share files and readers always see a matching pair.
+    The replaced version stays until the next flush for readers that are opening it.
+    """
+
+    name = "numpy"
+    VECTORS_FILE = "vectors.npy"
+    RECORDS_FILE = "records.json"
+    CURRENT_FILE = "CURRENT"
+    _OPEN_ATTEMPTS = 3
+
+    def __init__(self, store_dir: Path, embedder: Embeddings):
+        self.store_dir = Path(store_dir)
+        self.embedder = embedder
+        self._dirty = False
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+        for _ in range(self._OPEN_ATTEMPTS):
+            version_dir = self._current_dir()
+            try:
+                records = json.loads((version_dir / self.RECORDS_FILE).read_text(encoding="utf-8"))
+                # Read-only mapping: opening is O(1), pages load on first query
+                matrix = np.load(version_dir / self.VECTORS_FILE, mmap_mode="r")
+            except FileNotFoundError:
+                # A writer removed this version meanwhile, unless the store is new
+                if self._current_dir() != version_dir:
+                    continue
+                break
+            if len(records["ids"]) == matrix.shape[0]:
+                self._ids = records["ids"]
+                self._documents = records["documents"]
+                self._metadatas = records["metadatas"]
+                self._matrix = matrix
+            else:
+                # Corrupted store: open it empty, the next flush rewrites it
+                print(f"[warn] Vector store {version_dir} is inconsistent "
+                      f"({len(records['ids'])} records, {matrix.shape[0]} vectors), ignoring it")
+                self._dirty = True
+            break
+        self._positions = {id_: i for i, id_ in enumerate(self._ids)}
+
+    def _current_dir(self) -> Path:
+        """Version directory the pointer file names; stores written before versioning
+        keep their files in `store_dir` itself."""
+        try:
+            version = (self.store_dir / self.CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return self.store_dir
+        return self.store_dir / version
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def upsert(self, ids, texts, metadatas, vectors) -> None:
+        rows = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        matrix = np.array(self._matrix) if len(self._ids) else \
+            np.zeros((0, rows.shape[1]), dtype=np.float32)
+        new_rows = []
+        for id_, text, meta, row in zip(ids, texts, metadatas, rows):
+            pos = self._positions.get(id_)
+            if pos is None:
+                self._positions[id_] = len(self._ids)
+                self._ids.append(id_)
+                self._documents.append(text)
+                self._metadatas.append(dict(meta or {}))
+                new_rows.append(row)
+            else:
+                self._documents[pos] = text
+                self._metadatas[pos] = dict(meta or {})
+                matrix[pos] = row
+        if new_rows:
+            matrix = np.vstack([matrix, np.stack(new_rows)])
+        self._matrix = matrix
+        self._dirty = True
+
+    def delete(self, ids: List[str]) -> None:
+        drop = {self._positions[id_] for id_ in ids if id_ in self._positions}
+        if not drop:
+            return
+        keep = [i for i in range(len(self._ids)) if i not in drop]
+        self._matrix = np.array(self._matrix[keep]) if keep else \
+            np.zeros((0, self._matrix.shape[1]), dtype=np.float32)
+        self._ids = [self._ids[i] for i in keep]
+        self._documents = [self._documents[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._positions = {id_: i for i, id_ in enumerate(self._ids)}
+        self._dirty = True
+
+    def get(self, ids: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        positions = range(len(self._ids)) if ids is None else \
+            [self._positions[id_] for id_ in ids if id_ in self._positions]
+        return {"ids": [self._ids[i] for i in positions],
+                "documents": [self._documents[i] for i in positions],
+                "metadatas": [self._metadatas[i] for i in positions]}
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        for id_, update in zip(ids, metadatas):
+            pos = self._positions.get(id_)
+            if pos is None:
+                continue
+            meta = self._metadatas[pos]
+            for key, value in update.items():
+                if value is None:
+                    meta.pop(key, None)
+                else:
+                    meta[key] = value
+            self._dirty = True
+
+    def search(self, query: str, k: int = 5, mmr: bool = True, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Document]:
+        if not self._ids:
+            return []
+        q = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        scores = self._matrix @ q
+        n = min(fetch_k if mmr else k, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        if mmr:
+            top = top[mmr_select(q, np.asarray(self._matrix[top]), k, lambda_mult)]
+        return [Document(page_content=self._documents[i], metadata=self._metadatas[i], id=self._ids[i])
+                for i in top]
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        previous = self._current_dir()
+        number = self._version_number(previous.name) + 1 if previous != self.store_dir else 1
+        version_dir = self.store_dir / f"v{number}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        version_dir.mkdir()
+        vectors_path = version_dir / self.VECTORS_FILE
+        np.save(vectors_path, np.ascontiguousarray(self._matrix, dtype=np.float32))
+        (version_dir / self.RECORDS_FILE).write_text(
+            json.dumps({"ids": self._ids, "documents": self._documents,
+                        "metadatas": self._metadatas}), encoding="utf-8")
+        pointer = self.store_dir / self.CURRENT_FILE
+        tmp_pointer = self.store_dir / f".{self.CURRENT_FILE}.{version_dir.name}.tmp"
+        tmp_pointer.write_text(version_dir.name, encoding="utf-8")
+        tmp_pointer.replace(pointer)
+        self._remove_versions(current=version_dir, previous=previous)
+        self._matrix = np.load(vectors_path, mmap_mode="r")
+        self._dirty = False
+
+    @staticmethod
+    def _version_number(name: str) -> int:
+        head = name.split("-", 1)[0]
+        return int(head[1:]) if head[:1] == "v" and head[1:].isdigit() else 0
+
+    def _version_dirs(self) -> List[Path]:
+        if not self.store_dir.is_dir():
+            return []
+        return [p for p in self.store_dir.glob("v*") if p.is_dir() and self._version_number(p.name)]
+
+    def _remove_versions(self, current: Optional[Path] = None, previous: Optional[Path] = None) -> None:
+        """Remove the versions written before `previous`, or all without `current`.
+        `previous` stays for readers still opening it, and versions other writers are
+        creating meanwhile are newer than it."""
+        if previous != self.store_dir:
+            for name in (self.VECTORS_FILE, self.RECORDS_FILE):
+                (self.store_dir / name).unlink(missing_ok=True)
+        cutoff = None
+        if current is not None:
+            if previous is None or previous == self.store_dir:
+                return
+            try:
+                cutoff = previous.stat().st_mtime
+            except FileNotFoundError:
+                return
+        for version_dir in self._version_dirs():
+            if version_dir in (current, previous):
+                continue
+            try:
+                if cutoff is None or version_dir.stat().st_mtime < cutoff:
+                    shutil.rmtree(version_dir, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+    def drop(self) -> None:
+        (self.store_dir / self.CURRENT_FILE).unlink(missing_ok=True)
+        self._remove_versions()
+        self.__init__(self.store_dir, self.embedder)
+
+
+def open_backend(store_dir: Optional[Path], embedder: Embeddings, backend: Optional[str] = None,
+                 collection: Optional[str] = None) -> VectorBackend:
+    """Open the configured backend for `store_dir` (None: in-memory Chroma), optionally
+    one of its named collections."""
+    backend = (backend or Config.VECTOR_BACKEND).lower()
+    if store_dir is None or backend == "chroma":
+        return ChromaBackend(store_dir, embedder, collection)
+    if backend == "numpy":
+        return NumpyBackend(Path(store_dir) / COLLECTIONS_DIR / collection if collection else store_dir, embedder)
+    raise ValueError(
+        f"Unknown vector backend {backend!r}, expected one of {VECTOR_BACKENDS}")
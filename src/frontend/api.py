@@ -8,7 +8,12 @@ To see the full API documentation, see your API docs at `http://localhost:2024/d
 from langgraph_sdk import get_sync_client
 from langgraph_sdk.schema import Command
 from dotenv import load_dotenv
-from typing import Iterator, Tuple, Literal, Dict, Any
+from typing import Iterator, Tuple, Literal, Dict, Any, BinaryIO
+from pathlib import Path
+from uuid import uuid4
+import os
+import shutil
+import tempfile
 
 load_dotenv()
 
@@ -18,7 +23,28 @@ langgraph_api = "http://localhost:2024"
 # Initialize the client that will handle all API requests to the Langgraph Server
 client = get_sync_client(url=langgraph_api)
 
-EventKind = Literal["ai_chunk", "interrupt", "tool", "done", "other"]
+EventKind = Literal["ai_chunk", "ai_replace", "interrupt", "tool", "done", "other"]
+
+# Run metadata of an LLM call that replaces an already streamed answer which failed the
+# acceptance check (REPLACES_MESSAGE_KEY in api_mapping_agent/llm.py)
+REPLACES_MESSAGE_KEY = "replaces_message_id"
+
+# Uploads above this size are not sent inline with the interrupt payload but written
+# to the upload directory shared with the Langgraph Server (same WRITABLE_ROOT)
+UPLOAD_INLINE_MAX_BYTES = int(
+    os.getenv("API_UPLOAD_INLINE_MAX_MB", "5")) * 1024 * 1024
+UPLOAD_DIR = Path(os.getenv("WRITABLE_ROOT", tempfile.gettempdir())) / \
+    "api_mapping_agent" / "uploads"
+
+
+def store_upload(file: BinaryIO, filename: str) -> str:
+    """Stream an uploaded file into the shared upload directory and return its path."""
+    target = UPLOAD_DIR / uuid4().hex / Path(filename).name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    file.seek(0)
+    with open(target, "wb") as out:
+        shutil.copyfileobj(file, out, 1024 * 1024)
+    return str(target)
 
 
 def get_assistants():
@@ -100,14 +126,35 @@ def run_thread_stream(assistant_id: str, thread_id: str, input: dict[str, Any]):
                     yield chunk.data[0]["content"]
 
 
+def _message_text(content: Any) -> str:
+    """Text of a message's content, which is a string or a list of content blocks."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(block.get("text", "") if isinstance(block, dict) else str(block)
+                       for block in content)
+    return ""
+
+
 def run_thread_events(
     assistant_id: str,
     thread_id: str,
     initial_input: Dict[str, Any] | None = None,
     resume_payload: Dict[str, Any] | None = None,
 ) -> Iterator[Tuple[EventKind, Any]]:
+    """
+    Run the graph and yield ("ai_chunk", text) pieces as the LLM generates them, and
+    ("interrupt", ...) when the graph stops for user input.
+
+    Tokens come from the "messages-tuple" stream, interrupts from the "updates" stream.
+    AI messages that a node returns without streaming (fixed texts, cached answers) arrive
+    as complete messages in either stream and are yielded once. Consecutive messages are
+    separated by a blank line. When an answer is escalated to a stronger model, the
+    rejected answer already streamed is taken back with ("ai_replace", text): the text
+    shown so far without it.
+    """
     kwargs = {"thread_id": thread_id,
-              "assistant_id": assistant_id, "stream_mode": "updates"}
+              "assistant_id": assistant_id, "stream_mode": ["updates", "messages-tuple"]}
     if resume_payload is not None:
         # RESUME PATH
         print("DEBUG: Run thread with payload:", resume_payload)
@@ -117,7 +164,47 @@ def run_thread_events(
         print("DEBUG: Starting fresh run with initial input:", initial_input)
         kwargs["input"] = initial_input or {}
 
+    seen_ids: set[str] = set()
+    last_text_id = None
+    # (message id, text) of everything yielded so far, separators included
+    shown: list[Tuple[str | None, str]] = []
+
+    def text_event(message_id: str | None, text: str) -> Iterator[Tuple[EventKind, Any]]:
+        nonlocal last_text_id
+        if last_text_id is not None and message_id != last_text_id:
+            shown.append((message_id, "\n\n"))
+            yield ("ai_chunk", "\n\n")
+        last_text_id = message_id
+        shown.append((message_id, text))
+        yield ("ai_chunk", text)
+
+    def retract(message_id: str) -> Iterator[Tuple[EventKind, Any]]:
+        nonlocal last_text_id
+        if not any(id_ == message_id for id_, _ in shown):
+            return
+        shown[:] = [(id_, text) for id_, text in shown if id_ != message_id]
+        last_text_id = shown[-1][0] if shown else None
+        yield ("ai_replace", "".join(text for _, text in shown))
+
     for chunk in client.runs.stream(**kwargs):
+        if chunk.event == "messages":
+            message, metadata = chunk.data
+            if message.get("type") not in ("AIMessageChunk", "ai"):
+                continue
+            message_id = message.get("id")
+            # The complete message follows its own tokens only if it was not streamed
+            if message.get("type") == "ai" and message_id in seen_ids:
+                continue
+            if message_id not in seen_ids:
+                replaced = (metadata or {}).get(REPLACES_MESSAGE_KEY)
+                if replaced:
+                    yield from retract(replaced)
+            seen_ids.add(message_id)
+            text = _message_text(message.get("content"))
+            if text:
+                yield from text_event(message_id, text)
+            continue
+
         if chunk.event != "updates":
             yield ("other", {"event": chunk.event, "data": chunk.data})
             continue
@@ -131,12 +218,15 @@ def run_thread_events(
                 yield ("interrupt", items)
             continue
 
-        # surface AI text
+        # surface AI text that did not come through the messages stream
         for node_name, node_payload in data.items():
             if isinstance(node_payload, dict):
                 for m in node_payload.get("messages") or []:
-                    if m.get("type") == "ai":
-                        yield ("ai_chunk", m.get("content", ""))
+                    if m.get("type") == "ai" and (m.get("id") is None or m.get("id") not in seen_ids):
+                        seen_ids.add(m.get("id"))
+                        text = _message_text(m.get("content"))
+                        if text:
+                            yield from text_event(m.get("id"), text)
 
 
 async def main():
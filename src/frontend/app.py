@@ -6,11 +6,14 @@ This is a basic chat app/UI for interacting with Langgraph Agents via the Langgr
 This is a great starting point for learning how to build a full-stack AI application.
 """
 import json
+import time
 import streamlit as st
 from pathlib import Path
 from api import (
+    UPLOAD_INLINE_MAX_BYTES,
     get_thread_state,
     run_thread_events,
+    store_upload,
 )
 from utils import render_initial_message
 from sidebar import render_sidebar
@@ -19,12 +22,28 @@ from state import initialize_session_state
 
 initialize_session_state(user_id="valdrin")
 
+# Minimum seconds between redraws of a streaming answer; every redraw sends the
+# whole markdown again, so redrawing per token slows down long mapping answers
+STREAM_REDRAW_INTERVAL = 0.05
+
 # Perform deferred rerun if requested by interrupt/resume callbacks
 if st.session_state.get("trigger_rerun", False):
     st.session_state.trigger_rerun = False
     st.rerun()
 
 
+def render_partial(placeholder, buffer: str, last_redraw: float) -> float:
+    """
+    Redraw a streaming answer with a cursor if the last redraw is old enough.
+    Returns the time of the last redraw.
+    """
+    now = time.monotonic()
+    if now - last_redraw < STREAM_REDRAW_INTERVAL:
+        return last_redraw
+    placeholder.markdown(buffer + "▌")
+    return now
+
+
 def handle_resume_if_needed():
     """
     If a resume is in progress, perform it (using Command(resume=...)),
@@ -43,6 +62,7 @@ def handle_resume_if_needed():
 
     with st.chat_message("assistant"):
         buffer = ""
+        last_redraw = 0.0
         placeholder = st.empty()
         for kind, data in run_thread_events(
             st.session_state.active_assistant_id,
@@ -50,9 +70,10 @@ def handle_resume_if_needed():
             initial_input=None,
             resume_payload=resume_payload,
         ):
-            if kind == "ai_chunk":
-                buffer += data or ""
-                placeholder.markdown(buffer)
+            if kind in ("ai_chunk", "ai_replace"):
+                # "ai_replace" takes back an answer that was escalated to another model
+                buffer = (data or "") if kind == "ai_replace" else buffer + (data or "")
+                last_redraw = render_partial(placeholder, buffer, last_redraw)
             elif kind == "interrupt":
                 # New interrupt: stash & rerun so the controls show next run
                 val = (data or {}).get(
@@ -64,6 +85,7 @@ def handle_resume_if_needed():
                 break
             else:
                 pass
+        placeholder.markdown(buffer)
 
     # After finishing resume streaming, rerun to refresh thread state & normal UI
     st.rerun()
@@ -255,6 +277,17 @@ def render_interrupt_controls_if_pending() -> bool:
                     "Please fill in all fields and upload a file.")
                 return
 
+            if api_metadata_file.size > UPLOAD_INLINE_MAX_BYTES:
+                # Keep large files out of the payload (and the thread checkpoints)
+                st.session_state.resume_payload = {
+                    "system_name": system_name,
+                    "process": process,
+                    "api_metadata_path": store_upload(api_metadata_file, api_metadata_file.name),
+                }
+                st.session_state.is_resuming = True
+                st.session_state.trigger_rerun = True
+                return
+
             file_content = api_metadata_file.getvalue()
             if isinstance(file_content, bytes):
                 try:
@@ -281,7 +314,7 @@ def render_interrupt_controls_if_pending() -> bool:
             st.text_input("System name:", key="system_name")
             st.text_input("Process:", key="process")
             st.file_uploader("Upload existing API metadata:",
-                             type=["json", "xml", "csv", "yaml", "txt"], key="api_metadata_file")
+                             type=["json", "xml", "xsd", "csv", "yaml", "yml", "txt"], key="api_metadata_file")
             st.button("Send data", type="primary",
                       on_click=_resume_with_api_data)
 
@@ -494,7 +527,9 @@ if prompt and not interrupt_active and not has_question_enabled_interrupt:
     # Stream assistant response and capture interrupts
     with st.chat_message("assistant"):
         buffer = ""
+        last_redraw = 0.0
         placeholder = st.empty()
+        placeholder.markdown("_Thinking..._")
         received_content = False
 
         for kind, data in run_thread_events(
@@ -503,9 +538,10 @@ if prompt and not interrupt_active and not has_question_enabled_interrupt:
             initial_input={"messages": messages_to_send},
             resume_payload=None,
         ):
-            if kind == "ai_chunk":
-                buffer += data or ""
-                placeholder.markdown(buffer)
+            if kind in ("ai_chunk", "ai_replace"):
+                # "ai_replace" takes back an answer that was escalated to another model
+                buffer = (data or "") if kind == "ai_replace" else buffer + (data or "")
+                last_redraw = render_partial(placeholder, buffer, last_redraw)
                 received_content = True
             elif kind == "interrupt":
                 # Persist interrupt and rerun so the gate shows controls next run
@@ -519,8 +555,8 @@ if prompt and not interrupt_active and not has_question_enabled_interrupt:
             else:
                 pass
 
-        # If no content was received, show a placeholder
-        if not received_content and not buffer:
-            placeholder.markdown("_Thinking..._")
+        # Final redraw without the cursor; without content the placeholder stays
+        if received_content:
+            placeholder.markdown(buffer)
 
     st.rerun()
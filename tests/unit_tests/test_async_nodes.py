@@ -0,0 +1,52 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.types import Command
+
+from api_mapping_agent import llm as llm_module
+from api_mapping_agent.api_mapping_graph import nodes
+from api_mapping_agent.api_mapping_graph.graph import build_graph
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    llm = FakeListChatModel(responses=["the answer"])
+    monkeypatch.setattr(llm_module, "get_llm", lambda route=None: llm)
+    # Skip the knowledge base; only the prompt plumbing is under test
+    monkeypatch.setattr(nodes, "_question_prompt", lambda question, system_prompt, prov=None: [
+        SystemMessage(content=system_prompt), HumanMessage(content=question)])
+    return llm
+
+
+@pytest.mark.anyio
+async def test_async_graph_answers_side_questions_and_resumes(fake_llm):
+    graph = build_graph(use_async=True).builder.compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": "async-nodes"}}
+
+    result = await graph.ainvoke({"messages": []}, config)
+    assert result["__interrupt__"][0].value["type"] == "start_or_question"
+
+    result = await graph.ainvoke(Command(resume={"question": "What is a client?"}), config)
+    assert [m.content for m in result["messages"]] == ["What is a client?", "the answer"]
+    assert result["__interrupt__"][0].value["type"] == "start_or_question"
+
+    result = await graph.ainvoke(Command(resume={"decision": "start"}), config)
+    assert result["__interrupt__"][0].value["type"] == "ask_endpoints"
+
+
+def test_sync_and_async_graphs_share_the_node_logic(fake_llm):
+    graph = build_graph().builder.compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": "sync-nodes"}}
+
+    graph.invoke({"messages": []}, config)
+    result = graph.invoke(Command(resume={"question": "What is a client?"}), config)
+    assert [m.content for m in result["messages"]] == ["What is a client?", "the answer"]
+
+
+def test_qa_answers_revising_the_mapping_replace_the_mapping_result():
+    window = nodes.HistoryWindow([], None, 0, False)
+    revised = "Updated **Field Mapping Table**:\n\n| AEB field | Customer field |\n|---|---|\n| name | NAME2 |"
+
+    assert nodes._qa_update(window, AIMessage(revised))["mapping_result"] == revised
+    assert "mapping_result" not in nodes._qa_update(window, AIMessage("The pc field is the postal code."))
@@ -0,0 +1,27 @@
+from api_mapping_agent.bm25 import BM25Index, identifiers, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Set suppressLogging.") == [
+        "set", "suppresslogging", "suppress", "logging"]
+    assert identifiers("What is client_ident_code or addressType?") == [
+        "client_ident_code", "addresstype"]
+
+
+def test_search_ranks_exact_identifier_first(tmp_path):
+    index = BM25Index()
+    index.add("a", "suppressLogging disables logging of the check.", "a.md")
+    index.add("b", "Logging of all checks is enabled by default.", "b.md")
+    index.add("c", "addressType is entity or individual.", "c.md")
+
+    hits = index.search("what does suppressLogging do?")
+    assert hits[0][0] == "a"
+
+    index.save(tmp_path / "bm25.json")
+    loaded = BM25Index.load(tmp_path / "bm25.json")
+    assert loaded.search("addressType")[0][0] == "c"
+
+    loaded.remove("c")
+    assert loaded.search("addressType") == []
+    assert loaded.reconcile(["a", "d"]) == ["d"]
+    assert len(loaded) == 1
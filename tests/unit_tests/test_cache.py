@@ -0,0 +1,25 @@
+import time
+
+from api_mapping_agent.cache import TTLCache
+
+
+def test_lru_eviction_and_hit_rate():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["evictions"] == 1 and stats["size"] == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
@@ -0,0 +1,49 @@
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from api_mapping_agent.embedding_batcher import EmbeddingBatcher
+
+
+class FlakyEmbeddings(Embeddings):
+    def __init__(self, fail_first_for: str):
+        self.fail_first_for = fail_first_for
+        self.failed = False
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.calls += 1
+            if self.fail_first_for in texts and not self.failed:
+                self.failed = True
+                raise RuntimeError("429")
+        return [[1.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0]
+
+
+def _items(n):
+    return [(f"chunk number {i}", {"source": "x"}, f"id{i}") for i in range(n)]
+
+
+def test_batches_respect_token_and_input_limits():
+    batcher = EmbeddingBatcher(FlakyEmbeddings(""), lambda *a: None,
+                               max_tokens_per_batch=10, max_inputs_per_batch=3)
+    batches = list(batcher.iter_batches(_items(7)))
+    assert all(len(b) <= 3 and b.tokens <= 10 for b in batches)
+    assert sum(len(b) for b in batches) == 7
+
+
+def test_failed_batch_is_retried_on_its_own():
+    written = []
+    emb = FlakyEmbeddings(fail_first_for="chunk number 4")
+    batcher = EmbeddingBatcher(emb, lambda texts, metas, ids, vecs: written.extend(ids),
+                               max_inputs_per_batch=2, max_in_flight=2, retry_base_delay=0)
+    stats = batcher.run(_items(6))
+
+    assert sorted(written) == [f"id{i}" for i in range(6)]
+    assert stats["batches"] == 3 and stats["failed_batches"] == 0
+    # three batches plus exactly one retry
+    assert emb.calls == 4
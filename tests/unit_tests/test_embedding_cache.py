@@ -0,0 +1,49 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from api_mapping_agent.embedding_cache import CachedEmbeddings, EmbeddingCache
+from api_mapping_agent.rag import _hash_text
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    def embed_query(self, text):
+        return [0.0, 0.0, 0.0]
+
+
+def test_chunks_are_embedded_once_per_model(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_bytes=1024 * 1024)
+    inner = CountingEmbeddings()
+    emb = CachedEmbeddings(inner, "model-a", cache, _hash_text)
+
+    first = emb.embed_documents(["Hello  World", "other"])
+    # Same normalized text, repeated within one call
+    second = emb.embed_documents(["hello world", "other", "other"])
+
+    assert inner.embedded == ["Hello  World", "other"]
+    assert second == [first[0], first[1], first[1]]
+    assert cache.stats()["hits"] == 2
+
+    CachedEmbeddings(inner, "model-b", cache, _hash_text).embed_documents(["other"])
+    assert inner.embedded[-1] == "other"
+    assert len(inner.embedded) == 3
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # Each 3-dim float32 vector takes 12 bytes
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_bytes=40)
+    for i in range(5):
+        cache.put_many("m", {f"k{i}": [1.0, 2.0, 3.0]})
+
+    stats = cache.stats()
+    assert stats["size_bytes"] <= 40
+    assert stats["evictions"] > 0
+    assert "k4" in cache.get_many("m", ["k0", "k4"])
+    assert "k0" not in cache.get_many("m", ["k0"])
@@ -0,0 +1,95 @@
+import json
+
+from api_mapping_agent.api_mapping_graph.field_matcher import (
+    edit_distance, match_fields, parse_schema_fields, prematch_schema)
+
+
+OPENAPI = {
+    "openapi": "3.0.0",
+    "components": {"schemas": {
+        "Order": {"type": "object", "properties": {
+            "orderNumber": {"type": "string"},
+            "shipTo": {"$ref": "#/components/schemas/Partner"},
+            "lines": {"type": "array", "items": {"$ref": "#/components/schemas/Line"}},
+        }},
+        "Partner": {"type": "object", "properties": {
+            "partnerId": {"type": "string"},
+            "companyName": {"type": "string", "description": "Legal name"},
+            "Name2": {"type": "string"},
+            "streetAddress": {"type": "string"},
+            "zipCode": {"type": "string"},
+            "City": {"type": "string"},
+            "countryCode": {"type": "string"},
+            "parent": {"$ref": "#/components/schemas/Partner"},
+        }},
+        "Line": {"type": "object", "properties": {
+            "sku": {"type": "string"},
+            "quantity": {"type": "number"},
+        }},
+    }},
+}
+
+
+def _best(matches):
+    return {m.target: m.candidates[0].field.path for m in matches}
+
+
+def test_openapi_fields_follow_refs_without_recursing_forever():
+    paths = {f.path for f in parse_schema_fields(json.dumps(OPENAPI), "api.json")}
+
+    assert "Order.shipTo.zipCode" in paths
+    assert "Order.lines[].sku" in paths
+    assert "Partner.parent.City" in paths
+    assert not any("parent.parent" in p for p in paths)
+
+
+def test_fields_are_matched_by_synonyms_tokens_and_edit_distance():
+    fields = parse_schema_fields(json.dumps(OPENAPI), "api.json")
+    best = _best(match_fields(fields))
+
+    assert best["name"].endswith("companyName")
+    assert best["name2"].endswith("Name2")
+    assert best["street"].endswith("streetAddress")
+    assert best["pc"].endswith("zipCode")
+    assert best["countryISO"].endswith("countryCode")
+    assert best["referenceId"].endswith("partnerId")
+    assert best["referenceComment"] == "Order.orderNumber"
+    # Numbered names never match another number
+    assert "name1" not in best
+
+    misspelled = parse_schema_fields("Kundennummer;Strase;PLZ;Ort01;ORT02\n", "partners.csv")
+    best = _best(match_fields(misspelled))
+    assert best == {"street": "Strase", "pc": "PLZ", "city": "Ort01", "district": "ORT02",
+                    "referenceComment": "Kundennummer"}
+
+
+def test_xsd_and_xml_instances_are_parsed():
+    xsd = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+      <xs:complexType name="Addr"><xs:sequence>
+        <xs:element name="NAME1" type="xs:string"/><xs:element name="LAND1" type="xs:string"/>
+      </xs:sequence><xs:attribute name="KUNNR"/></xs:complexType>
+      <xs:element name="Customer"><xs:complexType><xs:sequence>
+        <xs:element name="Address" type="Addr" maxOccurs="unbounded"/>
+      </xs:sequence></xs:complexType></xs:element>
+    </xs:schema>"""
+    assert [f.path for f in parse_schema_fields(xsd, "customer.xsd")] == [
+        "Customer.Address[].NAME1", "Customer.Address[].LAND1", "Customer.Address[].@KUNNR"]
+
+    xml = "<Partner id='1'><Name>ACME</Name><Address><PostalCode>1</PostalCode></Address></Partner>"
+    assert [f.path for f in parse_schema_fields(xml, "partner.xml")] == [
+        "Partner.@id", "Partner.Name", "Partner.Address.PostalCode"]
+
+
+def test_prematch_keeps_only_objects_with_candidates():
+    text = prematch_schema(json.dumps(OPENAPI), "api.json")
+
+    assert "| pc | `Order.shipTo.zipCode`" in text
+    assert "companyName (string, Legal name)" in text
+    # The order lines contain no screening field
+    assert "quantity" not in text
+    assert prematch_schema("just some prose", "notes.txt") is None
+
+
+def test_edit_distance_limit():
+    assert edit_distance("postcode", "postalcode") == 2
+    assert edit_distance("kitten", "sitting", limit=1) == 2
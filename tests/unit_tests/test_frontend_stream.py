@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from api_mapping_agent import llm as llm_module
+from api_mapping_agent.config import Config
+from api_mapping_agent.documentation_qna_graph import nodes as qna_nodes
+from api_mapping_agent.documentation_qna_graph.graph import documentation_qna_graph
+from src.frontend import api
+
+
+class _StreamingModel(FakeListChatModel):
+    """Fake chat model that streams its answer character by character and ignores tools."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def _sdk_chunk(mode, data):
+    """A graph stream part as the LangGraph SDK delivers it ("messages-tuple" / "updates")."""
+    if mode == "messages":
+        message, metadata = data
+        return SimpleNamespace(event="messages", data=(message.model_dump(), metadata))
+    updates = {node: {**payload, "messages": [m.model_dump() for m in payload.get("messages", [])]}
+               for node, payload in (data or {}).items() if isinstance(payload, dict)}
+    return SimpleNamespace(event="updates", data=updates)
+
+
+def _events(monkeypatch, parts):
+    monkeypatch.setattr(api.client.runs, "stream", lambda **kwargs: iter(parts))
+    return list(api.run_thread_events("assistant", "thread", initial_input={}))
+
+
+def test_docs_answers_reach_the_ui_token_by_token(monkeypatch):
+    model = _StreamingModel(responses=["suppressLogging disables logging."])
+    monkeypatch.setattr(llm_module, "get_llm", lambda route=None: model)
+    monkeypatch.setattr(Config, "SEMANTIC_CACHE_ENABLED", False)
+    monkeypatch.setattr(qna_nodes, "ensure_index_built", lambda *args: None)
+    monkeypatch.setattr(qna_nodes, "index_generation", lambda *args: 0)
+    monkeypatch.setattr(qna_nodes, "rag_search", lambda query: ["excerpt"])
+
+    parts = [_sdk_chunk(mode, data) for mode, data in documentation_qna_graph.stream(
+        {"messages": [HumanMessage("What does suppressLogging do?")]},
+        stream_mode=["messages", "updates"])]
+    events = _events(monkeypatch, parts)
+
+    chunks = [data for kind, data in events if kind == "ai_chunk"]
+    assert len(chunks) > 1
+    assert "".join(chunks) == "suppressLogging disables logging."
+
+
+def _token(id_, text, metadata=None):
+    return SimpleNamespace(event="messages", data=(
+        {"type": "AIMessageChunk", "id": id_, "content": text}, metadata or {}))
+
+
+def test_escalated_answers_replace_the_rejected_one(monkeypatch):
+    replaces = {api.REPLACES_MESSAGE_KEY: "rejected"}
+    events = _events(monkeypatch, [
+        _token("intro", "Intro"), _token("rejected", "Cut o"), _token("rejected", "ff"),
+        _token("escalated", "Full ", replaces), _token("escalated", "answer", replaces)])
+
+    assert events == [("ai_chunk", "Intro"), ("ai_chunk", "\n\n"), ("ai_chunk", "Cut o"),
+                      ("ai_chunk", "ff"), ("ai_replace", "Intro"), ("ai_chunk", "\n\n"),
+                      ("ai_chunk", "Full "), ("ai_chunk", "answer")]
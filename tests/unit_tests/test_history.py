@@ -0,0 +1,65 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from api_mapping_agent import history
+
+
+def _thread(turns: int):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(f"question {i} " + "word " * 50))
+        messages.append(AIMessage(f"answer {i} " + "word " * 50))
+    return messages
+
+
+def test_short_history_is_sent_unchanged():
+    messages = _thread(2)
+    window = history.window_history(messages, {}, budget_tokens=10_000)
+    assert window.messages == messages
+    assert not window.updated and window.state_update() == {}
+
+
+def test_overflow_folds_oldest_turns_into_summary(monkeypatch):
+    calls = []
+
+    def fake_summarize(previous, folded):
+        calls.append(len(folded))
+        return f"{previous or ''}+{len(folded)}"
+
+    monkeypatch.setattr(history, "summarize_messages", fake_summarize)
+    messages = _thread(10)
+
+    window = history.window_history(messages, {}, budget_tokens=600)
+    assert window.updated and calls
+    assert window.summarized_count == calls[0]
+    assert window.messages[0].content.startswith("Summary of the earlier conversation")
+    assert window.messages[-1] is messages[-1]
+
+    # The next turn fits again without refreshing the summary
+    state = window.state_update()
+    messages.append(HumanMessage("short follow-up"))
+    again = history.window_history(messages, state, budget_tokens=600)
+    assert not again.updated and len(calls) == 1
+    assert again.messages[1:] == messages[state["history_summarized_count"]:]
+
+
+def test_latest_mapping_result_stays_pinned(monkeypatch):
+    monkeypatch.setattr(history, "summarize_messages", lambda previous, folded: "summary")
+    messages = [AIMessage("MAPPING TABLE")] + _thread(10)
+
+    window = history.window_history(messages, {}, budget_tokens=600,
+                                    mapping_result="MAPPING TABLE")
+    assert any("MAPPING TABLE" in m.content for m in window.messages)
+
+
+def test_superseded_mapping_result_is_not_pinned(monkeypatch):
+    monkeypatch.setattr(history, "summarize_messages", lambda previous, folded: "summary")
+    revised = "Field Mapping Table\n| name | NAME2 |"
+    messages = ([AIMessage("Field Mapping Table\n| name | NAME1 |")] + _thread(10)
+                + [HumanMessage("use NAME2"), AIMessage(revised)] + _thread(10))
+
+    window = history.window_history(messages, {}, budget_tokens=600, mapping_result=revised)
+
+    pinned = [m.content for m in window.messages if "Latest mapping result" in m.content]
+    assert len(pinned) == 1 and pinned[0].endswith(revised)
+    assert "keep it consistent" not in pinned[0]
+    assert not any("NAME1" in m.content for m in window.messages)
@@ -0,0 +1,92 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from api_mapping_agent import rag
+from api_mapping_agent.config import Config
+
+
+def _docs(tmp_path, count):
+    paths = []
+    for i in range(count):
+        p = tmp_path / f"doc{i:02}.md"
+        p.write_text(f"# Section {i}\n\n" + f"content of document {i}. " * 20)
+        paths.append(p)
+    return paths
+
+
+def _split_inline(paths):
+    return [rag._split_and_dedup(p, p.read_text()) for p in paths]
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    monkeypatch.setattr(Config, "INDEX_SPLIT_PROCESSES", 2)
+    monkeypatch.setattr(Config, "INDEX_PARALLEL_MIN_BYTES", 0)
+
+
+def test_files_are_split_on_spawned_processes_in_path_order(tmp_path, parallel):
+    paths = _docs(tmp_path, 5)
+
+    results = list(rag._iter_file_results(paths, lambda p, sha: True))
+
+    assert [r.path for r in results] == paths
+    assert [r.chunks for r in results] == _split_inline(paths)
+
+
+class _Pool:
+    """Process pool stand-in recording its creation; `broken` pools fail every split."""
+    created = []
+
+    def __init__(self, max_workers=None, mp_context=None, broken=False):
+        self.created.append(mp_context.get_start_method())
+        self.broken = broken
+
+    def submit(self, fn, *args):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("worker died"))
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, cancel_futures=False):
+        pass
+
+
+def test_a_single_changed_file_is_split_inline(tmp_path, parallel, monkeypatch):
+    monkeypatch.setattr(rag, "ProcessPoolExecutor", _Pool)
+    _Pool.created = []
+    paths = _docs(tmp_path, 3)
+
+    results = list(rag._iter_file_results(paths, lambda p, sha: p == paths[1]))
+
+    assert _Pool.created == []
+    assert [r.chunks is None for r in results] == [True, False, True]
+
+    list(rag._iter_file_results(paths, lambda p, sha: True))
+    assert _Pool.created == ["spawn"]
+
+
+def test_splits_of_a_broken_pool_are_redone_inline(tmp_path, parallel, monkeypatch):
+    monkeypatch.setattr(rag, "ProcessPoolExecutor", lambda **kw: _Pool(broken=True, **kw))
+    paths = _docs(tmp_path, 4)
+
+    results = list(rag._iter_file_results(paths, lambda p, sha: True))
+
+    assert [r.chunks for r in results] == _split_inline(paths)
+
+
+def test_at_most_a_window_of_files_is_read_ahead(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "INDEX_PIPELINE_WINDOW", 3)
+    paths = _docs(tmp_path, 10)
+    read = []
+    original = rag._read_file
+    monkeypatch.setattr(rag, "_read_file", lambda p: (read.append(p), original(p))[1])
+
+    results = rag._iter_file_results(paths, lambda p, sha: True)
+    for consumed, result in enumerate(results, 1):
+        assert result.path == paths[consumed - 1]
+        assert len(read) <= consumed + 3
+    assert sorted(read) == paths
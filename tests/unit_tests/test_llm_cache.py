@@ -0,0 +1,48 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from api_mapping_agent.llm import SQLiteLLMCache
+
+
+def _model(cache):
+    # Answers "first", "second", ... on consecutive provider calls
+    return FakeListChatModel(responses=["first", "second", "third"], cache=cache)
+
+
+def test_identical_messages_are_served_from_cache(tmp_path):
+    cache = SQLiteLLMCache(tmp_path / "llm.sqlite3", max_bytes=1024 * 1024)
+    model = _model(cache)
+    messages = [SystemMessage("You map APIs."), HumanMessage("Map this.")]
+
+    assert model.invoke(messages).content == "first"
+    assert model.invoke(messages).content == "first"
+    assert model.invoke(messages + [HumanMessage("And this?")]).content == "second"
+    assert cache.stats()["hits"] == 1
+
+    # The cache is persistent across processes / model instances
+    reopened = SQLiteLLMCache(tmp_path / "llm.sqlite3", max_bytes=1024 * 1024)
+    assert _model(reopened).invoke(messages).content == "first"
+
+
+def test_write_only_mode_records_without_serving(tmp_path):
+    path = tmp_path / "llm.sqlite3"
+    model = _model(SQLiteLLMCache(path, max_bytes=1024 * 1024, mode="write_only"))
+    messages = [HumanMessage("Map this.")]
+
+    assert model.invoke(messages).content == "first"
+    assert model.invoke(messages).content == "second"
+
+    reader = SQLiteLLMCache(path, max_bytes=1024 * 1024)
+    assert _model(reader).invoke(messages).content == "second"
+
+
+def test_entries_expire_and_are_evicted_by_size(tmp_path):
+    model = _model(SQLiteLLMCache(tmp_path / "llm.sqlite3", max_bytes=1024 * 1024, ttl=-1))
+    model.invoke("hi")
+    assert model.invoke("hi").content == "second"
+
+    small = SQLiteLLMCache(tmp_path / "small.sqlite3", max_bytes=1500)
+    for i in range(5):
+        _model(small).invoke(f"question {i}")
+    assert small.stats()["evictions"] > 0
+    assert small.stats()["size_bytes"] <= 1500
@@ -0,0 +1,120 @@
+import uuid
+from unittest import mock
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai.chat_models.base import BaseChatOpenAI
+from langgraph.constants import TAG_NOSTREAM
+
+from api_mapping_agent import llm as llm_module
+from api_mapping_agent.config import Config
+from api_mapping_agent.llm import REPLACES_MESSAGE_KEY, ainvoke_routed, get_llm, invoke_routed, passes_basic_check, route_stats
+
+
+@pytest.fixture(autouse=True)
+def response_cache(tmp_path, monkeypatch):
+    # Route instances bind the cache when built, so start from fresh ones on a throwaway file
+    monkeypatch.setattr(Config, "LLM_CACHE_PATH", tmp_path / "llm_cache.sqlite3")
+    monkeypatch.setattr(llm_module, "_response_cache", None)
+    monkeypatch.setattr(llm_module, "_route_llms", {})
+    monkeypatch.setattr(llm_module, "_route_metrics", {})
+
+
+def _question():
+    # Unique content keeps answers cached earlier in the test out of the way
+    return [HumanMessage(f"question {uuid.uuid4()}")]
+
+
+def _fake_generate(answers):
+    calls = []
+
+    def fake_generate(self, messages, stop=None, run_manager=None, **kwargs):
+        calls.append(self.model_name)
+        content, finish_reason = answers[self.model_name]
+        message = AIMessage(content, response_metadata={"finish_reason": finish_reason})
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": {"prompt_tokens": 10, "completion_tokens": 5}})
+
+    return calls, fake_generate
+
+
+def test_routes_use_their_configured_model():
+    assert get_llm("side_question").model_name == Config.LLM_ROUTE_MODELS["side_question"]
+    assert get_llm("mapping").model_name == Config.LLM_ROUTE_MODELS["mapping"]
+    assert get_llm("mapping") is get_llm("mapping")
+    with pytest.raises(ValueError):
+        get_llm("no_such_route")
+
+
+def test_cheap_check_rejects_empty_and_truncated_answers():
+    assert passes_basic_check(AIMessage("ok", response_metadata={"finish_reason": "stop"}))
+    assert not passes_basic_check(AIMessage("  "))
+    assert not passes_basic_check(AIMessage("cut", response_metadata={"finish_reason": "length"}))
+    assert passes_basic_check(AIMessage("", tool_calls=[{"name": "t", "args": {}, "id": "1"}]))
+
+
+def test_failed_check_escalates_and_is_recorded():
+    fast, strong = "fast-model", "strong-model"
+    calls, fake_generate = _fake_generate({fast: ("truncated", "length"), strong: ("complete", "stop")})
+
+    with mock.patch.dict(Config.LLM_ROUTE_MODELS, {"error_help": fast}), \
+            mock.patch.object(Config, "LLM_ESCALATION_MODEL", strong), \
+            mock.patch("api_mapping_agent.llm._route_llms", {}), \
+            mock.patch("api_mapping_agent.llm._route_metrics", {}), \
+            mock.patch.object(BaseChatOpenAI, "_generate", fake_generate):
+        answer = invoke_routed("error_help", _question())
+        stats = route_stats()
+
+    assert answer.content == "complete"
+    assert calls == [fast, strong]
+    assert stats["error_help"]["escalations"] == 1
+    assert stats["error_help"]["prompt_tokens"] == 10
+    assert stats["escalation"]["model"] == strong
+    assert stats["escalation"]["completion_tokens"] == 5
+
+
+
+def test_escalated_answers_are_marked_as_replacing_the_rejected_one():
+    fast, strong = "fast-model", "strong-model"
+    calls, fake_generate = _fake_generate({fast: ("truncated", "length"), strong: ("complete", "stop")})
+
+    class Runs(BaseCallbackHandler):
+        seen = []
+
+        def on_chat_model_start(self, serialized, messages, *, tags=None, metadata=None, **kwargs):
+            self.seen.append(((metadata or {}).get(REPLACES_MESSAGE_KEY), TAG_NOSTREAM in (tags or [])))
+
+    with mock.patch.dict(Config.LLM_ROUTE_MODELS, {"error_help": fast}), \
+            mock.patch.object(Config, "LLM_ESCALATION_MODEL", strong), \
+            mock.patch("api_mapping_agent.llm._route_llms", {}), \
+            mock.patch("api_mapping_agent.llm._route_metrics", {}), \
+            mock.patch.object(BaseChatOpenAI, "_generate", fake_generate):
+        invoke_routed("error_help", _question(), config={"callbacks": [Runs()], "tags": ["step"]})
+
+    # Both answers are streamed; the UI swaps the rejected one for the escalated one
+    assert calls == [fast, strong]
+    (first, first_nostream), (replaces, second_nostream) = Runs.seen
+    assert first is None and replaces is not None
+    assert not first_nostream and not second_nostream
+
+
+@pytest.mark.anyio
+async def test_routes_without_escalation_keep_the_answer():
+    calls, fake_generate = _fake_generate({Config.LLM_ROUTE_MODELS["mapping"]: ("", "stop")})
+
+    async def fake_agenerate(self, *args, **kwargs):
+        return fake_generate(self, *args, **kwargs)
+
+    with mock.patch("api_mapping_agent.llm._route_llms", {}), \
+            mock.patch("api_mapping_agent.llm._route_metrics", {}), \
+            mock.patch.object(BaseChatOpenAI, "_agenerate", fake_agenerate):
+        answer = await ainvoke_routed("mapping", _question())
+        stats = route_stats()["mapping"]
+
+    assert answer.content == ""
+    assert len(calls) == 1
+    assert stats["calls"] == 1
+    assert stats["escalations"] == 0
+    assert stats["max_latency_seconds"] > 0
@@ -0,0 +1,25 @@
+import pytest
+
+from api_mapping_agent.api_mapping_graph.prompts import (ContextBudgetExceeded, check_context_budget, get_prompt_library,
+                                                         get_static_system_prompt, prompt_budget, static_prefix_tokens,
+                                                         static_system_message)
+
+
+def test_static_prefix_is_canonical_and_request_independent():
+    prompt = get_static_system_prompt()
+    assert static_system_message().content == prompt
+    assert prompt == prompt.strip()
+    assert all(line == line.rstrip() for line in prompt.splitlines())
+    # Per-request values belong into the human message, not the shared prefix
+    assert "N/A" not in prompt
+
+
+def test_sections_are_tokenized_once_and_budget_is_checked():
+    library = get_prompt_library()
+    assert get_prompt_library() is library
+    assert all(section.tokens > 0 for section in library.values())
+    assert static_prefix_tokens() >= library["api_examples"].tokens
+
+    assert check_context_budget("test", static_prefix_tokens()) == prompt_budget() - static_prefix_tokens()
+    with pytest.raises(ContextBudgetExceeded):
+        check_context_budget("test", static_prefix_tokens(), prompt_budget())
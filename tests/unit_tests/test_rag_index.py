@@ -0,0 +1,254 @@
+import json
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from api_mapping_agent import rag
+from api_mapping_agent.config import Config
+from api_mapping_agent.vectorstores import NumpyBackend
+
+
+@pytest.fixture(autouse=True, params=["chroma", "numpy"])
+def vector_backend(request, monkeypatch):
+    monkeypatch.setattr(Config, "VECTOR_BACKEND", request.param)
+    return request.param
+
+
+@pytest.fixture(autouse=True)
+def fake_embedder(monkeypatch):
+    embedder = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(rag, "_embedder", lambda: embedder)
+    return embedder
+
+
+def _write_docs(docs: Path) -> None:
+    docs.mkdir()
+    (docs / "a.md").write_text(
+        "# Parameters\n\nsuppressLogging disables logging of the check.\n")
+    (docs / "b.md").write_text(
+        "# Addresses\n\naddressType is entity or individual.\n")
+
+
+def test_sync_index_only_embeds_changed_chunks(tmp_path):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    _write_docs(docs)
+
+    first = rag.build_index(str(docs), store)
+    assert first["added"] == 2 and first["removed"] == 0
+
+    second = rag.build_index(str(docs), store)
+    assert second["added"] == 0 and second["unchanged"] == 2
+    assert second["files_changed"] == 0
+
+    (docs / "a.md").write_text("# Parameters\n\nclientIdentCode is required.\n")
+    (docs / "b.md").unlink()
+    third = rag.build_index(str(docs), store)
+    assert third["added"] == 1
+    assert third["removed"] == 2
+    assert third["files_removed"] == 1
+
+    vs = rag.get_vectorstore(store)
+    assert vs is not None
+    assert vs.count() == 1
+
+
+def test_sync_index_skips_near_duplicates_across_files(tmp_path):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    docs.mkdir()
+    body = ("The screenAddresses endpoint checks a list of addresses against the "
+            "sanction lists and returns one match result per address. ")
+    (docs / "a-spec.md").write_text("# Screening\n\n" + body * 3)
+    (docs / "b-spec-json-only.md").write_text("# Screening\n\n" + body * 3 + "JSON only.")
+
+    first = rag.build_index(str(docs), store)
+    assert first["added"] == 1 and first["near_duplicates"] == 1
+
+    vs = rag.get_vectorstore(store)
+    got = vs.get()
+    assert got["metadatas"][0]["duplicate_sources"] == str(docs / "b-spec-json-only.md")
+
+    # Without its representative the duplicate gets indexed itself
+    (docs / "a-spec.md").unlink()
+    second = rag.build_index(str(docs), store)
+    assert second["added"] == 1 and second["removed"] == 1
+
+    vs = rag.get_vectorstore(store)
+    got = vs.get()
+    assert [m["source"] for m in got["metadatas"]] == [str(docs / "b-spec-json-only.md")]
+    assert "duplicate_sources" not in got["metadatas"][0]
+
+
+def test_near_duplicates_within_one_file_are_kept(tmp_path):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    docs.mkdir()
+    body = ("The screenAddresses endpoint checks a list of addresses against the "
+            "sanction lists and returns one match result per address. ")
+    (docs / "spec.txt").write_text(body * 6 + "Version one.\n\n" + body * 6 + "Version two.")
+
+    stats = rag.build_index(str(docs), store)
+
+    assert stats["added"] == 2 and stats["near_duplicates"] == 0
+    assert all("duplicate_sources" not in m for m in rag.get_vectorstore(store).get()["metadatas"])
+
+
+def test_rag_search_answers_identifier_lookups_lexically(tmp_path, monkeypatch):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    _write_docs(docs)
+    rag.build_index(str(docs), store)
+
+    def no_query_embedding(self, text):
+        raise AssertionError("decisive lexical match must not embed the query")
+
+    monkeypatch.setattr(DeterministicFakeEmbedding,
+                        "embed_query", no_query_embedding)
+    snippets = rag.rag_search("What does suppressLogging do?", k=1, store_dir=store)
+    assert snippets and "suppressLogging" in snippets[0]
+
+
+def test_backend_change_triggers_full_rebuild(tmp_path, monkeypatch, vector_backend):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    _write_docs(docs)
+    rag.build_index(str(docs), store)
+
+    other = "numpy" if vector_backend == "chroma" else "chroma"
+    monkeypatch.setattr(Config, "VECTOR_BACKEND", other)
+    stats = rag.build_index(str(docs), store)
+    assert stats["added"] == 2 and stats["unchanged"] == 0
+    assert rag.get_vectorstore(store).name == other
+
+
+def test_rag_search_results_are_cached_per_index_generation(tmp_path):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    _write_docs(docs)
+    rag.build_index(str(docs), store)
+
+    hits = rag.cache_stats()["rag_results"]["hits"]
+    first = rag.rag_search("how are addresses classified", k=2, store_dir=store)
+    assert rag.rag_search("how are addresses classified", k=2, store_dir=store) == first
+    assert rag.cache_stats()["rag_results"]["hits"] == hits + 1
+
+    (docs / "b.md").write_text("# Addresses\n\naddressType is always entity.\n")
+    rag.build_index(str(docs), store)
+    assert any("always entity" in s for s in
+               rag.rag_search("how are addresses classified", k=2, store_dir=store))
+
+
+def test_named_collections_are_built_and_dropped_independently(tmp_path):
+    store = tmp_path / "store"
+    (tmp_path / "one").mkdir()
+    (tmp_path / "one" / "a.md").write_text("# Parameters\n\nsuppressLogging disables logging.\n")
+    (tmp_path / "two").mkdir()
+    (tmp_path / "two" / "b.md").write_text("# Addresses\n\naddressType is entity or individual.\n")
+
+    assert rag.build_index(str(tmp_path / "one"), store, "one")["added"] == 1
+    assert rag.build_index(str(tmp_path / "two"), store, "two")["added"] == 1
+    assert rag.build_index(str(tmp_path / "one"), store, "one")["unchanged"] == 1
+    assert rag.get_vectorstore(store) is None
+
+    snippets = rag.rag_search("suppressLogging", k=2, store_dir=store, collection="two")
+    assert snippets and all("suppressLogging" not in s for s in snippets)
+
+    rag.drop_collection(store, "one")
+    assert list(rag.collections_last_used(store)) == ["two"]
+    assert rag.get_vectorstore(store, "one") is None
+    assert rag.get_vectorstore(store, "two").count() == 1
+
+
+def test_schema_files_are_indexed_per_object_with_their_path(tmp_path):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    docs.mkdir()
+    (docs / "partners.csv").write_text("Kundennummer;Strasse;PLZ\n1;Weg 1;12345\n")
+    (docs / "order.xml").write_text("<Order><Id>1</Id><ShipTo><City>B</City></ShipTo></Order>")
+
+    assert rag.build_index(str(docs), store)["added"] == 3
+
+    got = rag.get_vectorstore(store).get()
+    assert sorted(m["path"] for m in got["metadatas"]) == ["Order", "Order.ShipTo", "partners"]
+
+
+def test_multi_search_runs_queries_concurrently_and_fuses_their_hits(monkeypatch):
+    rankings = {"name": ["Name", "Partner"], "street": ["Street", "partner "], "city": ["City"]}
+    # Every query waits for the others, so a sequential fan-out would time out
+    barrier = threading.Barrier(len(rankings), timeout=5)
+
+    def search(query, k, store_dir, collection):
+        barrier.wait()
+        return rankings[query][:k]
+
+    monkeypatch.setattr(rag, "rag_search", search)
+
+    fused = rag.rag_multi_search(list(rankings), k=2, max_results=4, store_dir=Path("store"))
+
+    # Hits of several queries rank first; duplicates (up to whitespace and case) merge
+    assert fused[0] == "Partner"
+    assert sorted(fused[1:]) == ["City", "Name", "Street"]
+    assert rag.rag_multi_search([], store_dir=Path("store")) == []
+
+
+def test_schema_objects_with_the_same_fields_are_not_near_duplicates(tmp_path):
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    docs.mkdir()
+    partner = {"type": "object", "properties": {
+        f: {"type": "string"} for f in ("name", "street", "city", "postalCode", "country")}}
+    (docs / "order.json").write_text(json.dumps({"type": "object", "properties": {
+        "shipTo": partner, "billTo": partner, "soldTo": partner}}))
+    (docs / "invoice.json").write_text(json.dumps({"type": "object", "properties": {
+        "billTo": partner}}))
+
+    stats = rag.build_index(str(docs), store)
+
+    assert stats["near_duplicates"] == 0
+    assert sorted((Path(m["source"]).name, m["path"])
+                  for m in rag.get_vectorstore(store).get()["metadatas"]) == [
+        ("invoice.json", "billTo"), ("order.json", "billTo"), ("order.json", "shipTo"),
+        ("order.json", "soldTo")]
+
+
+def test_numpy_store_swaps_versions_and_rejects_torn_files(tmp_path, vector_backend):
+    if vector_backend != "numpy":
+        pytest.skip("numpy backend only")
+    docs, store = tmp_path / "docs", tmp_path / "store"
+    _write_docs(docs)
+    rag.build_index(str(docs), store)
+    (docs / "c.md").write_text("# Limits\n\nA batch holds up to 100 addresses.\n")
+    rag.build_index(str(docs), store)
+
+    # The version the pointer names and the one it replaced are kept
+    (docs / "d.md").write_text("# Timeouts\n\nRequests time out after 60 seconds.\n")
+    rag.build_index(str(docs), store)
+    versions = sorted(store.glob("v*"), key=lambda p: p.stat().st_mtime)
+    assert len(versions) == 2 and versions[-1].name == (store / "CURRENT").read_text()
+    (docs / "d.md").unlink()
+
+    # Records of another version than the vectors: opened empty, rebuilt by the next sync
+    version = store / (store / "CURRENT").read_text()
+    records = json.loads((version / "records.json").read_text())
+    (version / "records.json").write_text(json.dumps({k: v[:2] for k, v in records.items()}))
+    rag.invalidate_vectorstore(store)
+    assert rag.get_vectorstore(store) is None
+
+    assert rag.build_index(str(docs), store)["added"] == 3
+    assert rag.get_vectorstore(store).count() == 3
+
+
+def test_numpy_writers_never_share_a_version_and_readers_retry(tmp_path, fake_embedder):
+    store = tmp_path / "store"
+    first, second = NumpyBackend(store, fake_embedder), NumpyBackend(store, fake_embedder)
+    first.upsert(["a"], ["alpha"], [{}], [[1.0, 0.0]])
+    second.upsert(["b", "c"], ["beta", "gamma"], [{}, {}], [[0.0, 1.0], [1.0, 1.0]])
+    first.flush()
+    second.flush()
+
+    assert len(list(store.glob("v*"))) == 2
+    assert NumpyBackend(store, fake_embedder).get()["ids"] == ["b", "c"]
+
+    # A reader that read the pointer just before its version was removed reads it again
+    stale = store / "v0-gone"
+    current_dir = NumpyBackend._current_dir
+    answers = iter([stale])
+    with mock.patch.object(NumpyBackend, "_current_dir",
+                           lambda self: next(answers, None) or current_dir(self)):
+        assert NumpyBackend(store, fake_embedder).count() == 2
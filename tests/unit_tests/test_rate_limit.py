@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from api_mapping_agent.rate_limit import Priority, RateLimiter, Reservation, priority
+
+
+def test_token_budget_delays_the_next_request():
+    limiter = RateLimiter("test", tokens_per_minute=600)  # 10 tokens per second
+
+    assert limiter.acquire(600) < 0.05
+    start = time.monotonic()
+    limiter.acquire(3)
+    assert 0.2 < time.monotonic() - start < 1.0
+
+
+def test_unused_reservation_is_given_back():
+    limiter = RateLimiter("test", tokens_per_minute=600)
+
+    with limiter.limit(600) as reservation:
+        reservation.used(10)
+    start = time.monotonic()
+    limiter.acquire(500)
+    assert time.monotonic() - start < 0.05
+
+
+def test_interactive_requests_overtake_queued_bulk_requests():
+    limiter = RateLimiter("test", max_concurrency=1)
+    order = []
+
+    def call(level, name):
+        with priority(level):
+            with limiter.limit():
+                order.append(name)
+
+    limiter.acquire()  # occupy the only slot
+    bulk = threading.Thread(target=call, args=(Priority.BULK, "bulk"))
+    bulk.start()
+    while limiter.stats()["queue_depth"] < 1:
+        time.sleep(0.01)
+    interactive = threading.Thread(
+        target=call, args=(Priority.INTERACTIVE, "interactive"))
+    interactive.start()
+    while limiter.stats()["queue_depth"] < 2:
+        time.sleep(0.01)
+
+    limiter.release(Reservation(0))
+    bulk.join(2)
+    interactive.join(2)
+
+    assert order == ["interactive", "bulk"]
+    stats = limiter.stats()
+    assert stats["max_queue_depth"] == 2
+    assert stats["priorities"]["bulk"]["admitted"] == 1
+    assert stats["priorities"]["bulk"]["max_wait_seconds"] > 0
+
+
+def test_rate_limit_error_drains_the_buckets():
+    class RateLimitError(Exception):
+        pass
+
+    limiter = RateLimiter("test", requests_per_minute=600)
+    with pytest.raises(RateLimitError):
+        with limiter.limit():
+            raise RateLimitError()
+
+    assert limiter.stats()["throttled"] == 1
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start > 0.05
+
+
+@pytest.mark.anyio
+async def test_async_acquire_waits_without_blocking_the_loop():
+    limiter = RateLimiter("test", tokens_per_minute=600)
+
+    async with limiter.alimit(600):
+        pass
+    start = time.monotonic()
+    async with limiter.alimit(2):
+        pass
+    assert 0.1 < time.monotonic() - start < 1.0
+    assert limiter.stats()["in_flight"] == 0
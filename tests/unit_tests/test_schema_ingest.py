@@ -0,0 +1,126 @@
+import io
+import json
+import os
+from unittest import mock
+
+import pytest
+import yaml
+
+from api_mapping_agent import schema_ingest
+from api_mapping_agent.schema_ingest import build_catalog, ensure_catalog
+
+
+OPENAPI = {
+    "openapi": "3.0.0",
+    "components": {"schemas": {
+        "Order": {"type": "object", "properties": {
+            "orderNumber": {"type": "string", "description": "Order \"number\""},
+            "shipTo": {"$ref": "#/components/schemas/Partner"},
+            "lines": {"type": "array", "items": {"$ref": "#/components/schemas/Line"}},
+        }},
+        "Partner": {"type": "object", "allOf": [{"properties": {
+            "zipCode": {"type": "string"},
+            "parent": {"$ref": "#/components/schemas/Partner"},
+        }}]},
+        "Line": {"type": "object", "properties": {"sku": {"type": "string"}}},
+    }},
+}
+
+
+def _paths(catalog):
+    return [f.path for f in catalog.fields]
+
+
+def test_json_and_yaml_schemas_stream_into_the_same_catalog(tmp_path, monkeypatch):
+    # Small read chunks make tokens straddle chunk boundaries
+    monkeypatch.setattr(schema_ingest, "_READ_CHUNK", 7)
+    (tmp_path / "api.json").write_text(json.dumps(OPENAPI))
+    (tmp_path / "api.yaml").write_text(yaml.safe_dump(OPENAPI))
+
+    from_json = build_catalog(tmp_path / "api.json")
+    from_yaml = build_catalog(tmp_path / "api.yaml")
+
+    assert from_json.format == "json schema"
+    assert "Order.shipTo.zipCode" in _paths(from_json)
+    assert "Order.lines[].sku" in _paths(from_json)
+    assert not any("parent.parent" in p for p in _paths(from_json))
+    assert sorted(_paths(from_json)) == sorted(_paths(from_yaml))
+    order_number = next(f for f in from_json.fields if f.path == "Order.orderNumber")
+    assert order_number.description == 'Order "number"'
+
+
+def test_numbers_split_across_read_chunks_are_tokenized_whole(monkeypatch):
+    document = '{"a": [1.25e+3, -0.5, 12.75, 3E-2, 7], "b": {"c": 0.001, "d": null, "e": 4e10}}'
+    expected = list(schema_ingest._json_tokens(io.StringIO(document)))
+
+    for chunk_size in range(1, len(document) + 1):
+        monkeypatch.setattr(schema_ingest, "_READ_CHUNK", chunk_size)
+        assert list(schema_ingest._json_tokens(io.StringIO(document))) == expected, chunk_size
+    assert ("number", "1.25e+3") in expected and ("number", "3E-2") in expected
+
+
+def test_example_documents_list_their_leaf_paths(tmp_path):
+    (tmp_path / "partners.json").write_text(json.dumps(
+        {"partners": [{"name": "A", "address": {"zip": "1"}}, {"name": "B", "active": True}]}))
+
+    catalog = build_catalog(tmp_path / "partners.json")
+
+    assert [tuple(f[:3]) for f in catalog.fields] == [
+        ("partners[].name", "name", "string"),
+        ("partners[].address.zip", "zip", "string"),
+        ("partners[].active", "active", "boolean")]
+
+
+def test_xsd_xml_and_csv(tmp_path):
+    (tmp_path / "customer.xsd").write_text("""<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+      <xs:complexType name="Addr"><xs:sequence>
+        <xs:element name="NAME1" type="xs:string">
+          <xs:annotation><xs:documentation>Name of the customer</xs:documentation></xs:annotation>
+        </xs:element>
+      </xs:sequence><xs:attribute name="KUNNR"/></xs:complexType>
+      <xs:element name="Customer"><xs:complexType><xs:sequence>
+        <xs:element name="Address" type="Addr" maxOccurs="unbounded"/>
+      </xs:sequence></xs:complexType></xs:element>
+    </xs:schema>""")
+    (tmp_path / "partner.xml").write_text(
+        "<Partner id='1'><Name>A</Name><Address><PLZ>1</PLZ></Address><Name>B</Name></Partner>")
+    (tmp_path / "partners.csv").write_text("Kundennummer;Strasse;PLZ\n1;Weg 1;12345\n")
+
+    xsd = build_catalog(tmp_path / "customer.xsd")
+    assert [tuple(f) for f in xsd.fields] == [
+        ("Customer.Address[].NAME1", "NAME1", "string", "Name of the customer"),
+        ("Customer.Address[].@KUNNR", "KUNNR", "", "")]
+    assert _paths(build_catalog(tmp_path / "partner.xml")) == [
+        "Partner.@id", "Partner.Name", "Partner.Address.PLZ"]
+    assert _paths(build_catalog(tmp_path / "partners.csv")) == ["Kundennummer", "Strasse", "PLZ"]
+
+
+def test_catalog_is_stored_and_rebuilt_when_the_file_changes(tmp_path):
+    data_file = tmp_path / "partners.csv"
+    data_file.write_text("Name;City\n")
+    assert _paths(ensure_catalog(data_file)) == ["Name", "City"]
+
+    with mock.patch.object(schema_ingest, "build_catalog", side_effect=AssertionError):
+        assert _paths(ensure_catalog(data_file)) == ["Name", "City"]
+
+    data_file.write_text("Name;Town\n")
+    catalog_file = schema_ingest.catalog_path(data_file)
+    stat = catalog_file.stat()
+    os.utime(catalog_file, (stat.st_atime, stat.st_mtime - 10))
+    assert _paths(ensure_catalog(data_file)) == ["Name", "Town"]
+
+
+
+def test_malformed_files_raise_a_parse_error_and_are_shown_raw(tmp_path):
+    from api_mapping_agent.api_mapping_graph import nodes
+
+    files = {"broken.json": '{"a": [1, @]}', "broken.xml": "<a><b></a>",
+             "broken.yaml": "a: [1, 2\nb: {", "extra.json": '{"a": 1}}', "bare.json": "}",
+             "mismatched.json": '{"a": [1}', "truncated.json": "[1, 2"}
+    for name, content in files.items():
+        (tmp_path / name).write_text(content)
+        with pytest.raises(schema_ingest.SchemaParseError):
+            ensure_catalog(tmp_path / name)
+
+    content = nodes._catalog_content(tmp_path / "broken.xml", max_tokens=1000)
+    assert "could not be parsed" in content and "<a><b></a>" in content
@@ -0,0 +1,73 @@
+import json
+
+from api_mapping_agent.schema_splitters import chunk_path, split_schema
+
+
+OPENAPI = {
+    "openapi": "3.0.0",
+    "components": {"schemas": {
+        "Order": {"type": "object", "properties": {
+            "orderNumber": {"type": "string"},
+            "shipTo": {"$ref": "#/components/schemas/Partner"},
+            "billTo": {"$ref": "#/components/schemas/Partner"},
+        }},
+        "Partner": {"type": "object", "properties": {
+            "companyName": {"type": "string", "description": "Legal name"},
+            "zipCode": {"type": "string"},
+        }},
+    }},
+}
+
+
+def _by_path(chunks):
+    return {chunk_path(c): c for c in chunks}
+
+
+def test_named_types_are_chunked_once_with_their_uses():
+    chunks = _by_path(split_schema(json.dumps(OPENAPI), "api.json"))
+
+    assert set(chunks) == {"Order", "Partner"}
+    assert chunks["Partner"].splitlines() == [
+        "path: Partner",
+        "used at: Order.billTo, Order.shipTo",
+        "- companyName (string, Legal name)",
+        "- zipCode (string)"]
+    assert "- shipTo -> Partner" in chunks["Order"]
+
+
+def test_xsd_xml_and_csv_chunks():
+    xsd = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+      <xs:complexType name="Addr"><xs:sequence>
+        <xs:element name="NAME1" type="xs:string"/>
+      </xs:sequence></xs:complexType>
+      <xs:element name="Customer"><xs:complexType><xs:sequence>
+        <xs:element name="Address" type="Addr" maxOccurs="unbounded"/>
+      </xs:sequence></xs:complexType></xs:element>
+    </xs:schema>"""
+    chunks = _by_path(split_schema(xsd, "customer.xsd"))
+    assert "used at: Customer.Address[]" in chunks["Addr"]
+    assert "- Address[] -> Addr" in chunks["Customer"]
+
+    xml = "<Partner id='1'><Name>A</Name><Address><PLZ>1</PLZ></Address></Partner>"
+    assert set(_by_path(split_schema(xml, "partner.xml"))) == {"Partner", "Partner.Address"}
+
+    [csv_chunk] = split_schema("Kundennummer;Strasse;PLZ\n1;Weg 1;12345\n", "partners.csv")
+    assert csv_chunk.splitlines()[:3] == ["path: partners", "record type: CSV columns",
+                                          "- Kundennummer (column)"]
+
+
+def test_large_objects_are_split_into_parts_with_the_header():
+    schema = {"type": "object", "properties": {
+        f"field{i}": {"type": "string", "description": "x" * 100} for i in range(40)}}
+    chunks = split_schema(json.dumps(schema), "big.json")
+
+    assert len(chunks) > 1
+    assert all(len(c) <= 1500 for c in chunks)
+    assert all(chunk_path(c) == "big" for c in chunks)
+    assert chunks[0].splitlines()[1] == f"part 1 of {len(chunks)}"
+    assert sum(c.count("\n- ") for c in chunks) == 40
+
+
+def test_documents_without_fields_are_left_to_the_text_splitters():
+    assert split_schema("just some prose", "notes.yaml") == []
+    assert chunk_path("# Heading\n\ntext") is None
@@ -0,0 +1,26 @@
+from api_mapping_agent.semantic_cache import SemanticCache
+
+
+def test_similar_question_hits_within_generation():
+    cache = SemanticCache(threshold=0.95, maxsize=10)
+    cache.store([1.0, 0.0, 0.0], generation=1, value="answer")
+
+    assert cache.lookup([0.99, 0.05, 0.0], generation=1) == "answer"
+    assert cache.lookup([0.0, 1.0, 0.0], generation=1) is None
+    # A rebuilt knowledge base must not serve old answers
+    assert cache.lookup([1.0, 0.0, 0.0], generation=2) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(threshold=0.95, maxsize=2)
+    cache.store([1.0, 0.0], 0, "a")
+    cache.store([0.0, 1.0], 0, "b")
+    assert cache.lookup([1.0, 0.0], 0) == "a"
+    cache.store([1.0, 1.0], 0, "c")
+
+    assert cache.lookup([0.0, 1.0], 0) is None
+    assert cache.lookup([1.0, 0.0], 0) == "a"
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai.chat_models.base import BaseChatOpenAI
+
+from api_mapping_agent.llm import create_custom_llm
+from api_mapping_agent.singleflight import SingleFlight, get_single_flight
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: flight.do("key", slow), range(4)))
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 4, "executed": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight("test")
+
+    def failing():
+        time.sleep(0.1)
+        raise ValueError("upstream failed")
+
+    def call(_):
+        try:
+            flight.do("key", failing)
+        except ValueError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(3) as pool:
+        assert list(pool.map(call, range(3))) == ["upstream failed"] * 3
+    # Nothing stays registered, the next call runs again
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_late_stream_consumer_replays_earlier_chunks():
+    flight = SingleFlight("test")
+    started = threading.Event()
+
+    def upstream():
+        for i in range(5):
+            yield i
+            started.set()
+            time.sleep(0.05)
+
+    first = flight.stream("key", upstream)
+    started.wait(1)
+    second = flight.stream("key", lambda: iter(["not used"]))
+
+    assert list(second) == [0, 1, 2, 3, 4]
+    assert list(first) == [0, 1, 2, 3, 4]
+    assert flight.stats()["coalesced"] == 1
+
+
+@pytest.mark.anyio
+async def test_async_calls_and_streams_are_coalesced():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 42
+
+    assert await asyncio.gather(*(flight.ado("key", slow) for _ in range(3))) == [42] * 3
+    assert len(calls) == 1
+
+    async def upstream():
+        calls.append(1)
+        for i in range(3):
+            await asyncio.sleep(0.02)
+            yield i
+
+    async def consume():
+        return [c async for c in flight.astream("stream", upstream)]
+
+    assert await asyncio.gather(consume(), consume()) == [[0, 1, 2], [0, 1, 2]]
+    assert len(calls) == 2
+
+
+def test_chat_model_coalesces_identical_requests():
+    calls = []
+
+    def fake_generate(self, messages, stop=None, run_manager=None, **kwargs):
+        calls.append(messages)
+        time.sleep(0.2)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("shared"))])
+
+    llm = create_custom_llm(temperature=0.7)  # uncached
+    before = get_single_flight("chat").stats()["coalesced"]
+    with mock.patch.object(BaseChatOpenAI, "_generate", fake_generate):
+        with ThreadPoolExecutor(3) as pool:
+            answers = list(pool.map(lambda _: llm.invoke(
+                [HumanMessage("same question")]), range(3)))
+
+    assert len(calls) == 1
+    assert [a.content for a in answers] == ["shared"] * 3
+    # Every caller gets its own message with its own run id
+    assert len({a.id for a in answers}) == 3
+    assert get_single_flight("chat").stats()["coalesced"] - before == 2
+
+
+def test_chat_model_shares_streams():
+    calls = []
+
+    def fake_stream(self, messages, stop=None, run_manager=None, **kwargs):
+        calls.append(messages)
+        for token in ["to", "ken", "s"]:
+            time.sleep(0.05)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    llm = create_custom_llm(temperature=0.7)
+    with mock.patch.object(BaseChatOpenAI, "_stream", fake_stream):
+        with ThreadPoolExecutor(2) as pool:
+            streams = list(pool.map(lambda _: [c.content for c in llm.stream(
+                [HumanMessage("stream me")])], range(2)))
+
+    assert streams == [["to", "ken", "s"]] * 2
+    assert len(calls) == 1
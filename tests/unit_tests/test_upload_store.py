@@ -0,0 +1,105 @@
+import os
+import time
+from unittest import mock
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from api_mapping_agent import rag, upload_store
+from api_mapping_agent.config import Config
+
+
+@pytest.fixture
+def store(tmp_path):
+    with mock.patch.object(Config, "API_DATA_DIR", tmp_path / "api_data"), \
+            mock.patch.object(Config, "API_DATA_VECTOR_STORE", tmp_path / "vectorstores"), \
+            mock.patch.object(Config, "API_UPLOAD_DIR", tmp_path / "uploads"), \
+            mock.patch.object(Config, "API_DATA_TTL", 0):
+        yield tmp_path
+
+
+def test_same_name_different_content_is_kept_apart(store):
+    first = upload_store.store_text('{"a": 1}', "schema.json", "thread-1")
+    second = upload_store.store_text('{"b": 2}', "schema.json", "thread-2")
+    again = upload_store.store_text('{"a": 1}', "other.json", "thread-3")
+
+    assert first != second
+    assert again == first
+    assert (Config.API_DATA_DIR / first).read_text() == '{"a": 1}'
+    assert upload_store.content_hash(first) == first.split("/")[1]
+    assert upload_store.content_hash("schema.json") is None
+    assert upload_store.index_collection(Config.API_DATA_DIR / first) == \
+        "api-" + upload_store.content_hash(first)[:32]
+    assert upload_store.safe_filename("../../etc/passwd") == "passwd"
+
+
+def test_uploads_must_stay_inside_the_upload_directory(store):
+    (Config.API_UPLOAD_DIR / "abc").mkdir(parents=True)
+    upload = Config.API_UPLOAD_DIR / "abc" / "api.json"
+    upload.write_text("{}")
+    outside = store / "secret.txt"
+    outside.write_text("x")
+
+    with pytest.raises(ValueError):
+        upload_store.resolve_upload(str(outside))
+    with pytest.raises(ValueError):
+        upload_store.resolve_upload(str(Config.API_UPLOAD_DIR / "abc" / ".." / ".." / "secret.txt"))
+    with pytest.raises(ValueError):
+        upload_store.resolve_upload(str(Config.API_UPLOAD_DIR / "missing.json"))
+    with mock.patch.object(Config, "API_UPLOAD_MAX_MB", 0):
+        with pytest.raises(ValueError):
+            upload_store.resolve_upload(str(upload))
+
+    api_file_path = upload_store.store_upload(str(upload), "thread-1")
+
+    assert api_file_path == upload_store.store_text("{}", "api.json", "thread-2")
+    assert (Config.API_DATA_DIR / api_file_path).read_text() == "{}"
+    assert not (Config.API_UPLOAD_DIR / "abc").exists()
+
+
+def test_legacy_files_are_adopted_into_the_store(store):
+    Config.API_DATA_DIR.mkdir()
+    legacy = Config.API_DATA_DIR / "schema.json"
+    legacy.write_text("{}")
+
+    adopted = upload_store.as_object(legacy)
+
+    assert upload_store.content_hash(adopted.relative_to(Config.API_DATA_DIR).as_posix())
+    assert upload_store.as_object(adopted) == adopted
+    assert legacy.exists()
+
+
+def _index(api_file_path):
+    api_object = Config.API_DATA_DIR / api_file_path
+    collection = upload_store.index_collection(api_object)
+    rag.build_index(str(api_object.parent), Config.API_DATA_VECTOR_STORE, collection)
+    return collection
+
+
+def test_janitor_keeps_referenced_objects(store, monkeypatch):
+    monkeypatch.setattr(Config, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(rag, "_embedder", lambda: DeterministicFakeEmbedding(size=8))
+    kept = upload_store.store_text('{"kept": 1}', "a.json", "active")
+    dropped = upload_store.store_text('{"dropped": 1}', "b.json", "idle")
+    kept_collection, dropped_collection = _index(kept), _index(dropped)
+
+    # Age everything of the idle thread past the TTL
+    old = time.time() - 3600
+    for path in (Config.API_DATA_DIR / "threads" / "idle" / upload_store.content_hash(dropped),
+                 (Config.API_DATA_DIR / dropped).parent):
+        os.utime(path, (old, old))
+
+    stats = upload_store.evict_expired(max_age=60, index_max_age=0)
+
+    assert stats == {"references": 1, "objects": 1, "collections": 1}
+    assert (Config.API_DATA_DIR / kept).exists()
+    assert not (Config.API_DATA_DIR / dropped).exists()
+    assert list(rag.collections_last_used(Config.API_DATA_VECTOR_STORE)) == [kept_collection]
+    assert not (Config.API_DATA_DIR / "threads" / "idle").exists()
+
+    # Unused collections expire before their upload and are rebuilt on demand
+    stats = upload_store.evict_expired(max_age=3600, now=time.time() + 120, index_max_age=60)
+    assert stats["collections"] == 1 and stats["objects"] == 0
+    assert (Config.API_DATA_DIR / kept).exists()
+    assert rag.get_vectorstore(Config.API_DATA_VECTOR_STORE, kept_collection) is None
+    assert dropped_collection not in rag.collections_last_used(Config.API_DATA_VECTOR_STORE)